@@ -1,25 +1,64 @@
 """公募ナビAI - 既存案件の詳細バックフィル（並列版）
 
-detail_fetched_at=NULL の案件を並列でHTTPフェッチ→Gemini抽出→DB保存する。
+detail_fetched_at=NULL の案件を HTTPフェッチ → Gemini抽出 → DB保存 の
+3ステージのパイプライン（pipeline.py）で処理する。ステージごとに並列数を
+指定でき、取得は多め・Gemini は quota に合わせて絞る、といった調整ができる。
 壊れたURL(p-portal等)は自動スキップ。
 
 Usage:
-    python backfill_details.py [--limit 50000] [--workers 15] [--batch 500]
+    python backfill_details.py [--limit 50000] [--fetch-workers 30] [--workers 15]
+        [--write-workers 4] [--batch 500] [--http-cache] [--resume]
+
+--http-cache を付けると取得済みページをローカルにキャッシュし、
+中断後の再実行で同じページを再ダウンロードしない。
+
+各バッチの本処理の前に HEAD で死活チェックし（--probe-workers 並列）、
+404/410 やトップへの転送は detail_status に記録して以降の対象から外す。
+--no-probe で無効化できる。
+
+--batch-api を付けると、取得したページの抽出を DB バッチごとに Gemini Batch API の
+1ジョブとして投入する（単価が安く、オンラインの quota を消費しない）。ジョブの完了は
+待たずに次の DB バッチの取得へ進み、最大 --batch-api-jobs 本を同時に走らせる。
+失敗・期限切れで終わったジョブの案件は抽出失敗として記録し、残りの処理は続ける。
+
+Gemini の quota が切れて抽出できなかった案件は gemini_deferred に積んでバッチの区切りで
+中断し、次回の実行の最初に流す（deferred_queue.py）。
+
+処理した案件IDと結果・取得位置はチェックポイント（batch/.cache/backfill_checkpoint.db）
+に記録する。中断後は --resume で続きから再開できる（記録済みの案件は飛ばす）。
 """
 
 import argparse
 import logging
-import sys
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
 
 # dotenv を db/config より先にロード
 from dotenv import load_dotenv
 load_dotenv()
 
+import config
 import db
-from detail_scraper import enrich_opportunity
+import deferred_queue
+import gemini_client
+from checkpoint import Checkpoint
+import negative_cache
+import scraper
+from detail_scraper import (
+    extract_details_batch,
+    extract_details_packed,
+    failed_urls,
+    fetch_detail_text,
+    get_memo,
+)
+from gemini_batch import BatchJobError
+from pipeline import Pipeline, Stage
+from usage import get_tracker
+from url_prober import ALIVE, DEAD, ERROR, REDIRECTED, probe_urls
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,7 +68,13 @@ logger = logging.getLogger(__name__)
 
 # 統計用（スレッドセーフ）
 _lock = threading.Lock()
-_stats = {"success": 0, "fail_fetch": 0, "fail_gemini": 0, "fail_db": 0, "skipped": 0}
+_stats = {
+    "success": 0, "fail_fetch": 0, "fail_gemini": 0, "fail_db": 0, "skipped": 0, "deferred": 0,
+    "probe_dead": 0, "probe_redirected": 0, "probe_error": 0,
+}
+
+# 処理結果の記録先（main で初期化）
+_checkpoint: Checkpoint | None = None
 
 # 壊れたURLパターン
 BAD_URL_PATTERNS = ["/pps-web-biz/UAA01/OAA0101", "/all.html"]
@@ -39,82 +84,274 @@ def _is_bad_url(url: str) -> bool:
     return any(p in url for p in BAD_URL_PATTERNS)
 
 
-def process_one(opp: dict) -> bool:
-    """1件を処理: フェッチ→Gemini抽出→DB保存"""
-    opp_id = opp["id"]
-    detail_url = opp.get("detail_url", "")
+def _count(key: str, opp_id: str):
+    """統計を加算し、案件の結果をチェックポイントに記録する。"""
+    with _lock:
+        _stats[key] += 1
+    if _checkpoint is not None:
+        _checkpoint.record(opp_id, key)
 
+
+def _format_eta(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    return f"{minutes // 60}時間{minutes % 60:02d}分"
+
+
+def fetch_stage(opp: dict) -> tuple[dict, str] | None:
+    """ステージ1: 詳細ページを取得してテキスト化する。"""
+    detail_url = opp.get("detail_url") or ""
     if not detail_url or _is_bad_url(detail_url):
-        with _lock:
-            _stats["skipped"] += 1
-        return False
+        _count("skipped", opp["id"])
+        return None
+
+    text = fetch_detail_text(opp)
+    if text is None:
+        _count("fail_fetch", opp["id"])
+        return None
+    return opp, text
+
+
+def extract_stage(pages: list[tuple[dict, str]]) -> list[tuple[dict, dict]]:
+    """ステージ2: 複数ページをまとめて Gemini で抽出する。"""
+    return _pair_results(pages, extract_details_packed(pages))
+
 
+def _pair_results(
+    pages: list[tuple[dict, str]], extracted: dict[str, dict],
+) -> list[tuple[dict, dict]]:
+    """抽出結果を案件と組にし、抽出できなかった案件は失敗として記録する。
+
+    Gemini の quota 切れ（ブレーカーが開いている）で抽出できなかった案件は
+    失敗にせず deferred_queue に積む。
+    """
+    results, deferred = [], []
+    blocked = gemini_client.quota_blocked("detail_pack")
+    for opp, _ in pages:
+        details = extracted.get(opp["id"])
+        if details:
+            results.append((opp, details))
+        elif blocked:
+            deferred.append(opp["id"])
+            _count("deferred", opp["id"])
+        else:
+            failed_urls.add(opp["detail_url"], negative_cache.EXTRACT_FAILED, opp["id"])
+            _count("fail_gemini", opp["id"])
+    deferred_queue.defer(deferred_queue.DETAIL, deferred)
+    return results
+
+
+def batch_extract(pages: list[tuple[dict, str]]) -> list[tuple[dict, dict]]:
+    """Batch API モードの抽出: DB バッチ分のページを1ジョブで抽出し、案件と組にする。
+
+    ジョブが失敗・期限切れ・中止で終わった（または投入できなかった）ときは、
+    そのジョブの案件だけを抽出失敗として記録し、例外は外に出さない。
+    """
     try:
-        details = enrich_opportunity(opp)
-    except Exception:
-        with _lock:
-            _stats["fail_gemini"] += 1
-        return False
+        extracted = extract_details_batch(pages)
+    except (BatchJobError, requests.RequestException) as exc:
+        logger.warning("Batch API ジョブ失敗（%d件を抽出失敗として記録）: %s", len(pages), exc)
+        extracted = {}
+    return _pair_results(pages, extracted)
 
-    if not details:
-        with _lock:
-            _stats["fail_fetch"] += 1
-        return False
 
+def write_stage(item: tuple[dict, dict]) -> None:
+    """ステージ3: 抽出結果を DB に保存する。"""
+    opp, details = item
     try:
-        db.update_opportunity_details(opp_id, details)
-        with _lock:
-            _stats["success"] += 1
-        return True
+        db.update_opportunity_details(opp["id"], details)
     except Exception as exc:
-        logger.debug("DB更新失敗 %s: %s", opp_id, exc)
-        with _lock:
-            _stats["fail_db"] += 1
-        return False
+        logger.debug("DB更新失敗 %s: %s", opp["id"], exc)
+        _count("fail_db", opp["id"])
+        return
+    _count("success", opp["id"])
+
+
+def _write_finished_jobs(
+    in_flight: list[tuple[Future, tuple[str, str]]], writer: Pipeline, max_jobs: int,
+) -> None:
+    """投入順に、終わったジョブの抽出結果を保存してカーソルを進める。
+
+    走っているジョブが max_jobs 本以上なら、古いものから終わるまで待つ（0 で全部待つ）。
+    カーソルは前のジョブがすべて保存されてから進めるので、中断しても未保存の案件を飛ばさない。
+    """
+    while in_flight and (in_flight[0][0].done() or len(in_flight) >= max_jobs):
+        job, cursor = in_flight.pop(0)
+        writer.run(job.result())
+        _checkpoint.set_cursor(*cursor)
+
+
+def probe_batch(opps: list[dict], concurrency: int) -> list[dict]:
+    """バッチ全体を死活チェックし、dead/redirected を DB に記録して除外する。
+
+    タイムアウト等で判定できなかった案件は本処理に回す。
+    """
+    targets = [o for o in opps if o.get("detail_url") and not _is_bad_url(o["detail_url"])]
+    results = probe_urls([o["detail_url"] for o in targets], concurrency=concurrency)
+
+    remaining = []
+    gone: dict[str, list[str]] = {DEAD: [], REDIRECTED: []}
+    for opp in opps:
+        result = results.get(opp.get("detail_url"))
+        if result is None or result.status in (ALIVE, ERROR):
+            remaining.append(opp)
+            if result is not None and result.status == ERROR:
+                _stats["probe_error"] += 1
+        else:
+            gone[result.status].append(opp["id"])
+
+    for status, ids in gone.items():
+        if not ids:
+            continue
+        _stats[f"probe_{status}"] += len(ids)
+        try:
+            db.mark_detail_status(ids, status)
+        except Exception as exc:
+            logger.warning("死活結果の保存失敗 (%s, %d件): %s", status, len(ids), exc)
+        if _checkpoint is not None:
+            for opp_id in ids:
+                _checkpoint.record(opp_id, f"probe_{status}")
+
+    logger.info(
+        "  死活チェック: %d件 → 生存/保留=%d, dead=%d, redirected=%d",
+        len(opps), len(remaining), len(gone[DEAD]), len(gone[REDIRECTED]),
+    )
+    return remaining
 
 
 def main():
     parser = argparse.ArgumentParser(description="詳細ページバックフィル（並列版）")
     parser.add_argument("--limit", type=int, default=50000, help="処理件数上限")
-    parser.add_argument("--workers", type=int, default=15, help="並列ワーカー数")
+    parser.add_argument("--fetch-workers", type=int, default=30, help="ページ取得の並列数")
+    parser.add_argument("--workers", type=int, default=15, help="Gemini抽出の並列数")
+    parser.add_argument("--write-workers", type=int, default=4, help="DB保存の並列数")
+    parser.add_argument("--queue-size", type=int, default=200, help="ステージ間キューの上限")
+    parser.add_argument(
+        "--pack", type=int, default=config.DETAIL_PACK_MAX_PAGES,
+        help="Gemini 1回にまとめる最大ページ数（1でまとめない）",
+    )
     parser.add_argument("--batch", type=int, default=1000, help="DB取得バッチサイズ")
+    parser.add_argument("--probe-workers", type=int, default=100, help="死活チェックの並列数")
+    parser.add_argument("--no-probe", action="store_true", help="事前の死活チェックを行わない")
+    parser.add_argument("--http-cache", action="store_true", help="取得ページをディスクキャッシュする")
+    parser.add_argument(
+        "--http-cache-ttl", type=int, default=config.HTTP_CACHE_TTL,
+        help="キャッシュの既定保存期間（秒）",
+    )
+    parser.add_argument("--resume", action="store_true", help="前回のチェックポイントから再開する")
+    parser.add_argument(
+        "--batch-api", action="store_true",
+        help="抽出を Gemini Batch API で行う（DBバッチごとに1ジョブ）",
+    )
+    parser.add_argument(
+        "--batch-api-jobs", type=int, default=config.GEMINI_BATCH_MAX_JOBS,
+        help="同時に走らせる Batch API ジョブの上限",
+    )
     args = parser.parse_args()
 
-    logger.info("=== バックフィル開始 (limit=%d, workers=%d) ===", args.limit, args.workers)
+    if args.http_cache:
+        scraper.enable_cache(ttl=args.http_cache_ttl)
+
+    global _checkpoint
+    _checkpoint = Checkpoint()
+    if args.resume:
+        attempted = _checkpoint.attempted_ids()
+        cursor = _checkpoint.cursor()
+        logger.info("チェックポイントから再開: 処理済み %d件 %s", len(attempted), _checkpoint.outcome_counts())
+    else:
+        _checkpoint.reset()
+        attempted, cursor = set(), None
+
+    logger.info(
+        "=== バックフィル開始 (limit=%d, fetch=%d, gemini=%d, write=%d) ===",
+        args.limit, args.fetch_workers, args.workers, args.write_workers,
+    )
+    try:
+        remaining = db.count_unenriched_opportunities(after=cursor)
+        target = min(args.limit, remaining)
+        logger.info("対象案件: 残り %d件", remaining)
+    except Exception as exc:
+        logger.warning("対象件数の取得失敗（ETAは上限件数で計算）: %s", exc)
+        target = args.limit
+
+    try:
+        log_id = db.create_batch_log("backfill")
+    except Exception as exc:
+        logger.warning("バッチログ作成失敗（処理は継続）: %s", exc)
+        log_id = None
+
+    # 前回 quota 切れで後回しにした案件を先に流す
+    deferred_queue.drain((deferred_queue.DETAIL,))
+
     start_time = time.time()
     total_processed = 0
+    batch_num = 0
+
+    if args.batch_api:
+        # 取得だけをパイプラインで流し、抽出は DB バッチ単位で Batch API に投入する
+        pages: list[tuple[dict, str]] = []
+        pipeline = Pipeline([
+            Stage("fetch", fetch_stage, workers=args.fetch_workers, queue_size=args.queue_size),
+            Stage("collect", pages.append, queue_size=args.queue_size),
+        ])
+        writer = Pipeline([
+            Stage("write", write_stage, workers=args.write_workers, queue_size=args.queue_size),
+        ])
+        # ジョブの完了待ち（最長 GEMINI_BATCH_TIMEOUT）は別スレッドで重ね、取得を止めない
+        jobs = ThreadPoolExecutor(max_workers=max(1, args.batch_api_jobs))
+        in_flight: list[tuple[Future, tuple[str, str]]] = []  # (ジョブ, そのバッチ末尾のカーソル)
+    else:
+        pipeline = Pipeline([
+            Stage("fetch", fetch_stage, workers=args.fetch_workers, queue_size=args.queue_size),
+            Stage("extract", extract_stage, workers=args.workers, queue_size=args.queue_size,
+                  batch_size=max(1, args.pack)),
+            Stage("write", write_stage, workers=args.write_workers, queue_size=args.queue_size),
+        ])
 
     while total_processed < args.limit:
         fetch_size = min(args.batch, args.limit - total_processed)
-        opps = db.get_unenriched_opportunities(limit=fetch_size)
+        # カーソルで前進するので、失敗して detail_fetched_at が NULL のままの案件も再取得しない
+        opps = db.get_unenriched_opportunities(limit=fetch_size, after=cursor)
         if not opps:
             logger.info("対象案件なし。全件処理済みです。")
             break
+        last = opps[-1]
+        cursor = (last["scraped_at"], last["id"])
 
-        batch_num = total_processed // args.batch + 1
+        batch_num += 1
+        opps = [o for o in opps if o["id"] not in attempted]
         logger.info("バッチ %d: %d件取得 (累計 %d件)", batch_num, len(opps), total_processed)
+        fetched_count = len(opps)
 
-        with ThreadPoolExecutor(max_workers=args.workers) as executor:
-            futures = {executor.submit(process_one, opp): opp for opp in opps}
-            done_count = 0
-            for future in as_completed(futures):
-                done_count += 1
-                if done_count % 50 == 0:
-                    elapsed = time.time() - start_time
-                    with _lock:
-                        s = _stats.copy()
-                    rate = (s["success"] + s["fail_fetch"] + s["fail_gemini"]) / max(elapsed, 1) * 60
-                    logger.info(
-                        "  進捗 %d/%d | 成功=%d, フェッチ失敗=%d, Gemini失敗=%d, スキップ=%d | %.0f件/分",
-                        total_processed + done_count, args.limit,
-                        s["success"], s["fail_fetch"], s["fail_gemini"], s["skipped"], rate,
-                    )
-                try:
-                    future.result()
-                except Exception as exc:
-                    logger.debug("ワーカーエラー: %s", exc)
-
-        total_processed += len(opps)
+        if opps and not args.no_probe:
+            opps = probe_batch(opps, args.probe_workers)
+
+        pipeline.run(opps)
+        if args.batch_api:
+            in_flight.append((jobs.submit(batch_extract, pages[:]), cursor))
+            pages.clear()
+            _write_finished_jobs(in_flight, writer, max(1, args.batch_api_jobs))
+        else:
+            _checkpoint.set_cursor(*cursor)
+        total_processed += fetched_count
+        if not args.batch_api and gemini_client.quota_blocked("detail_pack"):
+            logger.warning("Gemini の quota が切れたためバックフィルを中断（残りは次回）")
+            break
+
+        elapsed = time.time() - start_time
+        with _lock:
+            s = _stats.copy()
+        rate = total_processed / max(elapsed, 1)
+        eta = (target - total_processed) / rate if rate else 0
+        logger.info(
+            "  進捗 %d/%d | 成功=%d, フェッチ失敗=%d, Gemini失敗=%d, スキップ=%d | %.0f件/分, 残り約%s",
+            total_processed, target,
+            s["success"], s["fail_fetch"], s["fail_gemini"], s["skipped"],
+            rate * 60, _format_eta(max(eta, 0)),
+        )
+
+    if args.batch_api:
+        _write_finished_jobs(in_flight, writer, 0)
+        jobs.shutdown()
 
     elapsed = time.time() - start_time
     logger.info(
@@ -123,12 +360,62 @@ def main():
         "  フェッチ失敗: %d\n"
         "  Gemini失敗: %d\n"
         "  DB失敗: %d\n"
-        "  スキップ: %d",
+        "  スキップ: %d\n"
+        "  quota 切れで後回し: %d\n"
+        "  死活チェック: dead=%d, redirected=%d, 判定保留=%d",
         int(elapsed // 60), elapsed % 60,
         _stats["success"], _stats["fail_fetch"], _stats["fail_gemini"],
-        _stats["fail_db"], _stats["skipped"],
+        _stats["fail_db"], _stats["skipped"], _stats["deferred"],
+        _stats["probe_dead"], _stats["probe_redirected"], _stats["probe_error"],
     )
 
+    logger.info("  ステージ別:")
+    pipeline.log_stats()
+    if args.batch_api:
+        writer.log_stats()
+    logger.info("  チェックポイント累計: %s", _checkpoint.outcome_counts())
+    logger.info("  失敗キャッシュ: %d件記録, ヒット=%d", len(failed_urls), failed_urls.hits)
+
+    key_pool = gemini_client.get_key_pool()
+    limiter = key_pool.limiter_stats()
+    logger.info(
+        "  Gemini レート制限: 呼び出し=%d, 待ち=%d回 (計%.0f秒), 429停止=%d回",
+        limiter["acquired"], limiter["waited"], limiter["wait_seconds"], limiter["paused"],
+    )
+    key_pool.log_stats()
+    single_flight = gemini_client.get_single_flight()
+    if single_flight is not None:
+        logger.info("  Gemini 同時リクエストの共有: %s", single_flight.stats)
+    logger.info("  Gemini quota ブレーカー: %s", gemini_client.get_quota_breaker().stats)
+    tracker = get_tracker()
+    tracker.log_summary()
+    if log_id:
+        try:
+            db.update_batch_log(
+                log_id,
+                finished_at=datetime.now(timezone.utc).isoformat(),
+                status="completed",
+                errors_count=_stats["fail_gemini"] + _stats["fail_db"],
+                **tracker.rollup(),
+            )
+        except Exception as exc:
+            logger.error("バッチログ更新失敗: %s", exc)
+
+    memo = get_memo()
+    if memo is not None:
+        logger.info(
+            "  抽出メモ: ヒット=%d, ミス=%d (ヒット率 %.1f%%)",
+            memo.stats["hit"], memo.stats["miss"], memo.hit_rate() * 100,
+        )
+
+    cache = scraper.get_cache()
+    if cache is not None:
+        logger.info(
+            "  HTTPキャッシュ: ヒット=%d, 再検証=%d, ミス=%d, 削除=%d",
+            cache.stats["hit"], cache.stats["revalidated"],
+            cache.stats["miss"], cache.stats["evicted"],
+        )
+
 
 if __name__ == "__main__":
     main()
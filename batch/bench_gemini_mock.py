@@ -0,0 +1,182 @@
+"""公募ナビAI - モックサーバーを相手にした Gemini 呼び出しのスループット計測
+
+mock_gemini_server.py をプロセス内で起動し、本番と同じ gemini_client
+（レートリミッター・429 リトライ・モデル切り替え・非同期の同時実行）で
+業種分類・マッチング（ストリーミング）・Batch API 相当の負荷をかける。
+レイテンシ分布・429/503・途中終了は seed 固定で再現できるので、
+設定（並列度・RPM・経路）を変えたときの差だけを比べられる。
+
+使い方:
+  cd batch
+  python bench_gemini_mock.py [--mode classify|stream|batch] [--calls 200] [--concurrency 8]
+      [--rpm 1000] [--keys 1] [--models gemini-2.5-flash-lite,gemini-2.5-flash]
+      [--latency 0.8,3.0] [--rate-429 0.05] [--rate-503 0.01] [--truncate-rate 0.02] [--seed 0]
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import config
+import gemini_batch
+import gemini_client
+from gemini_async import AsyncGemini
+from industry_classifier import CLASSIFY_PREFIX, CLASSIFY_SCHEMA, _build_prompt
+from json_stream import iter_json_array
+from matcher import MATCH_SCHEMA
+from mock_gemini_server import MockGeminiServer, add_fault_arguments, faults_from_args, rule_responder
+from usage import get_tracker
+
+_BATCH_SIZE = 50
+
+
+def classify_prompts(calls: int) -> list[str]:
+    """業種分類1バッチ分（50件）のプロンプト。"""
+    return [
+        _build_prompt([
+            {"id": f"{n}-{i}", "title": f"庁舎清掃業務委託 {n}-{i}", "category": "役務",
+             "summary": "本庁舎および分庁舎の日常清掃・定期清掃を行う。"}
+            for i in range(_BATCH_SIZE)
+        ])
+        for n in range(calls)
+    ]
+
+
+def match_prompts(calls: int) -> list[str]:
+    """マッチング1バッチ分（50件）の「## 案件リスト」。"""
+    return [
+        "## 案件リスト\n" + json.dumps([
+            {"id": f"{n}-{i}", "title": f"システム保守業務 {n}-{i}", "category": "役務"}
+            for i in range(_BATCH_SIZE)
+        ], ensure_ascii=False)
+        for n in range(calls)
+    ]
+
+
+async def _run_online(args, prompts: list[str], call) -> tuple[list[float], int]:
+    """全プロンプトを並列に流し、(1呼び出しごとの秒数, 期待件数どおりだった呼び出し数)。"""
+    latencies: list[float] = []
+
+    def timed(prompt):
+        started = time.monotonic()
+        count = call(prompt)
+        latencies.append(time.monotonic() - started)
+        return count
+
+    async with AsyncGemini(args.concurrency) as client:
+        results = await client.gather(client.run(timed, p) for p in prompts)
+    complete = sum(1 for r in results if r == _BATCH_SIZE)
+    return latencies, complete
+
+
+def run_classify(args, models) -> tuple[list[float], int]:
+    def call(prompt):
+        results = gemini_client.generate_json(
+            prompt, CLASSIFY_SCHEMA, max_tokens=4096, cache=False,
+            tag="classify", prefix=CLASSIFY_PREFIX, models=models,
+        )
+        return len(results)
+
+    return asyncio.run(_run_online(args, classify_prompts(args.calls), call))
+
+
+def run_stream(args, models) -> tuple[list[float], int]:
+    def call(prompt):
+        # 途中で切れた応答も完結した要素までは数える（matcher と同じ読み方）
+        count = 0
+        try:
+            for _ in iter_json_array(gemini_client.stream_gemini(
+                prompt, max_tokens=16384, schema=MATCH_SCHEMA, tag="matcher", models=models,
+            )):
+                count += 1
+        except ValueError:
+            pass
+        return count
+
+    return asyncio.run(_run_online(args, match_prompts(args.calls), call))
+
+
+def run_batch(args, models) -> tuple[list[float], int]:
+    requests_by_key = {
+        str(i): gemini_client.build_request(
+            CLASSIFY_PREFIX + prompt, max_tokens=4096, schema=CLASSIFY_SCHEMA,
+        )
+        for i, prompt in enumerate(classify_prompts(args.calls))
+    }
+    started = time.monotonic()
+    responses = gemini_batch.run_batch(
+        requests_by_key, display_name="bench", poll_interval=0.2, tag="classify_batch",
+        model=models[0] if models else None,
+    )
+    elapsed = time.monotonic() - started
+    complete = sum(
+        1 for text in responses.values()
+        if text and len(gemini_client.decode_json(text, CLASSIFY_SCHEMA)) == _BATCH_SIZE
+    )
+    return [elapsed], complete
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="モック Gemini を相手にしたスループット計測")
+    parser.add_argument("--mode", choices=("classify", "stream", "batch"), default="classify")
+    parser.add_argument("--calls", type=int, default=200, help="呼び出し回数（1回 = 50件）")
+    parser.add_argument("--concurrency", type=int, default=config.GEMINI_CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=config.GEMINI_RPM)
+    parser.add_argument("--tpm", type=int, default=config.GEMINI_TPM)
+    parser.add_argument("--keys", type=int, default=1, help="APIキーの本数（キーごとに rpm/tpm）")
+    parser.add_argument("--models", default="", help="経路の上書き（カンマ区切り。省略時は GEMINI_ROUTES）")
+    parser.add_argument("--stream-chunk", type=int, default=200)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    models = tuple(m for m in args.models.split(",") if m) or None
+    server = MockGeminiServer(
+        rule_responder, stream_chunk=args.stream_chunk, faults=faults_from_args(args),
+    )
+    with server:
+        # シングルトン（リミッター・セッション）が作られる前に向け先と上限を差し替える
+        config.GEMINI_API_BASE = server.url
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        config.GEMINI_RPM, config.GEMINI_TPM = args.rpm, args.tpm
+        config.GEMINI_API_KEYS = [f"mock-key-{i + 1}" for i in range(args.keys)]
+        config.GEMINI_CONCURRENCY = args.concurrency
+        config.GEMINI_LIMITER_DB = ""
+        config.GEMINI_CACHE_ENABLED = False
+
+        started = time.monotonic()
+        runner = {"classify": run_classify, "stream": run_stream, "batch": run_batch}[args.mode]
+        latencies, complete = runner(args, models)
+        elapsed = time.monotonic() - started
+
+    print(f"mode={args.mode} calls={args.calls} concurrency={args.concurrency} rpm={args.rpm}")
+    print(f"  経過 {elapsed:.2f}s  スループット {args.calls / elapsed:.1f} 呼び出し/s"
+          f"  ({args.calls * _BATCH_SIZE / elapsed:.0f} 件/s)")
+    print(f"  レイテンシ p50={_percentile(latencies, 50):.2f}s p95={_percentile(latencies, 95):.2f}s"
+          f" max={max(latencies, default=0):.2f}s")
+    print(f"  全件そろった呼び出し {complete}/{args.calls}")
+    print(f"  モック {server.stats}")
+    if args.keys > 1:
+        for label, entry in gemini_client.get_key_pool().utilization().items():
+            print(f"  {label}: 呼び出し={entry['requests']} ({entry['share']:.0%})"
+                  f" 429={entry['rate_limited']} 除外={entry['disabled']}")
+    for tag, entry in get_tracker().summary().items():
+        if tag == "total" or not entry["calls"]:
+            continue
+        print(f"  [{tag}] 失敗={entry['errors']} 429再試行={entry['retries']}"
+              f" 切り替え={entry['fallbacks']} スキーマ不一致={entry['invalid']}"
+              f" 平均{entry['latency_avg_ms']}ms")
+        for model, stats in entry["models"].items():
+            print(f"    {model}: 呼び出し={stats['calls']} 失敗={stats['errors']}"
+                  f" 平均{stats['latency_avg_ms']}ms")
+
+
+if __name__ == "__main__":
+    main()
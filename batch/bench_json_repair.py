@@ -0,0 +1,165 @@
+"""公募ナビAI - JSON 修復のマイクロベンチマーク
+
+出力上限で途中終了した Gemini 応答を想定し、途中の複数位置で切った
+テキストに対して parse_json_response（1パス修復）と旧実装
+（正規表現2回 + 括弧の再走査 + 貪欲な正規表現フォールバック）を比べる。
+
+サンプルは --samples で保存済みの応答ファイル（*.json / *.txt）を指定する。
+省略時はマッチング結果・詳細抽出パック相当の約60KBの応答を生成して使う。
+
+使い方:
+  cd batch
+  python bench_json_repair.py [--samples DIR] [--cuts 50] [--repeat 5]
+"""
+
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+
+from gemini_client import parse_json_response
+
+
+def synthetic_samples() -> dict[str, str]:
+    """実応答と同じ形・大きさ（約60KB）の応答を作る。"""
+    matches = [
+        {
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "match_score": 95 - i % 60,
+            "match_reason": "事業内容と仕様書の業務範囲がよく一致している。「保守・運用」も対応可能",
+            "risk_notes": None if i % 3 else "実績証明書（過去3年）の提出が必要 [要確認]",
+            "recommendation": ("強く推奨", "推奨", "検討可", "非推奨")[i % 4],
+            "action_items": ["仕様書を確認", "説明会に参加", "見積書を準備"],
+        }
+        for i in range(220)
+    ]
+    pack = {
+        f"opp-{i}": {
+            "deadline": "2026-11-30",
+            "budget": "1,000万円",
+            "requirements": "全省庁統一資格「役務の提供等」A〜C等級。{過去5年の同種実績}",
+            "detailed_summary": "庁内ネットワークの更改に伴う設計・構築・移行および保守業務。" * 3,
+            "difficulty": "中",
+            "industry_category": "IT・DX",
+        }
+        for i in range(150)
+    }
+    return {
+        "matcher": json.dumps(matches, ensure_ascii=False, indent=2),
+        "detail_pack": json.dumps(pack, ensure_ascii=False, indent=2),
+    }
+
+
+def load_samples(directory: str) -> dict[str, str]:
+    paths = sorted(Path(directory).glob("*.json")) + sorted(Path(directory).glob("*.txt"))
+    return {path.name: path.read_text(encoding="utf-8") for path in paths}
+
+
+def truncations(text: str, cuts: int) -> list[str]:
+    """先頭20%以降を cuts 箇所で切ったテキスト。"""
+    start = len(text) // 5
+    step = max(1, (len(text) - start) // cuts)
+    return [text[:pos] for pos in range(start, len(text), step)][:cuts]
+
+
+def _legacy_parse(text: str):
+    """旧実装（比較用）。"""
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(_legacy_repair(text))
+    except json.JSONDecodeError:
+        match = re.search(r"\{.*\}", text, re.DOTALL)
+        if match:
+            return json.loads(match.group())
+        raise
+
+
+def _legacy_count(text: str, open_char: str, close_char: str) -> int:
+    count = 0
+    in_string = False
+    escaped = False
+    for ch in text:
+        if escaped:
+            escaped = False
+            continue
+        if ch == "\\" and in_string:
+            escaped = True
+            continue
+        if ch == '"':
+            in_string = not in_string
+            continue
+        if not in_string:
+            if ch == open_char:
+                count += 1
+            elif ch == close_char:
+                count -= 1
+    return count
+
+
+def _legacy_repair(text: str) -> str:
+    in_string = False
+    escaped = False
+    for ch in text:
+        if escaped:
+            escaped = False
+            continue
+        if ch == "\\":
+            escaped = True
+            continue
+        if ch == '"':
+            in_string = not in_string
+    if in_string:
+        text += '"'
+    text = re.sub(r",\s*([}\]])", r"\1", text)
+    text = re.sub(r",\s*$", "", text)
+    text += "}" * max(0, _legacy_count(text, "{", "}"))
+    text += "]" * max(0, _legacy_count(text, "[", "]"))
+    return text
+
+
+def bench(parse, inputs: list[str], repeat: int) -> tuple[float, int, int]:
+    """(1件あたり平均ミリ秒, パース成功数, 救出できた要素数の合計)"""
+    ok = 0
+    elements = 0
+    for text in inputs:
+        try:
+            value = parse(text)
+        except (json.JSONDecodeError, ValueError):
+            continue
+        ok += 1
+        elements += len(value) if isinstance(value, (list, dict)) else 0
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in inputs:
+            try:
+                parse(text)
+            except (json.JSONDecodeError, ValueError):
+                pass
+    elapsed = time.perf_counter() - started
+    return elapsed / (repeat * len(inputs)) * 1000, ok, elements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 修復のマイクロベンチマーク")
+    parser.add_argument("--samples", help="保存済み応答のディレクトリ（*.json / *.txt）")
+    parser.add_argument("--cuts", type=int, default=50, help="1サンプルあたりの切断位置数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples) if args.samples else synthetic_samples()
+    print(f"{'sample':<16} {'impl':<8} {'ms/call':>9} {'parsed':>9} {'elements':>9}")
+    for name, text in samples.items():
+        inputs = truncations(text, args.cuts)
+        for label, parse in (("legacy", _legacy_parse), ("current", parse_json_response)):
+            ms, ok, elements = bench(parse, inputs, args.repeat)
+            print(f"{name[:16]:<16} {label:<8} {ms:>9.2f} {ok:>4}/{len(inputs):<4} {elements:>9}")
+
+
+if __name__ == "__main__":
+    main()
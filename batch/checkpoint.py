@@ -0,0 +1,74 @@
+"""公募ナビAI - バックフィルのチェックポイント
+
+長時間のバックフィルを中断・再開できるよう、処理した案件IDと結果、
+DB取得の位置（カーソル）をローカル SQLite に記録する。
+--resume 時は記録済みの案件を飛ばし、カーソルの続きから取得する。
+"""
+
+import threading
+import time
+
+import local_store
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    opp_id TEXT PRIMARY KEY,
+    outcome TEXT NOT NULL,
+    attempted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class Checkpoint:
+    """処理済み案件ID・結果・取得カーソルの記録（スレッドセーフ）。"""
+
+    def __init__(self, filename: str = "backfill_checkpoint.db"):
+        self._lock = threading.Lock()
+        self._conn = local_store.connect(filename)
+        self._conn.executescript(_SCHEMA)
+
+    def reset(self):
+        """記録をすべて消す（新規実行の開始時）。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM attempts")
+            self._conn.execute("DELETE FROM state")
+
+    def record(self, opp_id: str, outcome: str):
+        """案件の処理結果を記録する（同じ案件は上書き）。"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO attempts (opp_id, outcome, attempted_at) VALUES (?, ?, ?)",
+                (opp_id, outcome, time.time()),
+            )
+
+    def attempted_ids(self) -> set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT opp_id FROM attempts")}
+
+    def outcome_counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT outcome, COUNT(*) FROM attempts GROUP BY outcome")
+            return dict(rows.fetchall())
+
+    def set_cursor(self, scraped_at: str, opp_id: str):
+        """取得済みバッチの最後の行（scraped_at, id）を記録する。"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                [("cursor_scraped_at", scraped_at), ("cursor_id", opp_id)],
+            )
+
+    def cursor(self) -> tuple[str, str] | None:
+        with self._lock:
+            state = dict(self._conn.execute("SELECT key, value FROM state").fetchall())
+        if "cursor_scraped_at" not in state or "cursor_id" not in state:
+            return None
+        return state["cursor_scraped_at"], state["cursor_id"]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
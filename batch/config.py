@@ -10,8 +10,53 @@ except ImportError:
 
 # --- Gemini API ---
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
+# 複数プロジェクトのキーで quota を分け合う場合はカンマ区切りで並べる（key_pool.py）
+GEMINI_API_KEYS = [
+    key.strip() for key in os.environ.get("GEMINI_API_KEYS", "").split(",") if key.strip()
+] or [GEMINI_API_KEY]
 GEMINI_MODEL = "gemini-2.5-flash"
-GEMINI_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta/models"
+# ローカルのモックサーバー（mock_gemini_server.py）で試す場合は GEMINI_API_BASE を差し替える
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+GEMINI_ENDPOINT = f"{GEMINI_API_BASE}/v1beta/models"
+# プロセス全体のレート制限（有料 Tier 1 の既定値。プロジェクトの quota に合わせて上書き）
+# キーを複数並べた場合はキー（プロジェクト）ごとの値
+GEMINI_RPM = int(os.environ.get("GEMINI_RPM", "1000"))
+GEMINI_TPM = int(os.environ.get("GEMINI_TPM", "1000000"))  # 推定入力トークン/分
+GEMINI_KEY_MAX_429 = 3  # 連続でこの回数 429 を受けたキーはローテーションから外す
+GEMINI_KEY_COOLDOWN = 300  # 外したキーを戻すまでの秒数
+# quota ブレーカー（quota_breaker.py）: モデルごとに quota 切れが続いたら送信せずに失敗させる
+GEMINI_BREAKER_THRESHOLD = 5  # 空きキーのない 429 がこの回数続いたら開く（日次 quota 切れは1回で開く）
+GEMINI_BREAKER_COOLDOWN = 300  # 開いてから試しに1本通すまでの秒数
+GEMINI_BREAKER_DAILY_COOLDOWN = 3600  # 日次 quota 切れで開いたときの秒数
+# 指定すると制限の状態をこの SQLite ファイルで複数プロセス共有する（CACHE_DIR 相対可）
+GEMINI_LIMITER_DB = os.environ.get("GEMINI_LIMITER_DB", "")
+# 同時に送信中にできる Gemini 呼び出しの上限（非同期クライアント・接続プールの大きさ）
+GEMINI_CONCURRENCY = int(os.environ.get("GEMINI_CONCURRENCY", "8"))
+GEMINI_TIMEOUT = 120  # 1呼び出しの HTTP タイムアウト（秒）
+# Batch API（非同期の一括実行。オンライン quota を使わず単価も安い）
+GEMINI_BATCH_POLL_INTERVAL = 30  # 完了確認の間隔（秒）
+GEMINI_BATCH_TIMEOUT = 24 * 3600  # これを超えたら待つのをやめる（秒）
+GEMINI_BATCH_MAX_JOBS = 4  # バックフィルで同時に走らせるジョブ数の上限
+# 使用量集計（usage.py）のコスト見積もり用単価: USD / 100万トークン（入力, 出力・思考, キャッシュ済み入力）
+GEMINI_PRICING = {
+    "gemini-2.5-flash": (0.30, 2.50, 0.075),
+    "gemini-2.5-flash-lite": (0.10, 0.40, 0.025),
+    "gemini-2.5-pro": (1.25, 10.00, 0.31),
+    "gemini-2.0-flash": (0.10, 0.40, 0.025),
+}
+GEMINI_BATCH_DISCOUNT = 0.5  # Batch API は通常単価の半額
+# 呼び出し箇所（usage のタグ）ごとのモデル。先頭から使い、quota 切れ（429）・5xx・
+# スキーマ不一致の応答で次のモデルへ切り替える。未登録のタグは GEMINI_MODEL だけを使う
+GEMINI_ROUTES = {
+    "classify": ("gemini-2.5-flash-lite", "gemini-2.5-flash"),
+    "classify_batch": ("gemini-2.5-flash-lite",),
+    "detail_pack": (GEMINI_MODEL, "gemini-2.5-flash-lite"),
+    "detail_single": (GEMINI_MODEL, "gemini-2.5-flash-lite"),
+    "detail_batch": (GEMINI_MODEL,),
+    "matcher": (GEMINI_MODEL, "gemini-2.5-flash-lite"),
+    "notify_analysis": (GEMINI_MODEL, "gemini-2.5-flash-lite"),
+    "source_extract": (GEMINI_MODEL, "gemini-2.5-flash-lite"),
+}
 
 # --- Supabase ---
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "https://ypyrjsdotkeyvzequdez.supabase.co")
@@ -29,6 +74,56 @@ REQUEST_TIMEOUT = 30
 USER_AGENT = "KouboNavi/1.0 (bantex.jp; AI procurement matching)"
 MAX_TEXT_LENGTH = 30000
 
+# --- Detail enrichment ---
+DETAIL_TEXT_MAX_LENGTH = 200000  # 詳細ページ本文の上限（Gemini に送る分は section_ranker で選ぶ）
+DETAIL_PROMPT_MAX_TOKENS = 5000  # 1ページ単独抽出時にプロンプトへ入れる本文の推定トークン上限
+# 詳細ページ取得失敗の再試行までの時間（失敗理由ごと）
+DETAIL_FAILURE_TTL_HOURS = {
+    "not_found": 24 * 90,  # 404/410: ほぼ戻らない
+    "http_error": 24 * 7,
+    "timeout": 24,  # 一時的な可能性が高い
+    "too_short": 24 * 30,
+    "extract_failed": 6,  # Gemini側の失敗は同一実行内の再試行だけ防ぐ
+}
+
+# 短い詳細ページは複数件を1回の Gemini 呼び出しにまとめて抽出する
+DETAIL_PACK_MAX_PAGES = 8  # 1回にまとめる最大ページ数
+DETAIL_PACK_MAX_TOKENS = 12000  # 1回にまとめるページテキストの推定トークン上限
+DETAIL_PACK_PAGE_MAX_TOKENS = 3000  # これを超えるページは単独で抽出
+DETAIL_PACK_OUTPUT_TOKENS = 400  # 1ページあたりの出力トークン見込み
+
+# --- Source circuit breaker ---
+SOURCE_BREAKER_THRESHOLD = 3  # 連続失敗がこの回数に達したソースは再試行を間引く
+SOURCE_REPROBE_BASE_HOURS = 23  # 再試行間隔の基準（日次実行の時刻ずれを吸収するため24hより短く）
+SOURCE_REPROBE_MAX_HOURS = 24 * 30  # 再試行間隔の上限
+
+# --- Local cache (SQLite, バッチ実行マシン上) ---
+CACHE_DIR = os.environ.get(
+    "KOUBO_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+HTTP_CACHE_ENABLED = os.environ.get("HTTP_CACHE", "") == "1"  # daily_check 用（backfill は --http-cache）
+HTTP_CACHE_TTL = 24 * 3600  # Cache-Control: max-age が無い場合の保存期間（秒）
+HTTP_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 圧縮後の合計サイズ上限（超過分はLRUで削除）
+EXTRACTION_MEMO_ENABLED = os.environ.get("EXTRACTION_MEMO", "1") != "0"  # 詳細抽出結果をページ内容で再利用
+EXTRACTION_MEMO_TTL = 90 * 24 * 3600  # 秒（0で無期限）
+EXTRACTION_MEMO_MAX_BYTES = 256 * 1024 ** 2  # 合計サイズ上限（超過分はLRUで削除）
+GEMINI_CACHE_ENABLED = os.environ.get("GEMINI_CACHE", "1") != "0"  # 同一プロンプトの応答を再利用
+GEMINI_CACHE_TTL = int(os.environ.get("GEMINI_CACHE_TTL", str(7 * 24 * 3600)))  # 秒（0で無期限）
+GEMINI_CACHE_MAX_BYTES = 512 * 1024 ** 2  # 圧縮後の合計サイズ上限（超過分はLRUで削除）
+# 共通の前置き（会社プロフィール・分類指示）を cachedContents に登録して使い回す
+GEMINI_CONTEXT_CACHE_ENABLED = os.environ.get("GEMINI_CONTEXT_CACHE", "1") != "0"
+GEMINI_CONTEXT_CACHE_TTL = 3600  # 秒（実行の最後に削除する。異常終了時はこの時間で消える）
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = 1024  # これ未満の前置きは登録できないので本文に連結する（2.5 Flash）
+# 送信中の同一リクエストを1本にまとめる（single_flight.py。永続化はしない）
+GEMINI_SINGLE_FLIGHT_ENABLED = os.environ.get("GEMINI_SINGLE_FLIGHT", "1") != "0"
+# ヘッジ（hedging.py。hedge=True を渡した呼び出しだけ）: p95 を過ぎたら同じリクエストをもう1本送る
+GEMINI_HEDGE_PERCENTILE = 95
+GEMINI_HEDGE_MAX_RATE = 0.1  # 追加で送る本数の上限（呼び出し数に対する割合）
+GEMINI_HEDGE_WINDOW = 200  # p95 を求める直近の観測数
+GEMINI_HEDGE_MIN_SAMPLES = 20  # これ未満の観測しかないうちは INITIAL_DELAY で送る
+GEMINI_HEDGE_INITIAL_DELAY = 30  # 秒
+
 # --- Matching ---
 BATCH_SIZE = 15  # Gemini 1回に送る案件数の上限
 DEFAULT_MATCH_THRESHOLD = 40  # 通知する最低スコア
@@ -0,0 +1,117 @@
+"""公募ナビAI - Gemini の明示的コンテキストキャッシュ（cachedContents）
+
+マッチングは1ユーザーあたり最大20バッチに同じ会社プロフィールと判定基準を、
+業種分類は1,000バッチに同じ分類指示を毎回送っている。共通の前置き（prefix）を
+実行中に一度だけ cachedContents として登録し、各リクエストからは名前で参照する。
+
+- キーは sha256(モデル名 + prefix)。プロンプトの版やプロフィールが変われば
+  prefix の内容が変わるので、自動的に別のキャッシュになる（古いものは使われない）
+- モデルごとの最小トークン数に満たない prefix は登録せず、本文に連結して送る
+- 登録に失敗した prefix も以後はその実行中ずっと連結送信にする
+- 実行の最後に close() で登録したキャッシュを削除する（残っても TTL で消える）
+"""
+
+import hashlib
+import logging
+import threading
+
+import requests
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+_MISSING = object()
+
+
+def prefix_key(model: str, prefix: str) -> str:
+    return hashlib.sha256(f"{model}\n{prefix}".encode("utf-8")).hexdigest()
+
+
+class ContextCache:
+    """prefix → cachedContents 名の対応（実行中だけ保持。スレッドセーフ）。"""
+
+    def __init__(
+        self,
+        ttl: int = config.GEMINI_CONTEXT_CACHE_TTL,
+        min_tokens: int = config.GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+    ):
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.stats = {"created": 0, "reused": 0, "inline": 0, "failed": 0}
+        self._names: dict[str, str | None] = {}  # None = 連結送信にする prefix
+        self._creating: dict[str, threading.Lock] = {}  # 登録中の prefix ごとのロック
+        self._lock = threading.Lock()
+
+    def get(self, prefix: str, prefix_tokens: int, model: str | None = None) -> str | None:
+        """prefix の cachedContents 名を返す（未登録なら登録する）。使えなければ None。"""
+        model = model or config.GEMINI_MODEL
+        key = prefix_key(model, prefix)
+        with self._lock:
+            name = self._lookup_locked(key)
+            if name is not _MISSING:
+                return name
+            if prefix_tokens < self.min_tokens:
+                self.stats["inline"] += 1
+                self._names[key] = None
+                return None
+            creating = self._creating.setdefault(key, threading.Lock())
+
+        # 同じ prefix を並列のワーカーが同時に登録しないよう prefix ごとのロックで待ち合わせる。
+        # HTTP の登録は全体のロックの外で行い、別の prefix の参照・登録は止めない
+        with creating:
+            with self._lock:
+                name = self._lookup_locked(key)
+                if name is not _MISSING:
+                    return name
+            name = None
+            try:
+                name = self._create(prefix, model)
+                logger.info("コンテキストキャッシュ作成: %s (推定%dトークン)", name, prefix_tokens)
+            except (requests.RequestException, KeyError, ValueError) as exc:
+                logger.warning("コンテキストキャッシュ作成失敗（本文に連結して送信）: %s", exc)
+            with self._lock:
+                self.stats["created" if name else "failed"] += 1
+                self._names[key] = name
+                self._creating.pop(key, None)
+            return name
+
+    def _lookup_locked(self, key: str):
+        """登録済みなら名前（連結送信なら None）を返して数える。未登録なら _MISSING。"""
+        if key not in self._names:
+            return _MISSING
+        name = self._names[key]
+        self.stats["reused" if name else "inline"] += 1
+        return name
+
+    def close(self):
+        """この実行で作成したキャッシュを削除する。"""
+        from gemini_client import api_headers, get_session
+
+        with self._lock:
+            names = [name for name in self._names.values() if name]
+            self._names.clear()
+        for name in names:
+            try:
+                get_session().delete(
+                    f"{config.GEMINI_API_BASE}/v1beta/{name}", headers=api_headers(), timeout=30,
+                )
+            except requests.RequestException as exc:
+                logger.debug("コンテキストキャッシュ削除失敗 %s: %s", name, exc)
+
+    def _create(self, prefix: str, model: str) -> str:
+        from gemini_client import api_headers, get_session
+
+        resp = get_session().post(
+            f"{config.GEMINI_API_BASE}/v1beta/cachedContents",
+            headers=api_headers(),
+            json={
+                "model": f"models/{model}",
+                "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+                "ttl": f"{self.ttl}s",
+            },
+            timeout=60,
+        )
+        resp.raise_for_status()
+        return resp.json()["name"]
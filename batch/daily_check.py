@@ -1,6 +1,7 @@
 """公募ナビAI - 日次バッチ処理 v3.0
 
 Render.com Cron Job から呼び出され、以下を実行:
+0. 前回 Gemini の quota 切れで後回しにした処理（詳細抽出・業種分類・AI分析）を実行
 1. 全ソースをスクレイピング → opportunities 保存
 1.5. 詳細ページ取得 + 業種カテゴリ分類（Gemini）
 2. ユーザーごとに業種マッチ新着案件 → AI詳細分析 → メール通知
@@ -12,10 +13,13 @@ import traceback
 from datetime import datetime, timezone
 
 import db
+import deferred_queue
+import gemini_client
 from detail_scraper import enrich_batch
-from gov_scraper import scrape_source
+from gov_scraper import is_circuit_open, next_probe_at, scrape_source
 from notifier import notify_user
 from slack_notify import notify_slack, notify_slack_health
+from usage import get_tracker
 
 logger = logging.getLogger(__name__)
 
@@ -27,20 +31,27 @@ def run_daily_check():
         "users_processed": 0,
         "opportunities_scraped": 0,
         "details_enriched": 0,
+        "sources_skipped": [],
         "notifications_sent": 0,
         "errors_count": 0,
         "error_details": [],
     }
+    status = "failed"
 
     try:
         # バッチログ開始（失敗してもバッチ処理は継続）
         try:
-            log_id = db.create_batch_log()
+            log_id = db.create_batch_log("daily_check")
             logger.info("=== バッチ開始 (log_id=%s) ===", log_id)
         except Exception as log_exc:
             logger.warning("バッチログ作成失敗（処理は継続）: %s", log_exc)
             log_id = None
 
+        # =====================================================
+        # Phase 0: 前回 quota 切れで後回しにした処理
+        # =====================================================
+        stats["deferred_drained"] = deferred_queue.drain()
+
         # =====================================================
         # Phase 1: 全ソースをスクレイピング（ユーザー有無に関係なく）
         # =====================================================
@@ -58,14 +69,32 @@ def run_daily_check():
         for area_id, sources in sources_by_area.items():
             logger.info("--- エリア: %s (%d sources) ---", area_id, len(sources))
 
-            for si, source in enumerate(sources):
+            scraped_in_area = 0
+            for source in sources:
                 source_id = source["id"]
+
+                # サーキットブレーカー: 連続失敗中のソースは再試行時刻までスキップ
+                retry_at = next_probe_at(source)
+                if retry_at:
+                    stats["sources_skipped"].append({
+                        "source_id": source_id,
+                        "name": source.get("source_name", source_id),
+                        "consecutive_failures": source.get("consecutive_failures", 0),
+                        "retry_at": retry_at.isoformat(),
+                    })
+                    continue
+                probing = is_circuit_open(source)
+
                 # 同一エリア内の連続リクエスト間に待機（サーバー負荷軽減）
-                if si > 0:
+                if scraped_in_area > 0:
                     time.sleep(2)
+                scraped_in_area += 1
                 try:
-                    raw_opps = scrape_source(source)
+                    raw_opps = scrape_source(source, probe=probing)
                     db.update_source_status(source_id, success=True)
+                    if probing:
+                        logger.info("ソース %s 復旧（連続失敗 %d回から）",
+                                    source_id, source.get("consecutive_failures", 0))
 
                     if raw_opps:
                         saved = db.upsert_opportunities(raw_opps, area_id, source_id)
@@ -80,12 +109,21 @@ def run_daily_check():
                         "source_id": source_id,
                         "error": str(exc),
                     })
-                    notify_slack(
-                        f"スクレイピング失敗: {source.get('name', source_id)}",
-                        f"source_id: {source_id}\narea_id: {area_id}\n{str(exc)[:500]}",
-                    )
+                    # 既知の停止ソースの再試行失敗は Slack に流さない（サマリーで報告）
+                    if not probing:
+                        notify_slack(
+                            f"スクレイピング失敗: {source.get('name', source_id)}",
+                            f"source_id: {source_id}\narea_id: {area_id}\n{str(exc)[:500]}",
+                        )
 
         logger.info("スクレイピング完了: 合計 %d件", stats["opportunities_scraped"])
+        if stats["sources_skipped"]:
+            logger.info("連続失敗によりスキップ: %d件", len(stats["sources_skipped"]))
+            for skipped in stats["sources_skipped"]:
+                logger.info(
+                    "  - %s (連続失敗 %d回, 次回再試行 %s)",
+                    skipped["name"], skipped["consecutive_failures"], skipped["retry_at"][:16],
+                )
 
         # =====================================================
         # Phase 1.5: 詳細取得 + 業種分類（detail_url有 & 未取得の案件）
@@ -124,7 +162,7 @@ def run_daily_check():
 
         if not users:
             logger.info("ユーザーなし。スクレイピングのみ完了。")
-            _finish_log(log_id, stats, "completed")
+            status = "completed"
             return stats
 
         logger.info("=== 通知フェーズ ===")
@@ -152,15 +190,16 @@ def run_daily_check():
 
         # 完了
         status = "completed" if stats["errors_count"] == 0 else "completed_with_errors"
-        _finish_log(log_id, stats, status)
 
         logger.info(
-            "=== バッチ完了 === users=%d, opps=%d, enriched=%d, notified=%d, errors=%d",
+            "=== バッチ完了 === users=%d, opps=%d, enriched=%d, notified=%d, errors=%d, "
+            "sources_skipped=%d",
             stats["users_processed"],
             stats["opportunities_scraped"],
             stats["details_enriched"],
             stats["notifications_sent"],
             stats["errors_count"],
+            len(stats["sources_skipped"]),
         )
 
     except Exception as exc:
@@ -172,8 +211,11 @@ def run_daily_check():
             "traceback": traceback.format_exc(),
         })
         notify_slack("バッチ致命的エラー", f"{str(exc)}\n{traceback.format_exc()[:800]}")
-        if log_id:
-            _finish_log(log_id, stats, "failed")
+
+    finally:
+        # 途中で終わった場合も Gemini の後片付けと集計をしてからログに書く
+        _finish_gemini(stats)
+        _finish_log(log_id, stats, status)
 
     # ヘルスチェック: 契約ユーザーの処理状況を確認
     _run_health_check(stats)
@@ -238,6 +280,41 @@ def _run_health_check(stats: dict):
         notify_slack("ヘルスチェック実行エラー", str(exc)[:500])
 
 
+def _finish_gemini(stats: dict):
+    """Gemini 関連の後片付け（コンテキストキャッシュの削除）と、実行時の統計の記録。"""
+    gemini_stats = {"deferred_drained": stats.get("deferred_drained", {})}
+    try:
+        response_cache = gemini_client.get_response_cache()
+        if response_cache is not None:
+            stats["gemini_cache"] = gemini_stats["cache"] = dict(response_cache.stats)
+            logger.info(
+                "Gemini 応答キャッシュ: ヒット=%d, ミス=%d, 削除=%d",
+                response_cache.stats["hit"], response_cache.stats["miss"],
+                response_cache.stats["evicted"],
+            )
+        context_cache = gemini_client.get_context_cache()
+        if context_cache is not None:
+            context_cache.close()
+            gemini_stats["context_cache"] = dict(context_cache.stats)
+            logger.info("Gemini コンテキストキャッシュ: %s", context_cache.stats)
+        single_flight = gemini_client.get_single_flight()
+        if single_flight is not None:
+            gemini_stats["single_flight"] = dict(single_flight.stats)
+            logger.info("Gemini 同時リクエストの共有: %s", single_flight.stats)
+        gemini_stats["hedge"] = dict(gemini_client.get_hedger().stats)
+        logger.info("Gemini ヘッジ: %s", gemini_stats["hedge"])
+        gemini_stats["breaker"] = dict(gemini_client.get_quota_breaker().stats)
+        logger.info("Gemini quota ブレーカー: %s", gemini_stats["breaker"])
+        stats["deferred"] = gemini_stats["deferred"] = dict(deferred_queue.stats)
+        if any(deferred_queue.stats.values()):
+            logger.warning("Gemini quota 切れで次回に回した処理: %s", deferred_queue.stats)
+        gemini_client.get_key_pool().log_stats()
+        get_tracker().log_summary()
+    except Exception as exc:
+        logger.warning("Gemini の後片付け失敗: %s", exc)
+    stats["gemini_stats"] = gemini_stats
+
+
 def _finish_log(log_id: str, stats: dict, status: str):
     """バッチログを完了状態に更新する。"""
     if not log_id:
@@ -252,6 +329,8 @@ def _finish_log(log_id: str, stats: dict, status: str):
             notifications_sent=stats["notifications_sent"],
             errors_count=stats["errors_count"],
             error_details=stats["error_details"] if stats["error_details"] else None,
+            gemini_stats=stats.get("gemini_stats"),
+            **get_tracker().rollup(),
         )
     except Exception as exc:
         logger.error("バッチログ更新失敗: %s", exc)
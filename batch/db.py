@@ -144,6 +144,23 @@ def get_opportunities_by_areas(
     return resp.json()
 
 
+def get_opportunities_by_ids(
+    opp_ids: list[str], select: str = "*", chunk_size: int = 200,
+) -> list[dict]:
+    """ID を指定して案件を取得する（削除済みの案件は含まれない）。"""
+    rows = []
+    for i in range(0, len(opp_ids), chunk_size):
+        id_filter = ",".join(opp_ids[i:i + chunk_size])
+        resp = requests.get(
+            _url(f"/opportunities?id=in.({id_filter})&select={select}"),
+            headers=_headers(),
+            timeout=30,
+        )
+        resp.raise_for_status()
+        rows.extend(resp.json())
+    return rows
+
+
 def upsert_opportunities(opportunities: list[dict], area_id: str, source_id: str) -> list[dict]:
     """案件をDB保存（重複はスキップ）。保存された案件を返す。
 
@@ -193,14 +210,40 @@ def upsert_opportunities(opportunities: list[dict], area_id: str, source_id: str
 
 # --- Opportunity Detail Enrichment ---
 
-def get_unenriched_opportunities(limit: int = 500) -> list[dict]:
-    """詳細未取得の案件を取得する。"""
+def _unenriched_filter(after: tuple[str, str] | None = None) -> str:
+    """詳細未取得案件の絞り込み条件（PostgREST クエリ）。
+
+    after=(scraped_at, id) を渡すと、並び順（scraped_at 降順, id 昇順）で
+    その行より後ろだけに絞る（キーセットページング）。
+    """
+    now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    conditions = [f"or(detail_retry_after.is.null,detail_retry_after.lt.{now})"]
+    if after is not None:
+        scraped_at, opp_id = (quote(f'"{v}"', safe='"') for v in after)
+        conditions.append(
+            f"or(scraped_at.lt.{scraped_at},and(scraped_at.eq.{scraped_at},id.gt.{opp_id}))"
+        )
+    return (
+        "detail_fetched_at=is.null"
+        "&detail_url=not.is.null"
+        "&detail_status=is.null"
+        f"&and=({','.join(conditions)})"
+    )
+
+
+def get_unenriched_opportunities(
+    limit: int = 500, after: tuple[str, str] | None = None,
+) -> list[dict]:
+    """詳細未取得の案件を取得する。
+
+    死活チェックで dead/redirected の案件と、失敗記録の再試行時刻
+    （detail_retry_after）前の案件は除く。after を渡すとその行の続きから取得する。
+    """
     resp = requests.get(
         _url(
-            "/opportunities?detail_fetched_at=is.null"
-            "&detail_url=not.is.null"
-            "&select=id,title,detail_url"
-            f"&order=scraped_at.desc&limit={limit}"
+            f"/opportunities?{_unenriched_filter(after)}"
+            "&select=id,title,detail_url,scraped_at"
+            f"&order=scraped_at.desc,id.asc&limit={limit}"
         ),
         headers=_headers(),
         timeout=30,
@@ -209,6 +252,18 @@ def get_unenriched_opportunities(limit: int = 500) -> list[dict]:
     return resp.json()
 
 
+def count_unenriched_opportunities(after: tuple[str, str] | None = None) -> int:
+    """詳細未取得の案件数（get_unenriched_opportunities と同じ条件）。"""
+    resp = requests.get(
+        _url(f"/opportunities?{_unenriched_filter(after)}&select=id&limit=1"),
+        headers=_headers("count=exact"),
+        timeout=30,
+    )
+    resp.raise_for_status()
+    # Content-Range: 0-0/12345（0件なら */0）
+    return int(resp.headers.get("Content-Range", "*/0").rsplit("/", 1)[1])
+
+
 def update_opportunity_details(opp_id: str, details: dict):
     """案件の詳細フィールドを更新する。"""
     from datetime import datetime, timezone
@@ -231,6 +286,32 @@ def update_opportunity_details(opp_id: str, details: dict):
     )
 
 
+def mark_detail_failure(opp_id: str, reason: str, retry_after: str):
+    """詳細取得の失敗理由と再試行可能時刻を記録する。"""
+    resp = requests.patch(
+        _url(f"/opportunities?id=eq.{opp_id}"),
+        headers=_headers("return=minimal"),
+        json={"detail_fail_reason": reason, "detail_retry_after": retry_after},
+        timeout=10,
+    )
+    resp.raise_for_status()
+
+
+def mark_detail_status(opp_ids: list[str], status: str, chunk_size: int = 200):
+    """死活チェック結果（dead / redirected）を一括で記録する。"""
+    now = datetime.now(timezone.utc).isoformat()
+    for i in range(0, len(opp_ids), chunk_size):
+        chunk = opp_ids[i:i + chunk_size]
+        id_filter = ",".join(chunk)
+        resp = requests.patch(
+            _url(f"/opportunities?id=in.({id_filter})"),
+            headers=_headers("return=minimal"),
+            json={"detail_status": status, "detail_checked_at": now},
+            timeout=30,
+        )
+        resp.raise_for_status()
+
+
 # --- Industry Category ---
 
 def update_industry_category(opp_id: str, category: str):
@@ -472,14 +553,75 @@ def mark_as_notified(user_id: str, opportunity_ids: list[str]):
             logger.debug("mark notified skip: %s", e)
 
 
+# --- Gemini Deferred Work ---
+
+def defer_gemini_work(
+    kind: str, opportunity_ids: list[str], user_id: Optional[str] = None, reason: str = "",
+):
+    """quota 切れで実行できなかった処理を gemini_deferred に積む（同じ処理は1行にまとめる）。"""
+    now = datetime.now(timezone.utc).isoformat()
+    records = [
+        {
+            "key": ":".join(filter(None, (kind, opp_id, user_id))),
+            "kind": kind,
+            "opportunity_id": opp_id,
+            "user_id": user_id,
+            "reason": reason,
+            "updated_at": now,
+        }
+        for opp_id in opportunity_ids
+    ]
+    resp = requests.post(
+        _url("/gemini_deferred?on_conflict=key"),
+        headers={
+            **_headers("return=minimal"),
+            "Prefer": "resolution=merge-duplicates,return=minimal",
+        },
+        json=records,
+        timeout=30,
+    )
+    resp.raise_for_status()
+
+
+def get_deferred_work(kind: str, limit: int = 500) -> list[dict]:
+    """後回しにした処理を古い順に取得する。"""
+    resp = requests.get(
+        _url(
+            f"/gemini_deferred?kind=eq.{kind}"
+            "&select=key,opportunity_id,user_id,updated_at"
+            f"&order=created_at.asc&limit={limit}"
+        ),
+        headers=_headers(),
+        timeout=30,
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def delete_deferred_work(keys: list[str], before: str, chunk_size: int = 200):
+    """後回しにした処理を消す。before（ISO時刻）以降に積み直された行は残す。"""
+    before = quote(before.replace("+00:00", "Z"), safe="")
+    for i in range(0, len(keys), chunk_size):
+        key_filter = ",".join(quote(f'"{k}"', safe='"') for k in keys[i:i + chunk_size])
+        resp = requests.delete(
+            _url(f"/gemini_deferred?key=in.({key_filter})&updated_at=lt.{before}"),
+            headers=_headers("return=minimal"),
+            timeout=30,
+        )
+        resp.raise_for_status()
+
+
 # --- Batch Logs ---
 
-def create_batch_log() -> Optional[str]:
-    """バッチログを作成し、IDを返す。"""
+def create_batch_log(job: Optional[str] = None) -> Optional[str]:
+    """バッチログを作成し、IDを返す（job: daily_check / backfill / industry_classifier）。"""
+    row = {"status": "running"}
+    if job:
+        row["job"] = job
     resp = requests.post(
         _url("/batch_logs"),
         headers=_headers(),
-        json={"status": "running"},
+        json=row,
         timeout=10,
     )
     resp.raise_for_status()
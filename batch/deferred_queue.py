@@ -0,0 +1,131 @@
+"""公募ナビAI - Gemini の quota 切れで後回しにした処理のキュー
+
+quota ブレーカー（quota_breaker.py）が開いて実行できなかった処理を
+gemini_deferred テーブルに積み、次回の実行の最初に drain() で流す。
+
+- detail: 詳細ページの抽出（detail_scraper.enrich_batch / backfill_details）
+- classify: 業種分類（industry_classifier）
+- analysis: 通知メールの AI 詳細分析（notifier。ユーザーごと）
+
+同じ処理（種類・案件・ユーザー）は1行にまとまる。流すときは各処理をそのまま
+呼び直し、また quota で止まった分はその処理が積み直す。流し終えたら、
+積み直されなかった行だけを消す。
+"""
+
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+
+import db
+import gemini_client
+
+logger = logging.getLogger(__name__)
+
+DETAIL = "detail"
+CLASSIFY = "classify"
+ANALYSIS = "analysis"
+KINDS = (DETAIL, CLASSIFY, ANALYSIS)
+
+# 種類ごとに quota を使う呼び出し箇所（gemini_client.route のタグ）
+_TAGS = {DETAIL: "detail_pack", CLASSIFY: "classify", ANALYSIS: "notify_analysis"}
+
+_lock = threading.Lock()
+stats = {kind: 0 for kind in KINDS}  # この実行で積んだ件数
+
+
+def defer(
+    kind: str, opportunity_ids: list[str], user_id: str | None = None, reason: str = "quota",
+) -> int:
+    """処理を後回しにする。積めなかった場合もログだけで呼び出し元は止めない。
+
+    Returns:
+        積んだ件数
+    """
+    ids = list(dict.fromkeys(opportunity_ids))
+    if not ids:
+        return 0
+    try:
+        db.defer_gemini_work(kind, ids, user_id, reason[:500])
+    except Exception as exc:
+        logger.warning("後回しの記録失敗 [%s] %d件: %s", kind, len(ids), exc)
+        return 0
+    with _lock:
+        stats[kind] += len(ids)
+    logger.info("Gemini quota 切れのため %d件を次回に回す [%s]", len(ids), kind)
+    return len(ids)
+
+
+def drain(kinds: tuple[str, ...] = KINDS, limit: int = 500) -> dict[str, int]:
+    """後回しにした処理を古い順に limit 件ずつ流す。
+
+    その種類の経路がいま quota 切れなら流さない。
+
+    Returns:
+        {種類: 流した件数}
+    """
+    drained = {}
+    for kind in kinds:
+        if gemini_client.quota_blocked(_TAGS[kind]):
+            logger.info("Gemini quota 切れのため後回しの処理は流さない [%s]", kind)
+            continue
+        started = datetime.now(timezone.utc).isoformat()
+        try:
+            rows = db.get_deferred_work(kind, limit)
+            if not rows:
+                continue
+            logger.info("=== 後回しにした処理を実行 [%s]: %d件 ===", kind, len(rows))
+            _HANDLERS[kind](rows)
+            db.delete_deferred_work([row["key"] for row in rows], before=started)
+        except Exception as exc:
+            logger.warning("後回しにした処理の実行失敗 [%s]: %s", kind, exc)
+            continue
+        drained[kind] = len(rows)
+    return drained
+
+
+def _drain_detail(rows: list[dict]):
+    from detail_scraper import enrich_batch
+
+    opps = db.get_opportunities_by_ids(
+        [row["opportunity_id"] for row in rows], "id,title,detail_url",
+    )
+    for opp_id, details in enrich_batch([o for o in opps if o.get("detail_url")]):
+        try:
+            db.update_opportunity_details(opp_id, details)
+        except Exception as exc:
+            logger.debug("詳細更新失敗 %s: %s", opp_id, exc)
+
+
+def _drain_classify(rows: list[dict]):
+    from industry_classifier import _save_mapping, classify_batch
+
+    opps = db.get_opportunities_by_ids(
+        [row["opportunity_id"] for row in rows], "id,title,summary,category",
+    )
+    for i in range(0, len(opps), 50):
+        _save_mapping(classify_batch(opps[i:i + 50]))
+
+
+def _drain_analysis(rows: list[dict]):
+    from notifier import _generate_analyses
+
+    by_user: dict[str, list[str]] = {}
+    for row in rows:
+        by_user.setdefault(row["user_id"], []).append(row["opportunity_id"])
+    opps_by_id = {
+        opp["id"]: opp
+        for opp in db.get_opportunities_by_ids([row["opportunity_id"] for row in rows])
+    }
+
+    for user_id, opp_ids in by_user.items():
+        profile = db.get_user_profile(user_id)
+        if not profile:
+            continue
+        opps = [opps_by_id[opp_id] for opp_id in opp_ids if opp_id in opps_by_id]
+        for opp, analysis in zip(opps, asyncio.run(_generate_analyses(profile, opps))):
+            if analysis:
+                db.save_detailed_analysis(user_id, opp["id"], analysis)
+
+
+_HANDLERS = {DETAIL: _drain_detail, CLASSIFY: _drain_classify, ANALYSIS: _drain_analysis}
@@ -0,0 +1,190 @@
+"""公募ナビAI - 詳細ページのルールベース抽出
+
+Gemini に送る前に、定型的な項目を正規表現で抽出する。
+ラベル（公告日・提出期限・予定価格・問い合わせ先 等）の直後に値があり、
+かつ日付として妥当なものだけを採用する（自信のない項目は埋めない）。
+
+対象: published_date, deadline, bid_opening_date, contract_period,
+  briefing_date, budget, contact_info
+"""
+
+import re
+import unicodedata
+from datetime import date
+
+# 値を探すラベル直後の文字数
+_WINDOW = 80
+
+# --- 日付 ---
+# NFKC 正規化後のテキストに適用する（全角数字・㋿ は正規化済みの前提）
+_DATE_RE = re.compile(
+    r"(?:(?P<era>令和|平成|R|H)\s*(?P<ey>\d{1,2}|元)\s*[年./]\s*(?P<em>\d{1,2})\s*[月./]\s*(?P<ed>\d{1,2})\s*日?"
+    r"|(?P<y>20\d{2})\s*[年/.\-]\s*(?P<m>\d{1,2})\s*[月/.\-]\s*(?P<d>\d{1,2})\s*日?)"
+)
+_TIME_RE = re.compile(r"\s*(?:\([^)]{1,3}\)\s*)?(?:午前|午後)?\s*(\d{1,2})\s*[時:]\s*(\d{2})?")
+_ERA_BASE = {"令和": 2018, "R": 2018, "平成": 1988, "H": 1988}
+
+_LABELS = {
+    "published_date": re.compile(r"公告日|公示日|告示日|掲載日|公開日|公開開始日|公告年月日"),
+    "deadline": re.compile(
+        r"提出期限|提出期日|提出締切|申込期限|申込締切|参加申込期限|参加表明書の提出期限"
+        r"|入札書?の?提出期限|入札期限|応募期限|受付期限|締切日?|締め切り"
+    ),
+    "bid_opening_date": re.compile(r"開札日時?|開札の日時|入札日時?|入札執行日時?|入札の日時"),
+    "briefing_date": re.compile(r"(?:入札|現場|業務|参加)?説明会(?:の)?(?:日時|開催日時?)?"),
+    "contract_period": re.compile(r"履行期間|契約期間|業務期間|委託期間|履行期限"),
+}
+# 「受付期間 A から B まで」形式は終了日を締切とみなす
+_DEADLINE_RANGE_LABEL = re.compile(r"受付期間|提出期間|申込期間|募集期間|公募期間")
+
+# --- 金額 ---
+_BUDGET_LABEL = re.compile(r"予定価格|予算額|予算|上限額|契約上限額|提案上限額|限度額|見積上限額")
+_AMOUNT_RE = re.compile(
+    r"(?:金\s*)?(?P<num>\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)\s*(?P<unit>億円|万円|千円|円)"
+    r"(?:\s*[（(](?P<tax>税込|税抜|消費税[^）)]{0,10})[）)])?"
+)
+
+# --- 連絡先 ---
+_CONTACT_LABEL = re.compile(r"問い?合わ?せ先?|問合せ先?|連絡先|担当課|担当部署|担当")
+_PHONE_RE = re.compile(r"(?:TEL|Tel|電話(?:番号)?)?\s*[:]?\s*(0\d{1,4}[-(]\d{1,4}[-)]\d{3,4})")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_DEPT_RE = re.compile(r"[^\s、。,:()]{1,30}(?:課|係|室|局|センター|グループ|事務所)")
+
+
+def normalize(text: str) -> str:
+    """全角英数字・記号を半角にそろえる（NFKC）。"""
+    return unicodedata.normalize("NFKC", text)
+
+
+def extract_fields(text: str) -> dict:
+    """ページテキストからルールで確実に取れる項目だけを返す。"""
+    text = normalize(text)
+    fields = {}
+
+    for key in ("published_date", "deadline", "bid_opening_date"):
+        value = _labeled_date(text, _LABELS[key])
+        if value:
+            fields[key] = value
+    if "deadline" not in fields:
+        value = _range_end_date(text)
+        if value:
+            fields["deadline"] = value
+
+    period = _contract_period(text)
+    if period:
+        fields["contract_period"] = period
+
+    briefing = _briefing_date(text)
+    if briefing:
+        fields["briefing_date"] = briefing
+
+    budget = _budget(text)
+    if budget:
+        fields["budget"] = budget
+
+    contact = _contact(text)
+    if contact:
+        fields["contact_info"] = contact
+
+    return fields
+
+
+def _to_iso(m: re.Match) -> str | None:
+    """日付マッチを YYYY-MM-DD にする（暦として不正なら None）。"""
+    try:
+        if m.group("era"):
+            era_year = 1 if m.group("ey") == "元" else int(m.group("ey"))
+            d = date(_ERA_BASE[m.group("era")] + era_year, int(m.group("em")), int(m.group("ed")))
+        else:
+            d = date(int(m.group("y")), int(m.group("m")), int(m.group("d")))
+    except ValueError:
+        return None
+    if not 2000 <= d.year <= 2100:
+        return None
+    return d.isoformat()
+
+
+def _dates_after(text: str, pos: int, window: int = _WINDOW) -> list[tuple[str, re.Match]]:
+    return [
+        (iso, m)
+        for m in _DATE_RE.finditer(text, pos, min(len(text), pos + window))
+        if (iso := _to_iso(m))
+    ]
+
+
+def _labeled_date(text: str, label: re.Pattern) -> str | None:
+    """ラベル直後の最初の日付を返す。"""
+    for lm in label.finditer(text):
+        dates = _dates_after(text, lm.end())
+        if dates:
+            return dates[0][0]
+    return None
+
+
+def _range_end_date(text: str) -> str | None:
+    for lm in _DEADLINE_RANGE_LABEL.finditer(text):
+        dates = _dates_after(text, lm.end())
+        if len(dates) >= 2:
+            return dates[1][0]
+    return None
+
+
+def _contract_period(text: str) -> str | None:
+    """開始日と終了日の両方が取れた場合のみ返す。"""
+    for lm in _LABELS["contract_period"].finditer(text):
+        dates = _dates_after(text, lm.end())
+        if len(dates) >= 2 and dates[0][0] <= dates[1][0]:
+            return f"{dates[0][0]}〜{dates[1][0]}"
+    return None
+
+
+def _briefing_date(text: str) -> str | None:
+    for lm in _LABELS["briefing_date"].finditer(text):
+        dates = _dates_after(text, lm.end(), window=40)
+        if not dates:
+            continue
+        iso, dm = dates[0]
+        tm = _TIME_RE.match(text, dm.end())
+        if tm:
+            hour = int(tm.group(1))
+            if "午後" in tm.group(0) and hour < 12:
+                hour += 12
+            if hour < 24:
+                return f"{iso} {hour:02d}:{tm.group(2) or '00'}"
+        return iso
+    return None
+
+
+def _budget(text: str) -> str | None:
+    for lm in _BUDGET_LABEL.finditer(text):
+        window = text[lm.end():lm.end() + 40]
+        am = _AMOUNT_RE.search(window)
+        if not am:
+            continue
+        value = f"{am.group('num')}{am.group('unit')}"
+        if am.group("tax"):
+            value += f"（{am.group('tax')}）"
+        return value
+    return None
+
+
+def _contact(text: str) -> str | None:
+    """問い合わせ先ラベル以降から部署・電話・メールを組み立てる。"""
+    for lm in _CONTACT_LABEL.finditer(text):
+        window = text[lm.end():lm.end() + 200]
+        phone = _PHONE_RE.search(window)
+        email = _EMAIL_RE.search(window)
+        if not (phone or email):
+            continue
+        parts = []
+        end = min(m.start() for m in (phone, email) if m)
+        dept = _DEPT_RE.search(window, 0, end)
+        if dept:
+            parts.append(dept.group(0).lstrip(":").strip())
+        if phone:
+            parts.append(f"TEL {phone.group(1)}")
+        if email:
+            parts.append(email.group(0))
+        contact = " ".join(parts)
+        return contact if len(contact) <= 100 else contact[:97] + "..."
+    return None
@@ -1,165 +1,509 @@
 """公募ナビAI - 詳細ページスクレイパー
 
-各案件のdetail_urlを巡回し、Geminiで構造化データを抽出する。
+各案件のdetail_urlを巡回し、ルール抽出（detail_rules）+ Geminiで構造化データを抽出する。
 抽出項目: published_date, deadline, bid_opening_date, contract_period,
   briefing_date, budget, requirements, contact_info, detailed_summary,
   difficulty, industry_category
 """
 
 import logging
+import threading
 import time
 
 import requests
 
 import config
-from gemini_client import call_gemini, parse_json_response
+import deferred_queue
+import gemini_batch
+import negative_cache
+from detail_rules import extract_fields
+from extraction_memo import ExtractionMemo
+from gemini_client import build_request, call_gemini, decode_json, estimate_tokens, quota_blocked
+from rate_limiter import PRIORITY_LOW
+from response_schema import compile_schema, obj, string
 from scraper import fetch_page, extract_text
+from section_ranker import select_sections
 
 logger = logging.getLogger(__name__)
 
-# 失敗URLを一時キャッシュ（同一バッチ内で重複fetchを避ける）
-_failed_urls: set[str] = set()
+# 失敗URLキャッシュ（理由別の有効期限付き。DBにも書き戻して次回実行に引き継ぐ）
+failed_urls = negative_cache.NegativeCache()
 
+# 抽出プロンプト・項目定義の版数（変更したら上げてメモ化済みの結果を無効にする）
+PROMPT_VERSION = "detail-v4"
 
-def enrich_opportunity(opp: dict) -> dict | None:
-    """1件の案件の詳細ページを取得し、構造化データを抽出する。
+_memo: ExtractionMemo | None = None
+_memo_lock = threading.Lock()
 
-    Returns:
-        抽出結果のdict。取得失敗時はNone。
-    """
+
+def get_memo() -> ExtractionMemo | None:
+    """抽出結果のメモ（初回呼び出し時に開く。無効設定なら None）。"""
+    global _memo
+    if not config.EXTRACTION_MEMO_ENABLED:
+        return None
+    with _memo_lock:
+        if _memo is None:
+            # 版はプロンプトだけで切り、モデルは含めない（どのモデルの結果も同じスキーマで
+            # 検証済みなので使い回す。モデルを変えて抽出し直すなら PROMPT_VERSION を上げる）
+            _memo = ExtractionMemo(PROMPT_VERSION)
+        return _memo
+
+
+def fetch_detail_text(opp: dict) -> str | None:
+    """詳細ページを取得してテキストを返す。失敗は失敗URLキャッシュに記録する。"""
     detail_url = opp.get("detail_url")
     if not detail_url:
         return None
 
-    if detail_url in _failed_urls:
+    if failed_urls.get(detail_url):
         return None
 
+    opp_id = opp.get("id")
     try:
         resp = fetch_page(detail_url)
-        text = extract_text(resp.content, include_links=False, base_url=detail_url)
-
-        if not text or len(text.strip()) < 30:
-            logger.debug("テキスト不足: %s", detail_url)
-            _failed_urls.add(detail_url)
-            return None
-
-        result = _extract_details(text, opp)
-        return result
-
+        text = extract_text(
+            resp.content, include_links=False, base_url=detail_url,
+            max_length=config.DETAIL_TEXT_MAX_LENGTH,
+        )
     except requests.RequestException as exc:
         logger.debug("詳細ページ取得失敗 %s: %s", detail_url, exc)
-        _failed_urls.add(detail_url)
+        failed_urls.add(detail_url, negative_cache.reason_for_exception(exc), opp_id)
         return None
     except Exception as exc:
-        logger.warning("詳細抽出エラー %s: %s", detail_url, exc)
+        logger.warning("詳細ページ解析エラー %s: %s", detail_url, exc)
+        return None
+
+    if not text or len(text.strip()) < 30:
+        logger.debug("テキスト不足: %s", detail_url)
+        failed_urls.add(detail_url, negative_cache.TOO_SHORT, opp_id)
+        return None
+    return text
+
+
+def enrich_opportunity(opp: dict) -> dict | None:
+    """1件の案件の詳細ページを取得し、構造化データを抽出する。
+
+    Returns:
+        抽出結果のdict。取得失敗時はNone。
+    """
+    text = fetch_detail_text(opp)
+    if text is None:
         return None
 
+    result = _extract_details(text, opp)
+    if result is None:
+        if quota_blocked("detail_single") and opp.get("id"):
+            deferred_queue.defer(deferred_queue.DETAIL, [opp["id"]])
+        else:
+            failed_urls.add(opp["detail_url"], negative_cache.EXTRACT_FAILED, opp.get("id"))
+    return result
+
 
 def enrich_batch(
     opps: list[dict],
     batch_size: int = 10,
     delay: float = 0.5,
+    packed: bool = True,
 ) -> list[tuple[str, dict]]:
     """複数案件の詳細を一括取得する。
 
+    先に全ページを取得し、packed=True なら短いページを複数件ずつ
+    1回の Gemini 呼び出しにまとめて抽出する（extract_details_packed）。
+
     Args:
         opps: opportunitiesレコードのリスト（id, detail_url等を含む）
         batch_size: ログ出力の区切り単位
         delay: リクエスト間の待機秒数（サーバー負荷軽減）
+        packed: 複数ページをまとめて抽出するか
+
+    Gemini の quota 切れ（ブレーカーが開いている）で抽出できなかった案件は、失敗として
+    記録せず deferred_queue に積んで次回に回す。
 
     Returns:
         [(opportunity_id, details_dict), ...] のリスト。失敗分は含まない。
     """
-    # バッチ開始時に失敗URLキャッシュをクリア（前回バッチの残留を防ぐ）
-    _failed_urls.clear()
-
-    results = []
+    pages = []
     total = len(opps)
 
     for i, opp in enumerate(opps):
         if i > 0 and i % batch_size == 0:
-            logger.info("  詳細取得: %d/%d 完了 (%d 成功)", i, total, len(results))
+            logger.info("  詳細ページ取得: %d/%d 完了 (%d 成功)", i, total, len(pages))
 
-        details = enrich_opportunity(opp)
-        if details:
-            results.append((opp["id"], details))
+        text = fetch_detail_text(opp)
+        if text is not None:
+            pages.append((opp, text))
 
         if delay > 0 and i < total - 1:
             time.sleep(delay)
 
+    if packed:
+        extracted = extract_details_packed(pages)
+    else:
+        extracted = {}
+        for opp, text in pages:
+            details = _extract_details(text, opp)
+            if details:
+                extracted[opp["id"]] = details
+
+    results, deferred = [], []
+    blocked = quota_blocked("detail_pack")
+    for opp, _ in pages:
+        details = extracted.get(opp["id"])
+        if details:
+            results.append((opp["id"], details))
+        elif blocked:
+            deferred.append(opp["id"])
+        else:
+            failed_urls.add(opp["detail_url"], negative_cache.EXTRACT_FAILED, opp["id"])
+    deferred_queue.defer(deferred_queue.DETAIL, deferred)
+
     logger.info("  詳細取得完了: %d/%d 成功", len(results), total)
     return results
 
 
+def extract_details_packed(pages: list[tuple[dict, str]]) -> dict[str, dict]:
+    """複数ページをまとめて Gemini で抽出する。
+
+    推定トークンが DETAIL_PACK_PAGE_MAX_TOKENS 以下のページを、合計が
+    DETAIL_PACK_MAX_TOKENS に収まる範囲でまとめる。応答に含まれなかった
+    案件と長いページは1件ずつ抽出する。
+
+    同じ内容のページを抽出済みなら、メモ化した結果を使い Gemini を呼ばない。
+
+    Returns:
+        {opportunity_id: details_dict}。抽出できなかった案件は含まない。
+    """
+    memo = get_memo()
+    results, packs, singles = _plan_extraction(pages, memo)
+
+    for pack in packs:
+        extracted = _extract_pack(pack)
+        for opp, text in pack:
+            if opp["id"] in extracted:
+                results[opp["id"]] = extracted[opp["id"]]
+                if memo:
+                    memo.put(text, extracted[opp["id"]])
+            else:
+                singles.append((opp, text))
+
+    for opp, text in singles:
+        details = _extract_single(text, opp)
+        if details:
+            results[opp["id"]] = details
+            if memo:
+                memo.put(text, details)
+
+    return results
+
+
+def extract_details_batch(pages: list[tuple[dict, str]]) -> dict[str, dict]:
+    """extract_details_packed と同じまとめ方で、Gemini Batch API の1ジョブとして抽出する。
+
+    パック応答から漏れた案件は再投入せず、抽出失敗として次回以降に回す。
+    """
+    memo = get_memo()
+    results, packs, singles = _plan_extraction(pages, memo)
+
+    jobs = []  # (pages, parse 関数)
+    requests_by_key = {}
+    for pack in packs:
+        prompt, max_tokens, keys, local_fields = _pack_request(pack)
+        requests_by_key[str(len(jobs))] = build_request(
+            prompt, max_tokens=max_tokens, schema=_pack_schema(pack, keys),
+        )
+        jobs.append((pack, lambda r, p=pack, k=keys, lf=local_fields: _parse_pack(r, p, k, lf)))
+    for opp, text in singles:
+        prompt, missing, local = _single_request(text, opp)
+        if not missing:
+            results[opp["id"]] = _validate_details(local)
+            continue
+        requests_by_key[str(len(jobs))] = build_request(
+            prompt, max_tokens=1024, schema=_detail_schema(missing),
+        )
+        jobs.append((
+            [(opp, text)],
+            lambda r, i=opp["id"], m=missing, lo=local: {i: _parse_single(r, m, lo)},
+        ))
+
+    responses = gemini_batch.run_batch(
+        requests_by_key, display_name="koubo-detail", tag="detail_batch",
+    )
+    for key, (job_pages, parse) in enumerate(jobs):
+        response = responses.get(str(key))
+        if response is None:
+            continue
+        try:
+            extracted = parse(response)
+        except Exception as exc:
+            logger.warning("Batch API 抽出結果の解析失敗 (%d件): %s", len(job_pages), exc)
+            continue
+        for opp, text in job_pages:
+            details = extracted.get(opp["id"])
+            if details:
+                results[opp["id"]] = details
+                if memo:
+                    memo.put(text, details)
+
+    return results
+
+
+def _plan_extraction(
+    pages: list[tuple[dict, str]], memo: ExtractionMemo | None,
+) -> tuple[dict[str, dict], list[list[tuple[dict, str]]], list[tuple[dict, str]]]:
+    """メモ済み結果・複数ページのパック・単独抽出するページに振り分ける。"""
+    results = {}
+    singles = []
+    packable = []
+    for opp, text in pages:
+        cached = memo.get(text) if memo else None
+        if cached is not None:
+            results[opp["id"]] = cached
+        elif estimate_tokens(text) > config.DETAIL_PACK_PAGE_MAX_TOKENS:
+            singles.append((opp, text))
+        else:
+            packable.append((opp, text))
+
+    packs = []
+    for pack in _make_packs(packable):
+        if len(pack) == 1:
+            singles.extend(pack)
+        else:
+            packs.append(pack)
+    return results, packs, singles
+
+
+def _make_packs(pages: list[tuple[dict, str]]) -> list[list[tuple[dict, str]]]:
+    """推定トークン数に応じてページをまとめる。"""
+    packs = []
+    current = []
+    current_tokens = 0
+    for opp, text in pages:
+        tokens = estimate_tokens(text)
+        if current and (
+            current_tokens + tokens > config.DETAIL_PACK_MAX_TOKENS
+            or len(current) >= config.DETAIL_PACK_MAX_PAGES
+        ):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append((opp, text))
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def _extract_pack(pack: list[tuple[dict, str]]) -> dict[str, dict]:
+    """1パック分のページを1回の Gemini 呼び出しで抽出する。"""
+    prompt, max_tokens, keys, local_fields = _pack_request(pack)
+    try:
+        # 抽出結果はページ内容でメモ化するので、call_gemini の応答キャッシュは使わない
+        response = call_gemini(
+            prompt, max_tokens=max_tokens, priority=PRIORITY_LOW, cache=False,
+            schema=_pack_schema(pack, keys), tag="detail_pack",
+        )
+        return _parse_pack(response, pack, keys, local_fields)
+    except Exception as exc:
+        logger.warning("Gemini一括抽出失敗 (%d件): %s", len(pack), exc)
+        return {}
+
+
+def _pack_request(pack: list[tuple[dict, str]]) -> tuple[str, int, list[str], dict[str, dict]]:
+    """パックのプロンプトを組み立てる。(prompt, max_tokens, 抽出項目, {id: ルール抽出結果})"""
+    local_fields = {}
+    needed = set()
+    for opp, text in pack:
+        local = extract_fields(text)
+        local_fields[opp["id"]] = local
+        needed.update(key for key in _FIELD_SPECS if key not in local)
+    keys = [key for key in _FIELD_SPECS if key in needed]
+
+    prompt = _build_pack_prompt(pack, keys)
+    max_tokens = min(8192, config.DETAIL_PACK_OUTPUT_TOKENS * len(pack) + 256)
+    return prompt, max_tokens, keys, local_fields
+
+
+def _parse_pack(
+    response: str, pack: list[tuple[dict, str]], keys: list[str], local_fields: dict[str, dict],
+) -> dict[str, dict]:
+    """案件IDをキーにした応答を {id: details} にする。
+
+    応答に無い案件・スキーマに合わない案件は含めない（呼び出し側で1件ずつ抽出し直す）。
+    """
+    parsed = decode_json(response)
+    if not isinstance(parsed, dict):
+        return {}
+
+    check = compile_schema(_detail_schema(keys))
+    results = {}
+    for opp, _ in pack:
+        item = parsed.get(str(opp["id"]))
+        error = check(item)
+        if error:
+            logger.debug("パック応答のスキーマ不一致 %s: %s", opp["id"], error)
+            continue
+        result = {key: item.get(key) for key in keys}
+        result.update(local_fields[opp["id"]])
+        results[opp["id"]] = _validate_details(result)
+    return results
+
+
+# Gemini に抽出させる項目と指示（detail_rules で取れた項目はプロンプトから外す）
+_FIELD_SPECS = {
+    "published_date": "公告日・掲載日（YYYY-MM-DD形式）",
+    "deadline": "提出期限・入札期限・締切日（YYYY-MM-DD形式）",
+    "bid_opening_date": "入札日・開札日（YYYY-MM-DD形式）",
+    "contract_period": "契約期間・履行期間（例: 2026-04-01〜2027-03-31。開始日と終了日をYYYY-MM-DD〜YYYY-MM-DD形式で）",
+    "briefing_date": "入札説明会・現場説明会の日時（例: 2026-03-10 14:00）",
+    "budget": "予算・契約金額（例: 1,000万円、500,000円。不明ならnull）",
+    "requirements": "参加資格・応募条件（50文字以内で要約）",
+    "contact_info": "問い合わせ先の部署名・電話番号・メールアドレス（50文字以内で要約）",
+    "detailed_summary": "この案件の具体的な業務内容を200文字以内で要約",
+    "difficulty": "この案件の参入難易度を判定（高/中/低）。判定基準: 高=特殊資格・大規模実績必須、中=一般的な資格・実績で可、低=資格不要・小規模",
+    "industry_category": "以下の10カテゴリから最も適切なものを1つ選択: IT・DX / 建設・土木 / コンサル・調査 / 広告・クリエイティブ / 設備・物品 / 清掃・管理 / 医療・福祉 / 教育・研修 / 環境・エネルギー / その他",
+}
+
+_VALID_CATEGORIES = (
+    "IT・DX", "建設・土木", "コンサル・調査", "広告・クリエイティブ",
+    "設備・物品", "清掃・管理", "医療・福祉", "教育・研修",
+    "環境・エネルギー", "その他",
+)
+
+
+def _detail_schema(keys: list[str]) -> dict:
+    """1ページ分の応答スキーマ（見つからない項目は null か省略）。"""
+    properties = {}
+    for key in keys:
+        if key == "difficulty":
+            properties[key] = string(("高", "中", "低"), nullable=True)
+        elif key == "industry_category":
+            properties[key] = string(_VALID_CATEGORIES, nullable=True)
+        else:
+            properties[key] = string(nullable=True)
+    return obj(properties, required=[])
+
+
+def _pack_schema(pack: list[tuple[dict, str]], keys: list[str]) -> dict:
+    """パック応答のスキーマ（案件IDをキーにしたオブジェクト。欠けた案件は許容）。"""
+    item = _detail_schema(keys)
+    return obj({str(opp["id"]): item for opp, _ in pack}, required=[])
+
+
 def _extract_details(text: str, opp: dict) -> dict | None:
-    """Geminiで詳細ページのテキストから構造化データを抽出する。"""
-    title = opp.get("title", "")
+    """詳細ページのテキストから構造化データを抽出する（メモ化あり）。"""
+    memo = get_memo()
+    if memo:
+        cached = memo.get(text)
+        if cached is not None:
+            return cached
 
-    # テキストが長すぎる場合は切り詰め（トークン節約）
-    if len(text) > 15000:
-        text = text[:15000] + "\n...(以下省略)"
+    details = _extract_single(text, opp)
+    if details and memo:
+        memo.put(text, details)
+    return details
 
-    prompt = f"""以下は公募・入札案件の詳細ページのテキストです。
+
+def _extract_single(text: str, opp: dict) -> dict | None:
+    """1ページ分を抽出する。
+
+    まず detail_rules で定型項目（日付・金額・連絡先）を埋め、
+    残りの項目だけを Gemini に問い合わせる。
+    """
+    prompt, missing, local = _single_request(text, opp)
+    if not missing:
+        return _validate_details(local)
+
+    try:
+        # パック抽出と同じく、応答キャッシュではなくメモで再利用する
+        response = call_gemini(
+            prompt, max_tokens=1024, priority=PRIORITY_LOW, cache=False,
+            schema=_detail_schema(missing), tag="detail_single",
+        )
+        return _parse_single(response, missing, local)
+    except Exception as exc:
+        logger.warning("Gemini抽出失敗 %s: %s", opp.get("id", "?"), exc)
+        return None
+
+
+def _single_request(text: str, opp: dict) -> tuple[str, list[str], dict]:
+    """1ページ分のプロンプトを組み立てる。(prompt, 未取得の項目, ルール抽出結果)"""
+    local = extract_fields(text)
+    missing = [key for key in _FIELD_SPECS if key not in local]
+    if not missing:
+        return "", missing, local
+
+    # 長いページは抽出対象の項目に関係するセクションだけを送る（ルールは全文に適用済み）
+    text = select_sections(text, config.DETAIL_PROMPT_MAX_TOKENS, missing)
+    return _build_prompt(text, opp.get("title", ""), missing), missing, local
+
+
+def _parse_single(response: str, missing: list[str], local: dict) -> dict | None:
+    parsed = decode_json(response, _detail_schema(missing))
+    result = {key: parsed.get(key) for key in missing}
+    result.update(local)
+    return _validate_details(result)
+
+
+def _build_prompt(text: str, title: str, keys: list[str]) -> str:
+    """指定項目だけを抽出させるプロンプトを組み立てる。"""
+    spec_lines = ",\n".join(f'  "{key}": "{_FIELD_SPECS[key]}"' for key in keys)
+    return f"""以下は公募・入札案件の詳細ページのテキストです。
 案件名: {title}
 
 このページから以下の情報を抽出してJSON形式で返してください。
 見つからない項目はnullとしてください。
 
 {{
-  "published_date": "公告日・掲載日（YYYY-MM-DD形式）",
-  "deadline": "提出期限・入札期限・締切日（YYYY-MM-DD形式）",
-  "bid_opening_date": "入札日・開札日（YYYY-MM-DD形式）",
-  "contract_period": "契約期間・履行期間（例: 2026-04-01〜2027-03-31。開始日と終了日をYYYY-MM-DD〜YYYY-MM-DD形式で）",
-  "briefing_date": "入札説明会・現場説明会の日時（例: 2026-03-10 14:00）",
-  "budget": "予算・契約金額（例: 1,000万円、500,000円。不明ならnull）",
-  "requirements": "参加資格・応募条件（50文字以内で要約）",
-  "contact_info": "問い合わせ先の部署名・電話番号・メールアドレス（50文字以内で要約）",
-  "detailed_summary": "この案件の具体的な業務内容を200文字以内で要約",
-  "difficulty": "この案件の参入難易度を判定（高/中/低）。判定基準: 高=特殊資格・大規模実績必須、中=一般的な資格・実績で可、低=資格不要・小規模",
-  "industry_category": "以下の10カテゴリから最も適切なものを1つ選択: IT・DX / 建設・土木 / コンサル・調査 / 広告・クリエイティブ / 設備・物品 / 清掃・管理 / 医療・福祉 / 教育・研修 / 環境・エネルギー / その他"
+{spec_lines}
 }}
 
 ページテキスト:
 {text}"""
 
-    try:
-        response = call_gemini(prompt, json_mode=True, max_tokens=1024)
-        result = parse_json_response(response)
-
-        if not isinstance(result, dict):
-            return None
-
-        # バリデーション: 日付形式チェック（YYYY-MM-DD）
-        for date_key in ("published_date", "deadline", "bid_opening_date"):
-            val = result.get(date_key)
-            if val and (len(str(val)) != 10 or str(val).count("-") != 2):
-                result[date_key] = None
-
-        # difficulty は 高/中/低 のみ許可
-        if result.get("difficulty") not in ("高", "中", "低"):
-            result["difficulty"] = None
-
-        # industry_category バリデーション
-        valid_categories = (
-            "IT・DX", "建設・土木", "コンサル・調査", "広告・クリエイティブ",
-            "設備・物品", "清掃・管理", "医療・福祉", "教育・研修",
-            "環境・エネルギー", "その他",
-        )
-        if result.get("industry_category") not in valid_categories:
-            result["industry_category"] = "その他"
 
-        # テキストフィールドの長さ制限
-        if result.get("detailed_summary") and len(result["detailed_summary"]) > 300:
-            result["detailed_summary"] = result["detailed_summary"][:297] + "..."
-        if result.get("contact_info") and len(result["contact_info"]) > 100:
-            result["contact_info"] = result["contact_info"][:97] + "..."
-        if result.get("contract_period") and len(result["contract_period"]) > 50:
-            result["contract_period"] = result["contract_period"][:47] + "..."
-        if result.get("briefing_date") and len(result["briefing_date"]) > 50:
-            result["briefing_date"] = result["briefing_date"][:47] + "..."
+def _build_pack_prompt(pack: list[tuple[dict, str]], keys: list[str]) -> str:
+    """複数ページ分の抽出プロンプトを組み立てる（案件IDをキーに返させる）。"""
+    spec_lines = ",\n".join(f'    "{key}": "{_FIELD_SPECS[key]}"' for key in keys)
+    pages = "\n\n".join(
+        f"=== 案件ID: {opp['id']} ===\n案件名: {opp.get('title', '')}\n{text}"
+        for opp, text in pack
+    )
+    return f"""以下は公募・入札案件の詳細ページ{len(pack)}件のテキストです。
+各ページから以下の情報を抽出し、案件IDをキーにしたJSONオブジェクトで返してください。
+見つからない項目はnullとしてください。全{len(pack)}件の案件IDを必ず含めてください。
 
-        return result
+{{
+  "案件ID": {{
+{spec_lines}
+  }}
+}}
 
-    except Exception as exc:
-        logger.warning("Gemini抽出失敗 %s: %s", opp.get("id", "?"), exc)
-        return None
+{pages}"""
+
+
+def _validate_details(result: dict) -> dict:
+    """抽出結果の形式・長さをそろえる。"""
+    # バリデーション: 日付形式チェック（YYYY-MM-DD）
+    for date_key in ("published_date", "deadline", "bid_opening_date"):
+        val = result.get(date_key)
+        if val and (len(str(val)) != 10 or str(val).count("-") != 2):
+            result[date_key] = None
+
+    # difficulty は 高/中/低 のみ許可
+    if result.get("difficulty") not in ("高", "中", "低"):
+        result["difficulty"] = None
+
+    # industry_category バリデーション
+    if result.get("industry_category") not in _VALID_CATEGORIES:
+        result["industry_category"] = "その他"
+
+    # テキストフィールドの長さ制限
+    if result.get("detailed_summary") and len(result["detailed_summary"]) > 300:
+        result["detailed_summary"] = result["detailed_summary"][:297] + "..."
+    if result.get("contact_info") and len(result["contact_info"]) > 100:
+        result["contact_info"] = result["contact_info"][:97] + "..."
+    if result.get("contract_period") and len(result["contract_period"]) > 50:
+        result["contract_period"] = result["contract_period"][:47] + "..."
+    if result.get("briefing_date") and len(result["briefing_date"]) > 50:
+        result["briefing_date"] = result["briefing_date"][:47] + "..."
+
+    return result
@@ -0,0 +1,59 @@
+"""公募ナビAI - 詳細抽出結果のメモ化
+
+同じテンプレートから生成されたページや、同一本文で再掲載された案件に
+毎回 Gemini を呼ばないよう、抽出結果をページテキストのハッシュで保存する。
+
+キー: sha256(プロンプト版数 + 正規化テキスト)
+  - 正規化: NFKC + 空白の連続を1つに（取得ごとの改行・空白の揺れを吸収）
+  - プロンプトや項目定義を変えたら版数を上げ、古い結果を使わないようにする
+
+保存は local_store.LruStore（EXTRACTION_MEMO_TTL 秒で期限切れ、圧縮後の合計サイズが
+EXTRACTION_MEMO_MAX_BYTES を超えたら最後に使った時刻の古い順に削除）。
+"""
+
+import hashlib
+import json
+import re
+import time
+import unicodedata
+
+import config
+from local_store import LruStore
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def content_key(text: str, prompt_version: str) -> str:
+    normalized = _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+    return hashlib.sha256(f"{prompt_version}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+class ExtractionMemo:
+    """ページ内容ハッシュ → 抽出結果 のストア（スレッドセーフ）。"""
+
+    def __init__(
+        self,
+        prompt_version: str,
+        path: str = "extraction_memo.db",
+        ttl: int = config.EXTRACTION_MEMO_TTL,
+        max_bytes: int = config.EXTRACTION_MEMO_MAX_BYTES,
+    ):
+        self.prompt_version = prompt_version
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {"hit": 0, "miss": 0, "evicted": 0}
+        self._store = LruStore(path, "extraction_memo", max_bytes, self.stats)
+
+    def get(self, text: str) -> dict | None:
+        """有効な抽出結果があれば返す（期限切れは削除してミス扱い）。"""
+        entry = self._store.get(content_key(text, self.prompt_version))
+        return json.loads(entry.value) if entry is not None else None
+
+    def put(self, text: str, details: dict):
+        expires_at = time.time() + self.ttl if self.ttl else 0
+        body = json.dumps(details, ensure_ascii=False).encode("utf-8")
+        self._store.put(content_key(text, self.prompt_version), body, expires_at)
+
+    def hit_rate(self) -> float:
+        total = self.stats["hit"] + self.stats["miss"]
+        return self.stats["hit"] / total if total else 0.0
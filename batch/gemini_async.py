@@ -0,0 +1,105 @@
+"""公募ナビAI - Gemini の非同期クライアント
+
+通知の AI 分析・マッチングのバッチ・業種分類のバッチは互いに独立しているのに、
+これまでは1件ずつ応答を待っていた。asyncio で同時に投げ、待ち時間を重ねる。
+
+- 呼び出しは gemini_client の同期関数（レートリミッター・応答キャッシュ・
+  共有セッションの接続プール込み）を専用スレッドプールで実行する
+- 同時実行数は Semaphore で GEMINI_CONCURRENCY 本までに抑える
+- タスクをキャンセルすると、枠待ちのものは送信せずに終わる
+  （送信済みの HTTP 要求は完了まで走り、結果は捨てられる）
+
+Usage:
+    async def run():
+        async with AsyncGemini() as client:
+            return await client.gather(client.call(p) for p in prompts)
+
+    results = asyncio.run(run())
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+import config
+from gemini_client import call_gemini, generate_json
+from rate_limiter import PRIORITY_NORMAL
+
+T = TypeVar("T")
+
+
+class AsyncGemini:
+    """同時実行数を制限した Gemini 呼び出し（async with で使い、抜けるとスレッドを片付ける）。"""
+
+    def __init__(self, concurrency: int | None = None):
+        self.concurrency = concurrency or config.GEMINI_CONCURRENCY
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="gemini-async",
+        )
+
+    async def __aenter__(self) -> "AsyncGemini":
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # 実行中の呼び出しは待たない（キャンセル時に抜けられるように）
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """任意の同期関数（stream_gemini を使う関数など）を枠内で実行する。"""
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs),
+            )
+
+    async def call(
+        self,
+        prompt: str,
+        json_mode: bool = True,
+        max_tokens: int = 8192,
+        priority: int = PRIORITY_NORMAL,
+        cache: bool = True,
+        schema: dict | None = None,
+        tag: str = "other",
+        prefix: str | None = None,
+        models: tuple[str, ...] | None = None,
+        hedge: bool = False,
+    ) -> str:
+        """call_gemini と同じ引数・戻り値の非同期版。"""
+        return await self.run(
+            call_gemini, prompt, json_mode=json_mode, max_tokens=max_tokens, priority=priority,
+            cache=cache, schema=schema, tag=tag, prefix=prefix, models=models, hedge=hedge,
+        )
+
+    async def generate_json(
+        self,
+        prompt: str,
+        schema: dict,
+        max_tokens: int = 8192,
+        priority: int = PRIORITY_NORMAL,
+        cache: bool = True,
+        tag: str = "other",
+        prefix: str | None = None,
+        models: tuple[str, ...] | None = None,
+        hedge: bool = False,
+        check_schema: dict | None = None,
+    ):
+        """generate_json の非同期版。"""
+        return await self.run(
+            generate_json, prompt, schema, max_tokens=max_tokens, priority=priority,
+            cache=cache, tag=tag, prefix=prefix, models=models, hedge=hedge,
+            check_schema=check_schema,
+        )
+
+    @staticmethod
+    async def gather(aws: Iterable[Awaitable[T]]) -> list[T | BaseException]:
+        """全件を同時に待ち、入力順に結果を返す（失敗した呼び出しは例外オブジェクト）。
+
+        呼び出し側がキャンセルされた場合は残りのタスクもすべてキャンセルされる。
+        """
+        return await asyncio.gather(*aws, return_exceptions=True)
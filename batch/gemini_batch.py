@@ -0,0 +1,188 @@
+"""公募ナビAI - Gemini Batch API による一括実行
+
+数万件規模の分類・詳細抽出を同期の generateContent で流すとオンライン quota に
+律速されるため、Batch API（非同期ジョブ）で実行するモードを提供する。
+
+流れ:
+  1. リクエストを JSONL（1行 = {"key", "request"}）にして Files API へアップロード
+  2. models/{model}:batchGenerateContent でジョブを作成
+  3. batches/{id} を完了までポーリング
+  4. 結果ファイル（1行 = {"key", "response" | "error"}）をダウンロードして key ごとに返す
+
+GEMINI_API_BASE を mock_gemini_server.py に向ければローカルで試せる。
+"""
+
+import json
+import logging
+import time
+from typing import Iterator
+
+import requests
+
+import config
+from gemini_client import api_headers, response_text, route
+from usage import get_tracker
+
+logger = logging.getLogger(__name__)
+
+_DONE_STATES = ("SUCCEEDED", "FAILED", "CANCELLED", "EXPIRED")
+
+
+class BatchJobError(RuntimeError):
+    """ジョブが成功以外で終了した、または待ち時間を超えた。"""
+
+
+def run_batch(
+    requests_by_key: dict[str, dict],
+    display_name: str = "koubo-batch",
+    poll_interval: float | None = None,
+    timeout: float | None = None,
+    tag: str | None = None,
+    model: str | None = None,
+) -> dict[str, str | None]:
+    """リクエスト群を1ジョブとして実行し、key ごとの応答テキストを返す。
+
+    Args:
+        requests_by_key: {key: generateContent のリクエスト本文（build_request の戻り値）}
+        tag: 使用量集計のタグ（省略時は display_name。単価は Batch API の割引後で見積もる）
+        model: 実行するモデル（省略時は tag の経路の先頭。ジョブ単位なので切り替えはしない）
+
+    Returns:
+        {key: 応答テキスト}。個別に失敗したリクエストは None。
+    """
+    if not requests_by_key:
+        return {}
+    tag = tag or display_name
+    model = model or route(tag)[0]
+    file_name = upload_requests(requests_by_key, display_name)
+    job_name = create_job(file_name, display_name, model)
+    logger.info("Batch API ジョブ作成: %s (%d件)", job_name, len(requests_by_key))
+    job = wait_for_job(
+        job_name,
+        poll_interval or config.GEMINI_BATCH_POLL_INTERVAL,
+        timeout or config.GEMINI_BATCH_TIMEOUT,
+    )
+
+    tracker = get_tracker()
+    results: dict[str, str | None] = {key: None for key in requests_by_key}
+    for key, data in iter_results(job):
+        if key not in results:
+            continue
+        tracker.record(
+            tag, model, data.get("usageMetadata"),
+            finish_reason=(data.get("candidates") or [{}])[0].get("finishReason"), batch=True,
+        )
+        try:
+            results[key] = response_text(data)
+        except (KeyError, IndexError, ValueError):
+            logger.debug("Batch API 応答の形式不正 %s", key)
+    missing = sum(1 for v in results.values() if v is None)
+    logger.info("Batch API ジョブ完了: %s 成功=%d, 失敗=%d", job_name, len(results) - missing, missing)
+    return results
+
+
+def upload_requests(requests_by_key: dict[str, dict], display_name: str) -> str:
+    """JSONL を Files API にアップロード（resumable）し、files/... の名前を返す。"""
+    body = "\n".join(
+        json.dumps({"key": key, "request": req}, ensure_ascii=False)
+        for key, req in requests_by_key.items()
+    ).encode("utf-8")
+
+    headers = api_headers()
+    headers.update({
+        "X-Goog-Upload-Protocol": "resumable",
+        "X-Goog-Upload-Command": "start",
+        "X-Goog-Upload-Header-Content-Length": str(len(body)),
+        "X-Goog-Upload-Header-Content-Type": "application/jsonl",
+    })
+    resp = requests.post(
+        f"{config.GEMINI_API_BASE}/upload/v1beta/files",
+        headers=headers,
+        json={"file": {"display_name": display_name}},
+        timeout=60,
+    )
+    resp.raise_for_status()
+    upload_url = resp.headers["X-Goog-Upload-URL"]
+
+    resp = requests.post(
+        upload_url,
+        headers={
+            "Content-Length": str(len(body)),
+            "X-Goog-Upload-Offset": "0",
+            "X-Goog-Upload-Command": "upload, finalize",
+        },
+        data=body,
+        timeout=300,
+    )
+    resp.raise_for_status()
+    return resp.json()["file"]["name"]
+
+
+def create_job(file_name: str, display_name: str, model: str | None = None) -> str:
+    """アップロード済みファイルを入力にジョブを作成し、batches/... の名前を返す。"""
+    resp = requests.post(
+        f"{config.GEMINI_ENDPOINT}/{model or config.GEMINI_MODEL}:batchGenerateContent",
+        headers=api_headers(),
+        json={"batch": {"display_name": display_name, "input_config": {"file_name": file_name}}},
+        timeout=60,
+    )
+    resp.raise_for_status()
+    return resp.json()["name"]
+
+
+def job_state(job: dict) -> str:
+    """ジョブの状態（SUCCEEDED / RUNNING 等。BATCH_STATE_ / JOB_STATE_ 接頭辞は除く）。"""
+    state = job.get("metadata", {}).get("state") or job.get("state") or ""
+    return state.rsplit("_STATE_", 1)[-1]
+
+
+def wait_for_job(job_name: str, poll_interval: float, timeout: float) -> dict:
+    """完了までポーリングし、成功したジョブを返す。"""
+    deadline = time.monotonic() + timeout
+    while True:
+        resp = requests.get(
+            f"{config.GEMINI_API_BASE}/v1beta/{job_name}", headers=api_headers(), timeout=60,
+        )
+        resp.raise_for_status()
+        job = resp.json()
+        state = job_state(job)
+        if state in _DONE_STATES:
+            if state != "SUCCEEDED":
+                raise BatchJobError(f"Batch API ジョブ {job_name} が {state} で終了")
+            return job
+        if time.monotonic() > deadline:
+            raise BatchJobError(f"Batch API ジョブ {job_name} が {timeout:.0f}秒で完了せず")
+        logger.info("  Batch API ジョブ待機中: %s (%s)", job_name, state or "PENDING")
+        time.sleep(poll_interval)
+
+
+def iter_results(job: dict) -> Iterator[tuple[str, dict]]:
+    """完了ジョブの結果を (key, GenerateContentResponse) で順に返す。
+
+    結果ファイルを行単位でストリーミングし、エラー行は読み飛ばす。
+    """
+    output = job.get("response") or job.get("metadata", {}).get("output") or {}
+    file_name = output.get("responsesFile")
+    if not file_name:
+        # 少量ジョブは結果がインラインで返る
+        for item in output.get("inlinedResponses", {}).get("inlinedResponses", []):
+            if "response" in item:
+                yield item.get("metadata", {}).get("key", ""), item["response"]
+        return
+
+    with requests.get(
+        f"{config.GEMINI_API_BASE}/download/v1beta/{file_name}:download",
+        params={"alt": "media"},
+        headers=api_headers(),
+        stream=True,
+        timeout=300,
+    ) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines(decode_unicode=False):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "response" in item:
+                yield item.get("key", ""), item["response"]
+            else:
+                logger.debug("Batch API 個別失敗 %s: %s", item.get("key"), item.get("error"))
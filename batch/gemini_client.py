@@ -1,73 +1,585 @@
 """公募ナビAI - Gemini API クライアント（バッチ用）"""
 
+import functools
 import json
 import logging
 import re
+import threading
 import time
+from typing import Iterator
 
 import requests
 
 import config
+from context_cache import ContextCache
+from hedging import Hedger
+from key_pool import ApiKey, KeyPool
+from quota_breaker import CircuitOpenError, QuotaBreaker, QuotaError
+from rate_limiter import PRIORITY_NORMAL
+from response_cache import ResponseCache, cache_key
+from response_schema import validate
+from single_flight import SingleFlight
+from usage import get_tracker
 
 logger = logging.getLogger(__name__)
 
 _MAX_RETRIES = 3
-_RETRY_BASE_WAIT = 30  # 429発生時の初回待機秒数（指数バックオフ）
+_RETRY_BASE_WAIT = 30  # 429発生時の初回停止秒数（Retry-After が無い場合。指数バックオフ）
 
+_key_pool: KeyPool | None = None
+_key_pool_lock = threading.Lock()
+_cache: ResponseCache | None = None
+_cache_lock = threading.Lock()
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+_context_cache: ContextCache | None = None
+_context_cache_lock = threading.Lock()
+_single_flight: SingleFlight | None = None
+_single_flight_lock = threading.Lock()
+_hedger: Hedger | None = None
+_hedger_lock = threading.Lock()
+_quota_breaker: QuotaBreaker | None = None
+_quota_breaker_lock = threading.Lock()
 
-def call_gemini(prompt: str, json_mode: bool = True, max_tokens: int = 8192) -> str:
+
+def get_session() -> requests.Session:
+    """プロセス共通の HTTP セッション（Keep-Alive の接続を GEMINI_CONCURRENCY 本まで再利用）。"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=2, pool_maxsize=config.GEMINI_CONCURRENCY,
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def get_key_pool() -> KeyPool:
+    """プロセス共通の APIキープール（キーごとのレートリミッター。初回呼び出し時に作成）。"""
+    global _key_pool
+    with _key_pool_lock:
+        if _key_pool is None:
+            _key_pool = KeyPool(
+                config.GEMINI_API_KEYS, config.GEMINI_RPM, config.GEMINI_TPM,
+                config.GEMINI_LIMITER_DB or None,
+            )
+        return _key_pool
+
+
+def get_response_cache() -> ResponseCache | None:
+    """応答キャッシュ（初回呼び出し時に開く。無効設定なら None）。"""
+    global _cache
+    if not config.GEMINI_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def get_context_cache() -> ContextCache | None:
+    """コンテキストキャッシュ（初回呼び出し時に作成。無効設定なら None）。"""
+    global _context_cache
+    if not config.GEMINI_CONTEXT_CACHE_ENABLED:
+        return None
+    with _context_cache_lock:
+        if _context_cache is None:
+            _context_cache = ContextCache()
+        return _context_cache
+
+
+def get_single_flight() -> SingleFlight | None:
+    """送信中の同一リクエストをまとめる層（無効設定なら None）。"""
+    global _single_flight
+    if not config.GEMINI_SINGLE_FLIGHT_ENABLED:
+        return None
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
+
+
+def get_hedger() -> Hedger:
+    """ヘッジ（hedge=True の呼び出し用。初回呼び出し時に作成）。"""
+    global _hedger
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger()
+        return _hedger
+
+
+def get_quota_breaker() -> QuotaBreaker:
+    """モデルごとの quota ブレーカー（初回呼び出し時に作成）。"""
+    global _quota_breaker
+    with _quota_breaker_lock:
+        if _quota_breaker is None:
+            _quota_breaker = QuotaBreaker()
+        return _quota_breaker
+
+
+def quota_blocked(tag: str) -> bool:
+    """tag の経路のモデルがすべて quota 切れでブレーカーが開いているか。
+
+    True なら今その処理を実行しても失敗するだけなので、deferred_queue に積んで後回しにする。
+    """
+    return get_quota_breaker().all_open(route(tag))
+
+
+def route(tag: str) -> tuple[str, ...]:
+    """呼び出し箇所（tag）のモデル（優先順。config.GEMINI_ROUTES）。"""
+    return tuple(config.GEMINI_ROUTES.get(tag) or (config.GEMINI_MODEL,))
+
+
+def call_gemini(
+    prompt: str,
+    json_mode: bool = True,
+    max_tokens: int = 8192,
+    priority: int = PRIORITY_NORMAL,
+    cache: bool = True,
+    schema: dict | None = None,
+    tag: str = "other",
+    prefix: str | None = None,
+    models: tuple[str, ...] | None = None,
+    hedge: bool = False,
+) -> str:
     """Gemini API を呼び出してテキスト応答を返す。
 
-    429 レート制限エラー時は指数バックオフで最大3回リトライする。
+    モデルは tag の経路（route）を先頭から使い、quota 切れ（429）や 5xx なら次のモデルへ
+    切り替える。models を渡すと経路の代わりにそれを使う。
+    呼び出し前にプロセス共通のレートリミッターで RPM/TPM の枠を取る
+    （priority が小さいほど先に通る）。切り替え先が無いモデルの 429 はリミッター全体を
+    止めてから並び直し、最大3回リトライする。
+    cache=True なら同じモデル・生成設定・プロンプトの応答をキャッシュから返す（途中で終わった
+    応答（finishReason が STOP 以外）はキャッシュしない）。
+    cache に関係なく、同じ呼び出しが別スレッドで送信中ならその応答を共有する（single_flight）。
+    schema を渡すと responseSchema として送り、出力形式を拘束する（generate_json 参照）。
+    トークン数・レイテンシ・リトライ・finishReason は tag（呼び出し箇所）とモデルごとに usage へ記録する。
+    モデルの quota 切れが続く（日次 quota なら1回）とブレーカーが開き、そのモデルへは
+    待たずに QuotaError（CircuitOpenError）となる（quota_breaker 参照）。
+    prefix は複数回の呼び出しで共通の前置き。prompt の前に置かれ、十分長ければ
+    cachedContents として一度だけ登録して参照する（context_cache 参照）。
+    hedge=True なら tag の p95 を過ぎても応答がないとき同じリクエストをもう1本送り、
+    先に返った方を使う（hedging 参照。ユーザーに届く処理のテールレイテンシ対策）。
     APIキーはURLクエリパラメータではなく x-goog-api-key ヘッダーで送信する。
     """
-    url = f"{config.GEMINI_ENDPOINT}/{config.GEMINI_MODEL}:generateContent"
+    text, _ = _call_routed(
+        prompt, json_mode, max_tokens, priority, cache, schema, tag, prefix,
+        models or route(tag), hedge,
+    )
+    return text
+
+
+def _call_routed(
+    prompt: str,
+    json_mode: bool,
+    max_tokens: int,
+    priority: int,
+    cache: bool,
+    schema: dict | None,
+    tag: str,
+    prefix: str | None,
+    models: tuple[str, ...],
+    hedge: bool = False,
+) -> tuple[str, str]:
+    """models を先頭から試し、(応答テキスト, 応答したモデル) を返す。"""
+    full_prompt = (prefix or "") + prompt
+    response_cache = get_response_cache() if cache else None
+    gen_config = build_request("", json_mode, max_tokens, schema)["generationConfig"]
+    if response_cache is not None:
+        cached = response_cache.get(cache_key(models[0], gen_config, full_prompt))
+        if cached is not None:
+            get_tracker().record(tag, models[0], cache_hit=True)
+            return cached, models[0]
+
+    def send() -> tuple[str, str]:
+        for i, model in enumerate(models):
+            try:
+                text, finish_reason = _call_model(
+                    model, prompt, prefix, json_mode, max_tokens, schema, priority, tag,
+                    fallback=i + 1 < len(models),
+                )
+            except Exception as exc:
+                _fall_back(tag, models, i, exc)
+                continue
+            # 出力上限などで途中で終わった応答はキャッシュしない（次回は呼び直す）
+            if response_cache is not None and finish_reason == "STOP":
+                response_cache.put(cache_key(model, gen_config, full_prompt), text)
+            return text, model
+
+    if hedge:
+        send = functools.partial(get_hedger().run, tag, send)
+    flights = get_single_flight()
+    if flights is None:
+        return send()
+    # 経路・生成設定・プロンプトが同じ呼び出しが送信中なら、その応答を待って共有する
+    return flights.do(cache_key(",".join(models), gen_config, full_prompt), send)
+
+
+def _call_model(
+    model: str,
+    prompt: str,
+    prefix: str | None,
+    json_mode: bool,
+    max_tokens: int,
+    schema: dict | None,
+    priority: int,
+    tag: str,
+    fallback: bool,
+) -> tuple[str, str | None]:
+    """1モデルへの generateContent（使用量の記録込み）。(応答テキスト, finishReason) を返す。"""
+    url = f"{config.GEMINI_ENDPOINT}/{model}:generateContent"
+    payload = _build_with_prefix(prompt, prefix, json_mode, max_tokens, schema, model)
+    started = time.monotonic()
+    try:
+        resp, retries = _post(
+            url, model, payload, estimate_tokens((prefix or "") + prompt), priority,
+            fallback=fallback,
+        )
+    except CircuitOpenError:
+        raise  # 送信していないので使用量には数えない
+    except Exception:
+        get_tracker().record(tag, model, latency=time.monotonic() - started, error=True)
+        raise
+    data = resp.json()
+    finish_reason = _finish_reason(data)
+    get_tracker().record(
+        tag, model, data.get("usageMetadata"),
+        latency=time.monotonic() - started, retries=retries, finish_reason=finish_reason,
+    )
+    return response_text(data), finish_reason
+
+
+def _fall_back(tag: str, models: tuple[str, ...], index: int, exc: Exception):
+    """models[index] の失敗で次のモデルへ切り替えてよいか判断する（だめなら exc を送出）。
+
+    切り替えるのは quota 切れ（429）と 5xx（過負荷など）だけ。4xx はリクエスト自体の
+    問題なので、どのモデルでも同じく失敗する。
+    """
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    retryable = isinstance(exc, QuotaError) or (
+        isinstance(exc, requests.HTTPError) and status is not None and status >= 500
+    )
+    if index + 1 >= len(models) or not retryable:
+        raise exc
+    if isinstance(exc, CircuitOpenError):
+        logger.debug(
+            "Gemini %s はブレーカー作動中のため %s を使う [%s]", models[index], models[index + 1], tag,
+        )
+        return
+    logger.warning("Gemini %s → %s に切り替え [%s]: %s", models[index], models[index + 1], tag, exc)
+    get_tracker().record_fallback(tag, models[index])
+
+
+def generate_json(
+    prompt: str,
+    schema: dict,
+    max_tokens: int = 8192,
+    priority: int = PRIORITY_NORMAL,
+    cache: bool = True,
+    tag: str = "other",
+    prefix: str | None = None,
+    models: tuple[str, ...] | None = None,
+    hedge: bool = False,
+    check_schema: dict | None = None,
+):
+    """responseSchema 付きで呼び出し、スキーマ検証済みの JSON を返す。
+
+    形式が合わない応答（出力上限での途切れ等）は1回だけ呼び直す。呼び直しは経路の
+    次のモデルで行う（最後のモデルならそのモデルのまま）。
+    キャッシュから返った不正な応答はキャッシュから消す。
+
+    check_schema を渡すと、手元の検証はそちらで行う（API に送る schema より緩め、
+    enum 外の値などを呼び出し側で1件ずつ直したいとき）。
+    """
+    models = tuple(models or route(tag))
+    gen_config = build_request("", True, max_tokens, schema)["generationConfig"]
+    for attempt in range(2):
+        use_cache = cache and attempt == 0
+        text, model = _call_routed(
+            prompt, True, max_tokens, priority, use_cache, schema, tag, prefix, models, hedge,
+        )
+        try:
+            return decode_json(text, check_schema or schema)
+        except ValueError as exc:  # JSONDecodeError / SchemaError
+            logger.warning(
+                "Gemini 応答がスキーマ不一致 (%s, attempt %d/2): %s", model, attempt + 1, exc,
+            )
+            error = exc
+            get_tracker().record_invalid(tag, model)
+            response_cache = get_response_cache() if use_cache else None
+            if response_cache is not None:
+                response_cache.delete(cache_key(model, gen_config, (prefix or "") + prompt))
+            models = models[models.index(model) + 1:] or (model,)
+    raise error
+
+
+def decode_json(text: str, schema: dict | None = None):
+    """応答テキストを JSON として読み、schema があれば検証する。
+
+    responseSchema で拘束した応答はそのまま json.loads できる前提で、
+    修復（parse_json_response）は出力が途中で切れた場合の保険としてのみ使う。
+    """
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        value = parse_json_response(text)
+    if schema is not None:
+        validate(value, schema)
+    return value
+
+
+def stream_gemini(
+    prompt: str,
+    json_mode: bool = True,
+    max_tokens: int = 8192,
+    priority: int = PRIORITY_NORMAL,
+    schema: dict | None = None,
+    tag: str = "other",
+    prefix: str | None = None,
+    models: tuple[str, ...] | None = None,
+) -> Iterator[str]:
+    """streamGenerateContent（SSE）で応答テキストを断片ごとに返す。
+
+    レート制限・429・モデルの切り替えは call_gemini と同じ。ただし切り替えは
+    応答が始まる前だけで、断片を返し始めたあとはそのモデルで最後まで読む。
+    応答キャッシュは使わない。
+    途中で接続が切れた場合は、それまでの断片を返したあと例外を送出する。
+    使用量は最後のチャンクの usageMetadata で記録する（レイテンシは最後の断片まで）。
+    prefix の扱いは call_gemini と同じ。
+    """
+    models = tuple(models or route(tag))
+    prompt_tokens = estimate_tokens((prefix or "") + prompt)
+    for i, model in enumerate(models):
+        url = f"{config.GEMINI_ENDPOINT}/{model}:streamGenerateContent?alt=sse"
+        payload = _build_with_prefix(prompt, prefix, json_mode, max_tokens, schema, model)
+        started = time.monotonic()
+        try:
+            resp, retries = _post(
+                url, model, payload, prompt_tokens, priority,
+                stream=True, fallback=i + 1 < len(models),
+            )
+            break
+        except Exception as exc:
+            if not isinstance(exc, CircuitOpenError):
+                get_tracker().record(tag, model, latency=time.monotonic() - started, error=True)
+            _fall_back(tag, models, i, exc)
+
+    usage, finish_reason, failed = None, None, True
+    try:
+        with resp:
+            # SSE は UTF-8 固定。charset のない text/event-stream を requests は ISO-8859-1 と見なす
+            resp.encoding = "utf-8"
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:])
+                usage = data.get("usageMetadata") or usage
+                finish_reason = _finish_reason(data) or finish_reason
+                # 最終チャンクは finishReason・usageMetadata だけで本文がないことがある
+                for candidate in data.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            yield part["text"]
+        failed = False
+    except GeneratorExit:
+        failed = False  # 呼び出し側が必要な分を読み終えて閉じた
+        raise
+    finally:
+        get_tracker().record(
+            tag, model, usage, latency=time.monotonic() - started,
+            retries=retries, finish_reason=finish_reason, error=failed,
+        )
+
+
+def _post(
+    url: str,
+    model: str,
+    payload: dict,
+    prompt_tokens: int,
+    priority: int,
+    stream: bool = False,
+    fallback: bool = False,
+) -> tuple[requests.Response, int]:
+    """キープールから枠の空いたキーを選んで POST する（429 は最大3回リトライ）。
+
+    429 を受けたキーはそのキーのリミッターごと止める。ほかに空いたキーがあれば
+    すぐそちらで再送し、なければ fallback=True（切り替え先のモデルがある）なら
+    待たずに QuotaError を送出する。どちらでもなければ停止が明けるのを待って再送する。
+    ただし日次 quota 切れの 429 は待っても戻らないので、空いたキーがなければすぐ送出する。
+    空いたキーのない 429 は model の quota ブレーカーに数え、開いていれば送信も待機もせず
+    CircuitOpenError を送出する。
+    cachedContent を参照するリクエストは、キャッシュを作った primary キーで送る。
+
+    Returns:
+        (応答, 429 で再試行した回数)
+    """
+    pool = get_key_pool()
+    breaker = get_quota_breaker()
+    pinned = pool.primary if payload.get("cachedContent") else None
+
+    probe = False  # ブレーカーの試しの1本（別キーでの再送も試しの1本のまま送る）
+    for attempt in range(_MAX_RETRIES):
+        if not probe:
+            probe = breaker.check(model)
+        key = pool.acquire(prompt_tokens, priority, pinned)
+        if not probe:
+            # 枠を待つ間にほかの呼び出しがブレーカーを開いたかもしれない
+            probe = breaker.check(model)
+        resp = get_session().post(
+            url, headers=api_headers(key), json=payload,
+            timeout=config.GEMINI_TIMEOUT, stream=stream,
+        )
+
+        if resp.status_code == 429:
+            daily = _daily_quota(resp)
+            wait = _retry_after(resp) or _RETRY_BASE_WAIT * (2 ** attempt)
+            resp.close()
+            if not daily:
+                # レート制限: そのキーの全呼び出しをまとめて止め、再開後にキューへ並び直す。
+                # 日次 quota はモデルごとで待っても戻らないので、キーは止めずにブレーカーで止める
+                pool.rate_limited(key, wait)
+            if not pinned and pool.available(exclude=key):
+                logger.info("Gemini rate limit (429) on %s. 別のキーで再送", key.label)
+                continue
+            breaker.failure(model, daily)
+            probe = False
+            if daily:
+                raise QuotaError(f"Gemini API: {model} の日次 quota 切れ", daily=True)
+            if fallback:
+                raise QuotaError("Gemini API: 429（別モデルへ切り替え）")
+            logger.warning(
+                "Gemini rate limit (429) on %s. %d秒停止 (attempt %d/%d)",
+                key.label, wait, attempt + 1, _MAX_RETRIES,
+            )
+            continue
+
+        # 5xx・4xx は quota と無関係なので、キーの 429 の連続もブレーカーも戻さない
+        resp.raise_for_status()
+        pool.succeeded(key)
+        breaker.success(model)
+        return resp, attempt
+
+    raise QuotaError(f"Gemini API: {_MAX_RETRIES}回リトライ後も429")
+
+
+def build_request(
+    prompt: str,
+    json_mode: bool = True,
+    max_tokens: int = 8192,
+    schema: dict | None = None,
+    cached_content: str | None = None,
+) -> dict:
+    """generateContent のリクエスト本文（Batch API の各行にも使う）。
 
+    cached_content（cachedContents/...）を渡すと、その内容が prompt の前に置かれる。
+    """
     gen_config = {
         "temperature": 0.2,
         "maxOutputTokens": max_tokens,
     }
-    if json_mode:
+    if json_mode or schema is not None:
         gen_config["responseMimeType"] = "application/json"
+    if schema is not None:
+        gen_config["responseSchema"] = schema
 
     payload = {
-        "contents": [{"parts": [{"text": prompt}]}],
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
         "generationConfig": gen_config,
     }
+    if cached_content:
+        payload["cachedContent"] = cached_content
+    return payload
+
+
+def _build_with_prefix(
+    prompt: str,
+    prefix: str | None,
+    json_mode: bool,
+    max_tokens: int,
+    schema: dict | None,
+    model: str | None = None,
+) -> dict:
+    """prefix をコンテキストキャッシュで参照する（使えなければ本文に連結する）リクエスト。
 
-    headers = {
-        "x-goog-api-key": config.GEMINI_API_KEY,
+    cachedContents はモデルごとなので、送信先の model で引く。
+    """
+    context_cache = get_context_cache() if prefix else None
+    name = context_cache.get(prefix, estimate_tokens(prefix), model) if context_cache else None
+    if name:
+        return build_request(prompt, json_mode, max_tokens, schema, cached_content=name)
+    return build_request((prefix or "") + prompt, json_mode, max_tokens, schema)
+
+
+def api_headers(key: ApiKey | None = None) -> dict:
+    """送信ヘッダー（key 省略時は primary キー。ファイル・ジョブ・キャッシュの操作用）。"""
+    return {
+        "x-goog-api-key": (key or get_key_pool().primary).api_key,
         "Content-Type": "application/json",
     }
 
-    for attempt in range(_MAX_RETRIES):
-        resp = requests.post(url, headers=headers, json=payload, timeout=120)
 
-        if resp.status_code == 429:
-            # レート制限: 指数バックオフで待機してリトライ
-            wait = _RETRY_BASE_WAIT * (2 ** attempt)
-            logger.warning(
-                "Gemini rate limit (429). %d秒待機 (attempt %d/%d)",
-                wait, attempt + 1, _MAX_RETRIES,
-            )
-            time.sleep(wait)
-            continue
+def response_text(data: dict) -> str:
+    """GenerateContentResponse から応答テキストを取り出す。"""
+    candidates = data.get("candidates", [])
+    if not candidates:
+        raise ValueError("Gemini returned no candidates")
+    return candidates[0]["content"]["parts"][0]["text"]
+
+
+def _finish_reason(data: dict) -> str | None:
+    candidates = data.get("candidates") or [{}]
+    return candidates[0].get("finishReason")
+
+
+def _retry_after(resp: requests.Response) -> float | None:
+    """429 応答の待機指示（Retry-After ヘッダー / RetryInfo.retryDelay）を秒で返す。"""
+    header = resp.headers.get("Retry-After")
+    if header and header.isdigit():
+        return float(header)
+    try:
+        details = resp.json().get("error", {}).get("details", [])
+    except ValueError:
+        return None
+    for detail in details:
+        delay = str(detail.get("retryDelay", ""))
+        if delay.endswith("s"):
+            try:
+                return float(delay[:-1])
+            except ValueError:
+                pass
+    return None
 
-        resp.raise_for_status()
-        data = resp.json()
 
-        candidates = data.get("candidates", [])
-        if not candidates:
-            raise ValueError("Gemini returned no candidates")
+def _daily_quota(resp: requests.Response) -> bool:
+    """429 応答が日次 quota 切れか（QuotaFailure の quotaId が ...PerDay...）。
 
-        text = candidates[0]["content"]["parts"][0]["text"]
-        return text
+    分単位のレート制限は待てば戻るが、日次 quota は翌日（太平洋時間の0時）まで戻らない。
+    """
+    try:
+        details = resp.json().get("error", {}).get("details", [])
+    except ValueError:
+        return False
+    for detail in details:
+        for violation in detail.get("violations", []):
+            if "PerDay" in str(violation.get("quotaId", "")):
+                return True
+    return False
 
-    raise RuntimeError(f"Gemini API: {_MAX_RETRIES}回リトライ後も429")
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（日本語は1文字≒1トークン、ASCIIは4文字≒1トークン）。"""
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return (len(text) - ascii_chars) + ascii_chars // 4 + 1
 
 
 def parse_json_response(text: str):
-    """Gemini の応答から JSON をパースする。マークダウンコードブロックにも対応。"""
+    """Gemini の応答から JSON をパースする。マークダウンコードブロックにも対応。
+
+    そのままパースできなければ途切れた出力とみなして修復し、それも失敗したら
+    最後に完結した要素までで切り詰めたものを返す。
+    """
     text = text.strip()
     if text.startswith("```"):
         lines = text.split("\n")
@@ -77,66 +589,112 @@ def parse_json_response(text: str):
         text = "\n".join(lines[1:end])
     try:
         return json.loads(text)
-    except json.JSONDecodeError:
+    except json.JSONDecodeError as exc:
+        error = exc
+    # 前置きの文章があれば最初の { / [ から読む
+    starts = [i for i in (text.find("{"), text.find("[")) if i > 0]
+    if starts and text[0] not in "{[":
+        text = text[min(starts):]
+    repaired, salvaged = _repair_json(text)
+    for candidate in (repaired, salvaged):
+        if candidate is None:
+            continue
         try:
-            repaired = _repair_json(text)
-            return json.loads(repaired)
+            return json.loads(candidate)
         except json.JSONDecodeError:
-            # 最終手段: テキスト内の最初の { } ブロックを抽出
-            match = re.search(r"\{.*\}", text, re.DOTALL)
-            if match:
-                return json.loads(match.group())
-            raise
+            pass
+    raise error
 
 
-def _count_unbalanced(text: str, open_char: str, close_char: str) -> int:
-    """文字列リテラルの外側にある未閉じの open_char の個数を返す。"""
-    count = 0
-    in_string = False
-    escaped = False
-    for ch in text:
-        if escaped:
-            escaped = False
-            continue
-        if ch == "\\" and in_string:
-            escaped = True
-            continue
-        if ch == '"':
-            in_string = not in_string
-            continue
-        if not in_string:
-            if ch == open_char:
-                count += 1
-            elif ch == close_char:
-                count -= 1
-    return count
+_CLOSERS = {"{": "}", "[": "]"}
+_STRING_RUN = re.compile(r'[^"\\]*')  # 文字列内の通常文字の連続
+_PLAIN_RUN = re.compile(r'[^"{}\[\],]*')  # 文字列外の構造文字以外の連続
+
+
+def _repair_json(text: str) -> tuple[str, str | None]:
+    """途切れた・崩れた JSON を1パスで修復する。
+
+    文字列の状態と括弧のスタックを追いながら、
+      - 閉じ括弧直前・末尾のカンマを除く
+      - 対応しない閉じ括弧を捨てる
+      - 末尾で未閉じの文字列と括弧をスタック順に閉じる
+      - トップレベルの値が閉じた後ろの文字は捨てる
+    を行う。あわせて、トップレベルのカンマ（= 直前の要素が完結した位置）を記録し、
+    最後のカンマで切って閉じた「救出用」テキストも返す（途中で切れた要素を丸ごと捨てる）。
 
+    構造文字以外の連続は正規表現（文字クラスのみで後戻りしない）でまとめて読み飛ばす。
 
-def _repair_json(text: str) -> str:
-    """壊れたJSONの修復を試みる。"""
-    # 未閉じの文字列を閉じる
+    Returns:
+        (修復テキスト, 救出用テキスト。カンマが無ければ None)
+    """
+    out: list[str] = []
+    stack: list[str] = []
     in_string = False
-    escaped = False
-    for ch in text:
-        if escaped:
-            escaped = False
+    comma = -1  # 直前の有意な文字がカンマならその out 上の位置
+    cut = -1  # トップレベルの最後のカンマの位置
+    i, n = 0, len(text)
+
+    while i < n:
+        if in_string:
+            run = _STRING_RUN.match(text, i).group()
+            out.append(run)
+            i += len(run)
+            if i >= n:
+                break
+            if text[i] == "\\":
+                if i + 1 >= n:
+                    break  # 途中で切れたエスケープは捨てる
+                out.append(text[i:i + 2])
+                i += 2
+            else:
+                out.append('"')
+                in_string = False
+                i += 1
             continue
-        if ch == "\\":
-            escaped = True
+
+        run = _PLAIN_RUN.match(text, i).group()
+        if run:
+            out.append(run)
+            i += len(run)
+            if not run.isspace():
+                comma = -1
+            if i >= n:
+                break
+        ch = text[i]
+        i += 1
+
+        if ch in "}]":
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                continue
+            stack.pop()
+            if comma >= 0:
+                out[comma] = ""
+            comma = -1
+            out.append(ch)
+            if not stack:
+                break  # トップレベルの値が閉じた（以降の後置きは捨てる）
             continue
-        if ch == '"':
-            in_string = not in_string
-    if in_string:
-        text += '"'
 
-    # 末尾のカンマを除去（閉じ括弧/ブレースの直前、または末尾）
-    text = re.sub(r",\s*([}\]])", r"\1", text)
-    text = re.sub(r",\s*$", "", text)
+        if ch == ",":
+            if len(stack) == 1:
+                cut = len(out)
+            comma = len(out)
+        elif ch in "{[":
+            stack.append(ch)
+            comma = -1
+        else:  # '"'
+            in_string = True
+            comma = -1
+        out.append(ch)
 
-    # 開いた括弧/ブレースを閉じる（文字列内の括弧は除外してカウント）
-    open_braces = _count_unbalanced(text, "{", "}")
-    open_brackets = _count_unbalanced(text, "[", "]")
-    text += "}" * max(0, open_braces)
-    text += "]" * max(0, open_brackets)
+    if in_string:
+        out.append('"')
+    elif comma >= 0:
+        out[comma] = ""
+    out.extend(_CLOSERS[c] for c in reversed(stack))
+    repaired = "".join(out)
 
-    return text
+    salvaged = None
+    if cut >= 0 and stack:
+        salvaged = "".join(out[:cut]) + _CLOSERS[stack[0]]
+    return repaired, salvaged
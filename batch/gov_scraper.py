@@ -12,13 +12,14 @@ from xml.etree import ElementTree
 
 import requests
 
+import config
 from gemini_client import call_gemini, parse_json_response
 from scraper import extract_text, fetch_page
 
 logger = logging.getLogger(__name__)
 
 
-def scrape_source(source: dict) -> list[dict]:
+def scrape_source(source: dict, probe: bool = False) -> list[dict]:
     """1つのデータソースをスクレイピングして案件を抽出する。
 
     notes フィールドが "api:kkj" の場合は kkj.go.jp API を使用し、
@@ -27,18 +28,52 @@ def scrape_source(source: dict) -> list[dict]:
     Args:
         source: area_sources テーブルの行。
             {"id": "aichi-pref", "url": "...", "source_name": "...", ...}
+        probe: True の場合はリトライせず1回だけ試す（サーキットブレーカーの再試行用）。
 
     Returns:
         案件情報の辞書リスト。
     """
     notes = source.get("notes", "") or ""
     if notes == "api:kkj" or "kkj.go.jp/api" in source.get("url", ""):
-        return _scrape_kkj_api(source)
+        return _scrape_kkj_api(source, attempts=1 if probe else 3)
 
-    return _scrape_html(source)
+    return _scrape_html(source, attempts=1 if probe else 2)
 
 
-def _scrape_kkj_api(source: dict) -> list[dict]:
+def is_circuit_open(source: dict) -> bool:
+    """連続失敗が閾値に達し、再試行間隔の管理対象になっているか。"""
+    return (source.get("consecutive_failures") or 0) >= config.SOURCE_BREAKER_THRESHOLD
+
+
+def next_probe_at(source: dict) -> datetime | None:
+    """サーキットブレーカー: 次に再試行してよい時刻を返す。
+
+    連続失敗が閾値未満、または再試行時刻を過ぎていれば None（今回実行する）。
+    再試行間隔は閾値超過1回ごとに倍になり、SOURCE_REPROBE_MAX_HOURS で頭打ち。
+    """
+    if not is_circuit_open(source):
+        return None
+
+    last_checked = source.get("last_checked_at")
+    if not last_checked:
+        return None
+    try:
+        checked_at = datetime.fromisoformat(last_checked.replace("Z", "+00:00"))
+    except (ValueError, TypeError):
+        return None
+
+    over = source["consecutive_failures"] - config.SOURCE_BREAKER_THRESHOLD
+    hours = min(
+        config.SOURCE_REPROBE_BASE_HOURS * (2 ** (over + 1)),
+        config.SOURCE_REPROBE_MAX_HOURS,
+    )
+    retry_at = checked_at + timedelta(hours=hours)
+    if datetime.now(timezone.utc) >= retry_at:
+        return None
+    return retry_at
+
+
+def _scrape_kkj_api(source: dict, attempts: int = 3) -> list[dict]:
     """kkj.go.jp API を使って案件を取得する（Gemini不要）。"""
     source_name = source.get("source_name", "")
     source_url = source.get("url", "")
@@ -58,16 +93,16 @@ def _scrape_kkj_api(source: dict) -> list[dict]:
     sep = "&" if "?" in source_url else "?"
     full_url = f"{source_url}{sep}Start_Date={start_date}&End_Date={end_date}&Count=1000"
 
-    # タイムアウト対策: 最大2回リトライ（間隔5秒）
+    # タイムアウト対策: 既定で最大2回リトライ（間隔5秒）
     last_exc = None
-    for attempt in range(3):
+    for attempt in range(attempts):
         try:
             resp = requests.get(full_url, timeout=60)
             resp.raise_for_status()
             break
         except requests.RequestException as exc:
             last_exc = exc
-            if attempt < 2:
+            if attempt < attempts - 1:
                 logger.info("API取得リトライ %s (attempt %d): %s", source_name, attempt + 1, exc)
                 time.sleep(5)
     else:
@@ -286,7 +321,7 @@ def _clean_summary(raw: str, title: str) -> str | None:
     return summary if summary else None
 
 
-def _scrape_html(source: dict) -> list[dict]:
+def _scrape_html(source: dict, attempts: int = 2) -> list[dict]:
     """従来の HTML スクレイピング + Gemini 抽出。"""
     source_name = source.get("source_name", "")
     source_url = source.get("url", "")
@@ -297,15 +332,16 @@ def _scrape_html(source: dict) -> list[dict]:
 
     logger.info("取得中: %s (%s)", source_name, source_url)
 
-    # ページ取得（タイムアウト・接続エラー時は1回リトライ）
+    # ページ取得（タイムアウト・接続エラー時は既定で1回リトライ）
     last_exc = None
-    for attempt in range(2):
+    for attempt in range(attempts):
         try:
-            resp = fetch_page(source_url)
+            # 一覧ページは毎日更新を拾う必要があるためキャッシュしない
+            resp = fetch_page(source_url, use_cache=False)
             break
         except requests.RequestException as exc:
             last_exc = exc
-            if attempt < 1:
+            if attempt < attempts - 1:
                 logger.info("ページ取得リトライ %s (attempt %d): %s", source_name, attempt + 1, exc)
                 time.sleep(3)
     else:
@@ -363,7 +399,7 @@ def _extract_opportunities(
 ウェブページテキスト:
 {text}"""
 
-    response = call_gemini(prompt)
+    response = call_gemini(prompt, tag="source_extract")
     opportunities = parse_json_response(response)
 
     if not isinstance(opportunities, list):
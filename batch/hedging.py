@@ -0,0 +1,112 @@
+"""公募ナビAI - Gemini 呼び出しのヘッジ（テールレイテンシ対策）
+
+通知メールの AI 分析は夜間バッチのクリティカルパスにあり、1件でも遅い応答
+（最大でタイムアウトの120秒）があるとそのユーザーのメールが遅れる。
+
+ヘッジを有効にした呼び出しは、そのタグで観測したレイテンシの p95 を過ぎても
+応答がなければ同じリクエストをもう1本送り、先に返った方を使う。
+
+- p95 は直近 GEMINI_HEDGE_WINDOW 件から求める。観測が GEMINI_HEDGE_MIN_SAMPLES 件
+  に満たないうちは GEMINI_HEDGE_INITIAL_DELAY 秒を使う
+- 追加で送る本数は呼び出し数の GEMINI_HEDGE_MAX_RATE 倍まで（費用の上限）
+- 負けた方の HTTP 要求は止められないので最後まで走り、結果は捨てる
+  （トークンは使うので usage には両方記録される）
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, TypeVar
+
+import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Hedger:
+    """タグごとのレイテンシ分布と、ヘッジの予算を持つ（スレッドセーフ）。"""
+
+    def __init__(
+        self,
+        percentile: float = config.GEMINI_HEDGE_PERCENTILE,
+        max_rate: float = config.GEMINI_HEDGE_MAX_RATE,
+        window: int = config.GEMINI_HEDGE_WINDOW,
+        min_samples: int = config.GEMINI_HEDGE_MIN_SAMPLES,
+        initial_delay: float = config.GEMINI_HEDGE_INITIAL_DELAY,
+    ):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.window = window
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.stats = {"calls": 0, "hedged": 0, "hedge_won": 0, "over_budget": 0}
+        self._latencies: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.GEMINI_CONCURRENCY * 2, thread_name_prefix="gemini-hedge",
+        )
+
+    def delay(self, tag: str) -> float:
+        """ヘッジを送るまでの待ち秒数（tag の観測 p95）。"""
+        with self._lock:
+            samples = sorted(self._latencies.get(tag, ()))
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return samples[index]
+
+    def observe(self, tag: str, latency: float):
+        with self._lock:
+            self._latencies.setdefault(tag, deque(maxlen=self.window)).append(latency)
+
+    def run(self, tag: str, func: Callable[[], T]) -> T:
+        """func を実行し、p95 を過ぎたら同じ func をもう1本走らせて先に成功した方を返す。
+
+        両方失敗した場合は最初の呼び出しの例外を送出する。
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+        primary = self._submit(tag, func)
+        try:
+            return primary.result(timeout=self.delay(tag))
+        except FutureTimeoutError:  # 3.10 以前は組み込みの TimeoutError と別の型
+            pass
+
+        if not self._take_budget():
+            return primary.result()
+        logger.info("Gemini 応答待ちが p95 を超えたためヘッジ送信 [%s]", tag)
+        hedge = self._submit(tag, func)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=lambda f: f is hedge):
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.stats["hedge_won"] += 1
+                    return future.result()
+        return primary.result()
+
+    def _submit(self, tag: str, func: Callable[[], T]) -> Future:
+        def timed():
+            started = time.monotonic()
+            try:
+                return func()
+            finally:
+                self.observe(tag, time.monotonic() - started)
+
+        return self._executor.submit(timed)
+
+    def _take_budget(self) -> bool:
+        """ヘッジの本数を呼び出し数の max_rate 倍（最初の1本は別枠）までに抑える。"""
+        with self._lock:
+            if self.stats["hedged"] >= self.max_rate * self.stats["calls"] + 1:
+                self.stats["over_budget"] += 1
+                return False
+            self.stats["hedged"] += 1
+            return True
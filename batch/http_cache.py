@@ -0,0 +1,139 @@
+"""公募ナビAI - HTTPレスポンスのディスクキャッシュ
+
+fetch_page の取得結果を URL キーで SQLite に保存し、
+daily_check / backfill_details の再実行で同じページを再ダウンロードしないようにする。
+
+- 有効期限: Cache-Control の max-age を優先し、なければ既定TTL
+- 期限切れ: ETag / Last-Modified で条件付きリクエストし、304 なら本文を再利用
+- 容量上限: 合計サイズを超えたら最終アクセスの古い順（LRU）に削除
+"""
+
+import logging
+import re
+import time
+from dataclasses import dataclass
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import config
+from local_store import LruStore
+
+logger = logging.getLogger(__name__)
+
+_MAX_AGE_RE = re.compile(r"max-age\s*=\s*(\d+)", re.IGNORECASE)
+
+# 本文以外で保存するレスポンスヘッダー（再構築に必要なものだけ）
+_KEPT_HEADERS = ("Content-Type", "Content-Encoding", "ETag", "Last-Modified", "Cache-Control")
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    final_url: str
+    status: int
+    headers: dict
+    body: bytes
+    etag: str | None
+    last_modified: str | None
+    expires_at: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def validators(self) -> dict:
+        """条件付きリクエスト用のヘッダーを返す。"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_response(self) -> requests.Response:
+        """キャッシュ内容から requests.Response を再構築する。"""
+        resp = requests.Response()
+        resp.status_code = self.status
+        resp._content = self.body
+        resp.headers = CaseInsensitiveDict(self.headers)
+        resp.url = self.final_url
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        return resp
+
+
+def _ttl_from_headers(headers, default_ttl: int) -> int | None:
+    """Cache-Control から保存期間（秒）を決める。None は保存しない。"""
+    cc = (headers.get("Cache-Control") or "").lower()
+    if "no-store" in cc:
+        return None
+    if "no-cache" in cc:
+        return 0  # 保存はするが毎回再検証
+    m = _MAX_AGE_RE.search(cc)
+    if m:
+        return int(m.group(1))
+    return default_ttl
+
+
+class HttpCache:
+    """URL キーの SQLite レスポンスキャッシュ（スレッドセーフ）。"""
+
+    def __init__(
+        self,
+        path: str = "http_cache.sqlite3",
+        ttl: int = config.HTTP_CACHE_TTL,
+        max_bytes: int = config.HTTP_CACHE_MAX_BYTES,
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {"hit": 0, "revalidated": 0, "miss": 0, "evicted": 0}
+        self._store = LruStore(path, "http_cache", max_bytes, self.stats)
+
+    def get(self, url: str) -> CacheEntry | None:
+        """エントリを取得する（期限切れでも返す。鮮度は entry.fresh で判定）。"""
+        stored = self._store.get(url, stale_ok=True)
+        if stored is None:
+            return None
+        meta = stored.meta
+        return CacheEntry(
+            url=url,
+            final_url=meta["final_url"],
+            status=meta["status"],
+            headers=meta["headers"],
+            body=stored.value,
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+            expires_at=stored.expires_at,
+        )
+
+    def put(self, url: str, resp: requests.Response):
+        """レスポンスを保存する。no-store 指定や非200は保存しない。"""
+        if resp.status_code != 200:
+            return
+        ttl = _ttl_from_headers(resp.headers, self.ttl)
+        if ttl is None:
+            return
+
+        meta = {
+            "final_url": resp.url or url,
+            "status": resp.status_code,
+            "headers": {k: resp.headers[k] for k in _KEPT_HEADERS if k in resp.headers},
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+        }
+        self._store.put(url, resp.content, time.time() + ttl, meta)
+
+    def refresh(self, url: str, resp: requests.Response):
+        """304 応答を受けて有効期限とバリデータを更新する。"""
+        ttl = _ttl_from_headers(resp.headers, self.ttl)
+        validators = {
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+        }
+        self._store.refresh(
+            url, time.time() + (ttl or 0), {k: v for k, v in validators.items() if v},
+        )
+
+    def record(self, kind: str):
+        """hit / revalidated / miss の統計を加算する。"""
+        self._store.count(kind)
@@ -5,16 +5,37 @@ title + summary + category だけで10カテゴリに分類する。
 50件ずつバッチでGeminiに送信し、DB更新する。
 
 Usage:
-    python industry_classifier.py [--limit 50000] [--batch-size 50] [--delay 0.3]
+    python industry_classifier.py [--limit 50000] [--batch-size 50] [--concurrency 8] [--batch-api]
+
+既定ではバッチを --concurrency 本まで同時に分類する（1 なら --delay 秒ずつ空けて逐次）。
+
+--batch-api を付けると全バッチを Gemini Batch API の1ジョブにまとめて投入し、
+完了を待ってから結果を DB に書き込む（同期呼び出しより安く、quota に縛られない）。
+
+Gemini の quota 切れで分類できなかったバッチは gemini_deferred に積み、quota ブレーカーが
+開いたら残りのバッチは送らずに終える（未分類のまま次回の対象になる）。
+積んだ分は次回の実行の最初に流す（deferred_queue.py）。
 """
 
 import argparse
+import asyncio
 import json
 import logging
 import sys
+from datetime import datetime, timezone
 
+import config
 import db
-from gemini_client import call_gemini, parse_json_response
+import deferred_queue
+import gemini_batch
+from gemini_async import AsyncGemini
+from gemini_client import (
+    QuotaError, build_request, decode_json, generate_json, get_context_cache, get_response_cache,
+    quota_blocked,
+)
+from rate_limiter import PRIORITY_LOW
+from response_schema import array, integer, obj, string
+from usage import get_tracker
 
 logging.basicConfig(
     level=logging.INFO,
@@ -30,6 +51,26 @@ VALID_CATEGORIES = (
 
 CATEGORIES_STR = " / ".join(VALID_CATEGORIES)
 
+# 全バッチで共通の分類指示（コンテキストキャッシュで使い回す前置き）
+CLASSIFY_PREFIX = f"""以下は公募・入札案件のリストです。
+各案件を以下の10カテゴリのいずれか1つに分類してください。
+
+カテゴリ: {CATEGORIES_STR}
+
+各案件の番号と分類結果をJSON配列で出力してください:
+[
+  {{"index": 1, "category": "カテゴリ名"}},
+  {{"index": 2, "category": "カテゴリ名"}}
+]
+
+"""
+
+# 応答スキーマ: [{"index": 番号, "category": カテゴリ名}]
+CLASSIFY_SCHEMA = array(obj({"index": integer(), "category": string(VALID_CATEGORIES)}))
+# 手元の検証は enum を外して行う。カテゴリ外の1件でバッチ全体（50件）を捨てないよう、
+# 不正なカテゴリは _to_mapping で1件ずつ「その他」に寄せる
+CLASSIFY_CHECK_SCHEMA = array(obj({"index": integer(), "category": string()}))
+
 
 def get_unclassified_opportunities(limit: int = 50000) -> list[dict]:
     """industry_category が NULL の案件を取得する。"""
@@ -53,6 +94,86 @@ def classify_batch(opps: list[dict]) -> dict[str, str]:
     Returns:
         {opportunity_id: category} のdict
     """
+    prompt = _build_prompt(opps)
+    try:
+        results = generate_json(
+            prompt, CLASSIFY_SCHEMA, max_tokens=4096, priority=PRIORITY_LOW, tag="classify",
+            prefix=CLASSIFY_PREFIX, check_schema=CLASSIFY_CHECK_SCHEMA,
+        )
+        return _to_mapping(results, opps)
+    except Exception as exc:
+        logger.warning("分類バッチ失敗: %s", exc)
+        if isinstance(exc, QuotaError):
+            _defer(opps, exc)
+        return {}
+
+
+def _defer(opps: list[dict], exc: QuotaError):
+    """quota 切れで分類できなかったバッチを次回に回す。"""
+    deferred_queue.defer(deferred_queue.CLASSIFY, [o["id"] for o in opps], reason=str(exc))
+
+
+async def _classify_concurrently(batches: list[list[dict]], concurrency: int) -> int:
+    """バッチを同時に分類し、終わった順に保存する。成功件数を返す。"""
+    async def classify(client: AsyncGemini, opps: list[dict]) -> dict[str, str]:
+        try:
+            results = await client.generate_json(
+                _build_prompt(opps), CLASSIFY_SCHEMA, max_tokens=4096, priority=PRIORITY_LOW,
+                tag="classify", prefix=CLASSIFY_PREFIX, check_schema=CLASSIFY_CHECK_SCHEMA,
+            )
+        except QuotaError as exc:
+            await asyncio.to_thread(_defer, opps, exc)
+            raise
+        return _to_mapping(results, opps)
+
+    success = 0
+    async with AsyncGemini(concurrency) as client:
+        tasks = [asyncio.ensure_future(classify(client, opps)) for opps in batches]
+        for done, future in enumerate(asyncio.as_completed(tasks), 1):
+            try:
+                mapping = await future
+            except asyncio.CancelledError:
+                continue
+            except Exception as exc:
+                logger.warning("分類バッチ失敗: %s", exc)
+                if isinstance(exc, QuotaError) and quota_blocked("classify"):
+                    pending = [task for task in tasks if not task.done()]
+                    if pending:
+                        logger.warning("Gemini の quota が切れたため残り%dバッチは送らない", len(pending))
+                    for task in pending:
+                        task.cancel()
+                continue
+            success += await asyncio.to_thread(_save_mapping, mapping)
+            if done % 10 == 0:
+                logger.info("  進捗: %d/%d バッチ, %d件成功", done, len(batches), success)
+    return success
+
+
+def classify_with_batch_api(batches: list[list[dict]]) -> dict[str, str]:
+    """全バッチを Batch API の1ジョブで分類する（オンライン quota を使わない）。"""
+    requests_by_key = {
+        str(i): build_request(
+            CLASSIFY_PREFIX + _build_prompt(opps), max_tokens=4096, schema=CLASSIFY_SCHEMA,
+        )
+        for i, opps in enumerate(batches)
+    }
+    responses = gemini_batch.run_batch(
+        requests_by_key, display_name="koubo-industry", tag="classify_batch",
+    )
+
+    mapping = {}
+    for key, response in responses.items():
+        if response is None:
+            continue
+        try:
+            results = decode_json(response, CLASSIFY_CHECK_SCHEMA)
+            mapping.update(_to_mapping(results, batches[int(key)]))
+        except Exception as exc:
+            logger.warning("分類バッチ %s の解析失敗: %s", key, exc)
+    return mapping
+
+
+def _build_prompt(opps: list[dict]) -> str:
     opp_lines = []
     for i, opp in enumerate(opps, 1):
         title = opp.get("title", "不明")
@@ -62,54 +183,56 @@ def classify_batch(opps: list[dict]) -> dict[str, str]:
 
     opp_text = "\n".join(opp_lines)
 
-    prompt = f"""以下は公募・入札案件のリストです。
-各案件を以下の10カテゴリのいずれか1つに分類してください。
-
-カテゴリ: {CATEGORIES_STR}
-
-案件リスト:
-{opp_text}
-
-各案件の番号と分類結果をJSON配列で出力してください:
-[
-  {{"index": 1, "category": "カテゴリ名"}},
-  {{"index": 2, "category": "カテゴリ名"}}
-]
-
-全{len(opps)}件を出力してください。"""
-
-    try:
-        response = call_gemini(prompt, json_mode=True, max_tokens=4096)
-        results = parse_json_response(response)
-
-        if not isinstance(results, list):
-            return {}
+    return f"""案件リスト（全{len(opps)}件。全件を出力してください）:
+{opp_text}"""
 
-        mapping = {}
-        for r in results:
-            idx = r.get("index", 0) - 1
-            cat = r.get("category", "その他")
-            if 0 <= idx < len(opps):
-                if cat not in VALID_CATEGORIES:
-                    cat = "その他"
-                mapping[opps[idx]["id"]] = cat
 
-        return mapping
+def _to_mapping(results: list[dict], opps: list[dict]) -> dict[str, str]:
+    """検証済みの [{"index", "category"}] を {opportunity_id: category} にする。
 
-    except Exception as exc:
-        logger.warning("分類バッチ失敗: %s", exc)
-        return {}
+    カテゴリ外の値はその案件だけ「その他」にする。
+    """
+    mapping = {}
+    for r in results:
+        idx = r["index"] - 1
+        if 0 <= idx < len(opps):
+            category = r["category"]
+            if category not in VALID_CATEGORIES:
+                logger.debug("カテゴリ外の分類 %r を「その他」に: %s", category, opps[idx]["id"])
+                category = "その他"
+            mapping[opps[idx]["id"]] = category
+    return mapping
+
+
+def _save_mapping(mapping: dict[str, str]) -> int:
+    """分類結果を DB に保存し、成功件数を返す。"""
+    success = 0
+    for opp_id, category in mapping.items():
+        try:
+            db.update_industry_category(opp_id, category)
+            success += 1
+        except Exception as exc:
+            logger.debug("更新失敗 %s: %s", opp_id, exc)
+    return success
 
 
 def main():
     parser = argparse.ArgumentParser(description="業種カテゴリ一括分類")
     parser.add_argument("--limit", type=int, default=50000, help="処理件数上限")
     parser.add_argument("--batch-size", type=int, default=50, help="1バッチの件数")
-    parser.add_argument("--delay", type=float, default=0.3, help="バッチ間の待機秒数")
+    parser.add_argument("--delay", type=float, default=0.3, help="バッチ間の待機秒数（--concurrency 1 のとき）")
+    parser.add_argument(
+        "--concurrency", type=int, default=config.GEMINI_CONCURRENCY,
+        help="同時に分類するバッチ数（1 で逐次実行）",
+    )
+    parser.add_argument("--batch-api", action="store_true", help="Gemini Batch API で一括実行する")
     args = parser.parse_args()
 
     logger.info("=== 業種カテゴリ分類 開始 (limit=%d, batch=%d) ===", args.limit, args.batch_size)
 
+    # 前回 quota 切れで後回しにしたバッチを先に流す
+    deferred_queue.drain((deferred_queue.CLASSIFY,))
+
     opps = get_unclassified_opportunities(limit=args.limit)
     total = len(opps)
     if not opps:
@@ -118,28 +241,62 @@ def main():
 
     logger.info("対象案件: %d件 (%d バッチ)", total, (total + args.batch_size - 1) // args.batch_size)
 
+    try:
+        log_id = db.create_batch_log("industry_classifier")
+    except Exception as exc:
+        logger.warning("バッチログ作成失敗（処理は継続）: %s", exc)
+        log_id = None
+
     import time
     success = 0
     batches = [opps[i:i + args.batch_size] for i in range(0, total, args.batch_size)]
 
-    for batch_idx, batch in enumerate(batches, 1):
-        logger.info("バッチ %d/%d (%d件)...", batch_idx, len(batches), len(batch))
+    if args.batch_api:
+        mapping = classify_with_batch_api(batches)
+        success = _save_mapping(mapping)
+    elif args.concurrency > 1:
+        success = asyncio.run(_classify_concurrently(batches, args.concurrency))
+    else:
+        for batch_idx, batch in enumerate(batches, 1):
+            logger.info("バッチ %d/%d (%d件)...", batch_idx, len(batches), len(batch))
 
-        mapping = classify_batch(batch)
-        for opp_id, category in mapping.items():
-            try:
-                db.update_industry_category(opp_id, category)
-                success += 1
-            except Exception as exc:
-                logger.debug("更新失敗 %s: %s", opp_id, exc)
+            success += _save_mapping(classify_batch(batch))
+            if quota_blocked("classify"):
+                logger.warning(
+                    "Gemini の quota が切れたため残り%dバッチは送らない", len(batches) - batch_idx,
+                )
+                break
 
-        if batch_idx < len(batches) and args.delay > 0:
-            time.sleep(args.delay)
+            if batch_idx < len(batches) and args.delay > 0:
+                time.sleep(args.delay)
 
-        if batch_idx % 10 == 0:
-            logger.info("  進捗: %d/%d 成功", success, batch_idx * args.batch_size)
+            if batch_idx % 10 == 0:
+                logger.info("  進捗: %d/%d 成功", success, batch_idx * args.batch_size)
 
     logger.info("=== 分類完了: %d/%d 成功 ===", success, total)
+    context_cache = get_context_cache()
+    if context_cache is not None:
+        context_cache.close()
+        logger.info("  コンテキストキャッシュ: %s", context_cache.stats)
+    tracker = get_tracker()
+    tracker.log_summary()
+    if log_id:
+        try:
+            db.update_batch_log(
+                log_id,
+                finished_at=datetime.now(timezone.utc).isoformat(),
+                status="completed",
+                errors_count=total - success,
+                **tracker.rollup(),
+            )
+        except Exception as exc:
+            logger.error("バッチログ更新失敗: %s", exc)
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        logger.info(
+            "  Gemini 応答キャッシュ: ヒット=%d, ミス=%d",
+            response_cache.stats["hit"], response_cache.stats["miss"],
+        )
 
     remaining = get_unclassified_opportunities(limit=1)
     if remaining:
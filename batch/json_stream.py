@@ -0,0 +1,87 @@
+"""公募ナビAI - JSON 配列のインクリメンタルパーサー
+
+ストリーミング応答（streamGenerateContent）の断片を順に受け取り、
+トップレベル配列の要素が閉じた時点で1件ずつ取り出す。
+応答が途中で切れても、それまでに閉じた要素はすべて得られる。
+
+配列の前にある ```json などの前置きは読み飛ばす。
+"""
+
+import json
+from typing import Iterable, Iterator
+
+
+class JsonArrayStream:
+    """トップレベル配列の要素を逐次パースする状態機械。"""
+
+    def __init__(self):
+        self._started = False  # トップレベルの [ を読んだか
+        self._finished = False  # 対応する ] を読んだか
+        self._depth = 0  # 要素内のネスト深さ
+        self._in_string = False
+        self._escaped = False
+        self._element: list[str] = []  # 組み立て中の要素テキスト
+        self.errors = 0  # 閉じたがパースできなかった要素数
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def feed(self, chunk: str) -> list:
+        """断片を読み、この断片で閉じた要素のリストを返す。"""
+        completed = []
+        for ch in chunk:
+            if self._finished:
+                break
+            if not self._started:
+                if ch == "[":
+                    self._started = True
+                continue
+
+            if self._in_string:
+                self._element.append(ch)
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 0 and ch in ",]":
+                # 要素の区切り（スカラー要素はここで確定する）
+                self._emit(completed)
+                if ch == "]":
+                    self._finished = True
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+            if self._depth > 0 or self._element or not ch.isspace():
+                self._element.append(ch)
+            if self._depth == 0 and ch in "}]":
+                self._emit(completed)
+        return completed
+
+    def _emit(self, completed: list):
+        text = "".join(self._element).strip()
+        self._element = []
+        if not text:
+            return
+        try:
+            completed.append(json.loads(text))
+        except json.JSONDecodeError:
+            self.errors += 1
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator:
+    """テキスト断片の列から、閉じた配列要素を順に返す。"""
+    stream = JsonArrayStream()
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+        if stream.finished:
+            return
@@ -0,0 +1,157 @@
+"""公募ナビAI - Gemini APIキーのプール
+
+キー1本ではバックフィルの速度が1プロジェクトの quota で頭打ちになる。
+GEMINI_API_KEYS に複数のキー（別プロジェクト）を並べると、キーごとに
+レートリミッター（RPM/TPM のバケット）を持ち、呼び出しを振り分ける。
+
+- 振り分け先は残りの枠（RateLimiter.headroom）が最も大きい正常なキー
+- 429 はそのキーのリミッターだけを止める。ほかのキーはそのまま流れる
+- 連続で GEMINI_KEY_MAX_429 回 429 を受けたキーは GEMINI_KEY_COOLDOWN 秒
+  ローテーションから外す（全キーが外れたら、最も早く戻るキーで待つ）
+- utilization() でキーごとの呼び出し数・トークン数・429・状態を返す
+
+コンテキストキャッシュ・Batch API のファイルやジョブはプロジェクト単位の
+リソースなので、先頭のキー（primary）だけで扱う。
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import config
+from rate_limiter import PRIORITY_NORMAL, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class ApiKey:
+    """1本のキーとその枠・健全性。"""
+
+    def __init__(self, label: str, api_key: str, limiter: RateLimiter):
+        self.label = label
+        self.api_key = api_key
+        self.limiter = limiter
+        self.consecutive_429 = 0
+        self.disabled_until = 0.0
+        self.stats = {"requests": 0, "tokens": 0, "rate_limited": 0, "disabled": 0}
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.disabled_until
+
+
+def _store_path(store_path: str | None, api_key: str, pooled: bool) -> str | None:
+    """キーごとの共有バケットのファイル（キー1本なら従来どおり store_path そのもの）。"""
+    if not store_path or not pooled:
+        return store_path
+    root, ext = os.path.splitext(store_path)
+    return f"{root}.{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]}{ext}"
+
+
+class KeyPool:
+    """キーごとのリミッターと健全性を持ち、枠の空いたキーに振り分ける（スレッドセーフ）。"""
+
+    def __init__(
+        self,
+        api_keys: list[str],
+        rpm: int,
+        tpm: int,
+        store_path: str | None = None,
+        max_429: int = config.GEMINI_KEY_MAX_429,
+        cooldown: float = config.GEMINI_KEY_COOLDOWN,
+    ):
+        api_keys = list(dict.fromkeys(api_keys)) or [""]
+        pooled = len(api_keys) > 1
+        self.keys = [
+            ApiKey(f"key{i + 1}", key, RateLimiter(rpm, tpm, _store_path(store_path, key, pooled)))
+            for i, key in enumerate(api_keys)
+        ]
+        self.max_429 = max_429
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self) -> ApiKey:
+        return self.keys[0]
+
+    def acquire(
+        self, tokens: int = 0, priority: int = PRIORITY_NORMAL, pinned: ApiKey | None = None,
+    ) -> ApiKey:
+        """振り分け先のキーを選び、その枠を取ってから返す（pinned ならそのキーで待つ）。"""
+        key = pinned or self._choose()
+        key.limiter.acquire(tokens, priority)
+        with self._lock:
+            key.stats["requests"] += 1
+            key.stats["tokens"] += tokens
+        return key
+
+    def _choose(self) -> ApiKey:
+        now = time.time()
+        with self._lock:
+            healthy = [key for key in self.keys if key.healthy(now)]
+            if not healthy:
+                return min(self.keys, key=lambda key: key.disabled_until)
+            # 枠が同じなら使った回数の少ないキー
+            return max(healthy, key=lambda key: (key.limiter.headroom(), -key.stats["requests"]))
+
+    def available(self, exclude: ApiKey) -> bool:
+        """exclude 以外にすぐ使えるキーがあるか（429 のあと別キーで再送してよいか）。"""
+        now = time.time()
+        with self._lock:
+            others = [key for key in self.keys if key is not exclude and key.healthy(now)]
+        return any(key.limiter.headroom() > 0 for key in others)
+
+    def rate_limited(self, key: ApiKey, wait: float):
+        """key が 429 を受けた。そのキーを wait 秒止め、続くようならローテーションから外す。"""
+        with self._lock:
+            key.stats["rate_limited"] += 1
+            key.consecutive_429 += 1
+            disable = key.consecutive_429 >= self.max_429 and len(self.keys) > 1
+            if disable:
+                key.consecutive_429 = 0
+                key.disabled_until = time.time() + self.cooldown
+                key.stats["disabled"] += 1
+        if disable:
+            logger.warning(
+                "Gemini APIキー %s: 429 が%d回続いたため %.0f秒ローテーションから外す",
+                key.label, self.max_429, self.cooldown,
+            )
+            wait = max(wait, self.cooldown)
+        key.limiter.pause(wait)
+
+    def succeeded(self, key: ApiKey):
+        with self._lock:
+            key.consecutive_429 = 0
+
+    def limiter_stats(self) -> dict:
+        """全キーのリミッター統計の合計。"""
+        total = {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "paused": 0}
+        for key in self.keys:
+            for name in total:
+                total[name] += key.limiter.stats[name]
+        return total
+
+    def utilization(self) -> dict[str, dict]:
+        """{ラベル: 呼び出し数・割合・トークン数・429・外した回数・状態・残り枠}（キー自体は含めない）。"""
+        now = time.time()
+        with self._lock:
+            stats = {key.label: dict(key.stats) for key in self.keys}
+            total = sum(s["requests"] for s in stats.values())
+            for key in self.keys:
+                entry = stats[key.label]
+                entry["share"] = round(entry["requests"] / total, 3) if total else 0.0
+                entry["healthy"] = key.healthy(now)
+        for key in self.keys:
+            stats[key.label]["headroom"] = round(key.limiter.headroom(), 3)
+        return stats
+
+    def log_stats(self):
+        if len(self.keys) == 1:
+            return
+        for label, entry in self.utilization().items():
+            logger.info(
+                "  Gemini APIキー %s: 呼び出し=%d (%.0f%%), トークン=%d, 429=%d, 除外=%d回, %s",
+                label, entry["requests"], entry["share"] * 100, entry["tokens"],
+                entry["rate_limited"], entry["disabled"], "正常" if entry["healthy"] else "除外中",
+            )
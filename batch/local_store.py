@@ -0,0 +1,179 @@
+"""公募ナビAI - ローカルSQLiteストア
+
+キャッシュ・チェックポイント等のローカル永続化に使う SQLite 接続と、
+キャッシュ類が共通で使う期限・容量上限つきのストア（LruStore）を提供する。
+ファイルは config.CACHE_DIR 配下に作成する（絶対パス指定時はそのまま使用）。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+
+import config
+
+
+def db_path(filename: str) -> str:
+    """ファイル名を CACHE_DIR 配下の絶対パスに解決する。"""
+    if os.path.isabs(filename):
+        return filename
+    return os.path.join(config.CACHE_DIR, filename)
+
+
+def connect(filename: str) -> sqlite3.Connection:
+    """SQLite に接続する。
+
+    複数スレッドから1接続を共有する前提（呼び出し側でロックする）。
+    WAL モードにして読み書きの競合とプロセス間の待ちを減らす。
+    """
+    path = db_path(filename)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@dataclass
+class StoredValue:
+    value: bytes
+    meta: dict
+    expires_at: float  # 0 = 無期限
+
+
+class LruStore:
+    """キー → 値（zlib 圧縮）の SQLite ストア。有効期限と合計サイズ上限つき（スレッドセーフ）。
+
+    http_cache / response_cache / extraction_memo の共通部分。
+    - expires_at を過ぎた値は get で削除してミス扱い（stale_ok=True なら期限切れも返す）
+    - 圧縮後の合計サイズが max_bytes を超えたら最後に使った時刻（last_access）の古い順に消す
+    - 値ごとに付随情報（meta: JSON にできる dict）を持てる
+    stats は呼び出し側と共有する dict で、hit / miss / evicted を数える。
+    """
+
+    def __init__(self, path: str, table: str, max_bytes: int, stats: dict | None = None):
+        self.table = table
+        self.max_bytes = max_bytes
+        self.stats = stats if stats is not None else {}
+        for kind in ("hit", "miss", "evicted"):
+            self.stats.setdefault(kind, 0)
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                meta TEXT,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_access ON {table} (last_access)"
+        )
+        row = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()
+        self._total_bytes = row[0]
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total_bytes
+
+    def get(self, key: str, stale_ok: bool = False) -> StoredValue | None:
+        """値を返す（最終アクセス時刻を更新する）。
+
+        stale_ok=True なら期限切れも返し、hit / miss も数えない（鮮度は呼び出し側で判断する）。
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, meta, expires_at, size FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and not stale_ok and row[2] and row[2] <= now:
+                self._delete_locked(key, row[3])
+                row = None
+            if row is None:
+                if not stale_ok:
+                    self.stats["miss"] += 1
+                return None
+            self._conn.execute(
+                f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key)
+            )
+            if not stale_ok:
+                self.stats["hit"] += 1
+        value, meta, expires_at, _ = row
+        return StoredValue(zlib.decompress(value), json.loads(meta) if meta else {}, expires_at)
+
+    def put(self, key: str, value: bytes, expires_at: float, meta: dict | None = None):
+        """値を保存し、上限を超えていれば古いものから消す。expires_at=0 は無期限。"""
+        body = zlib.compress(value)
+        meta_json = json.dumps(meta, ensure_ascii=False) if meta else None
+        size = len(body) + len(meta_json or "")
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                f"SELECT size FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table}"
+                " (key, value, meta, expires_at, last_access, size) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, body, meta_json, expires_at, now, size),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict_locked()
+
+    def refresh(self, key: str, expires_at: float, meta: dict | None = None):
+        """値はそのままで有効期限を延ばす。meta を渡すと既存の meta に上書きでマージする。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT meta, size FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return
+            merged = {**(json.loads(row[0]) if row[0] else {}), **(meta or {})}
+            meta_json = json.dumps(merged, ensure_ascii=False) if merged else None
+            size = row[1] - len(row[0] or "") + len(meta_json or "")
+            self._conn.execute(
+                f"UPDATE {self.table} SET meta = ?, expires_at = ?, last_access = ?, size = ?"
+                " WHERE key = ?",
+                (meta_json, expires_at, now, size, key),
+            )
+            self._total_bytes += size - row[1]
+            self._evict_locked()
+
+    def delete(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT size FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._delete_locked(key, row[0])
+
+    def count(self, kind: str):
+        """呼び出し側の統計（stats の任意のキー）を加算する。"""
+        with self._lock:
+            self.stats[kind] = self.stats.get(kind, 0) + 1
+
+    def _delete_locked(self, key: str, size: int):
+        self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        self._total_bytes -= size
+
+    def _evict_locked(self):
+        """合計サイズが上限を超えていれば LRU 順に削除する（ロック保持中に呼ぶ）。"""
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                self._delete_locked(key, size)
+                self.stats["evicted"] += 1
+                if self._total_bytes <= self.max_bytes:
+                    return
@@ -13,6 +13,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import config
+import scraper
 from daily_check import run_daily_check
 from slack_notify import notify_slack
 
@@ -28,9 +29,9 @@ def main():
     logger.info("公募ナビAI バッチ処理開始")
 
     # 必須環境変数チェック
-    if not config.GEMINI_API_KEY:
-        logger.critical("GEMINI_API_KEY が設定されていません")
-        notify_slack("環境変数エラー", "GEMINI_API_KEY が設定されていません")
+    if not any(config.GEMINI_API_KEYS):
+        logger.critical("GEMINI_API_KEY / GEMINI_API_KEYS が設定されていません")
+        notify_slack("環境変数エラー", "GEMINI_API_KEY / GEMINI_API_KEYS が設定されていません")
         sys.exit(1)
 
     if not config.SUPABASE_SERVICE_KEY:
@@ -38,17 +39,22 @@ def main():
         notify_slack("環境変数エラー", "SUPABASE_SERVICE_KEY が設定されていません")
         sys.exit(1)
 
+    if config.HTTP_CACHE_ENABLED:
+        scraper.enable_cache()
+
     stats = run_daily_check()
 
     logger.info("バッチ処理終了: %s", stats)
 
     # エラーサマリーをSlack通知
     errors = stats.get("errors_count", 0)
+    skipped = stats.get("sources_skipped", [])
     if errors > 0:
         error_summary = (
             f"エラー: {errors}件\n"
             f"ユーザー: {stats.get('users_processed', 0)}人処理\n"
             f"スクレイピング: {stats.get('opportunities_scraped', 0)}件\n"
+            f"スキップ（連続失敗ソース）: {len(skipped)}件\n"
             f"通知: {stats.get('notifications_sent', 0)}件"
         )
         # fatal フェーズのエラーがあればexit(1)
@@ -1,21 +1,43 @@
 """公募ナビAI - マッチングエンジン（バッチ用）"""
 
+import asyncio
 import json
 import logging
+from typing import Callable
 
-from gemini_client import call_gemini, parse_json_response
+from gemini_async import AsyncGemini
+from gemini_client import stream_gemini
+from json_stream import iter_json_array
+from response_schema import array, compile_schema, integer, obj, string
 import config
 
 logger = logging.getLogger(__name__)
 
 
+# マッチング結果1件の応答スキーマ（応答全体はこの配列）
+MATCH_ITEM_SCHEMA = obj({
+    "id": string(),
+    "match_score": integer(),
+    "match_reason": string(),
+    "risk_notes": string(nullable=True),
+    "recommendation": string(("強く推奨", "推奨", "検討可", "非推奨")),
+    "action_items": array(string()),
+})
+MATCH_SCHEMA = array(MATCH_ITEM_SCHEMA)
+
+
 def match_opportunities(
     company_profile: dict,
     opportunities: list[dict],
+    on_match: Callable[[dict], None] | None = None,
 ) -> list[dict]:
     """会社プロフィールと案件リストを照合し、マッチ度を判定する。
 
-    案件数が BATCH_SIZE を超える場合は自動的にバッチ分割して処理する。
+    案件数が BATCH_SIZE を超える場合は自動的にバッチ分割し、バッチを同時に処理する。
+
+    Args:
+        on_match: 指定すると、判定を1件受け取るたびに（バッチの応答の完了を待たずに）呼ぶ。
+            バッチは並行して処理されるため、ワーカースレッドから順不同で呼ばれる。
 
     Returns:
         マッチ度スコア付きの案件リスト（スコア降順）。
@@ -24,35 +46,42 @@ def match_opportunities(
     if not opportunities:
         return []
 
-    all_results = []
-
     batches = [
         opportunities[i : i + config.BATCH_SIZE]
         for i in range(0, len(opportunities), config.BATCH_SIZE)
     ]
-    total_batches = len(batches)
-
-    for batch_idx, batch in enumerate(batches, 1):
-        if total_batches > 1:
-            logger.info(
-                "  マッチング バッチ %d/%d (%d件)...",
-                batch_idx, total_batches, len(batch),
-            )
-        try:
-            results = _match_batch(company_profile, batch)
-            all_results.extend(results)
-        except Exception as exc:
-            logger.warning("バッチ %d マッチング失敗: %s", batch_idx, exc)
+    if len(batches) > 1:
+        logger.info("  マッチング %d件を %d バッチで同時実行...", len(opportunities), len(batches))
+
+    all_results = []
+    for batch_idx, results in enumerate(asyncio.run(_match_all(company_profile, batches, on_match)), 1):
+        if isinstance(results, Exception):
+            logger.warning("バッチ %d マッチング失敗: %s", batch_idx, results)
+            continue
+        all_results.extend(results)
 
     all_results.sort(key=lambda x: x.get("match_score", 0), reverse=True)
     return all_results
 
 
+async def _match_all(
+    company_profile: dict,
+    batches: list[list[dict]],
+    on_match: Callable[[dict], None] | None = None,
+) -> list:
+    """全バッチを同時にマッチングする（失敗したバッチは例外オブジェクト）。"""
+    async with AsyncGemini() as client:
+        return await client.gather(
+            client.run(_match_batch, company_profile, batch, on_match) for batch in batches
+        )
+
+
 def _match_batch(
     company_profile: dict,
     opportunities: list[dict],
+    on_match: Callable[[dict], None] | None = None,
 ) -> list[dict]:
-    """1バッチ分の案件をマッチングする。"""
+    """1バッチ分の案件をマッチングする（on_match には完結した判定から順に渡す）。"""
     # マッチングに必要な情報だけ抽出してプロンプト短縮
     profile_info = {
         "company_name": company_profile.get("company_name"),
@@ -79,16 +108,15 @@ def _match_batch(
         })
     opps_json = json.dumps(opp_list, ensure_ascii=False, indent=2)
 
-    prompt = f"""あなたは公募・入札案件のマッチングAIアドバイザーです。
-以下の「会社プロフィール」と「公募・入札案件リスト」を照合し、
+    # 会社プロフィールと判定基準はユーザーの全バッチで共通なので前置きにまとめ、
+    # コンテキストキャッシュで一度だけ送る（プロフィールが変われば別キャッシュになる）
+    prefix = f"""あなたは公募・入札案件のマッチングAIアドバイザーです。
+以下の「会社プロフィール」と、最後に示す「公募・入札案件リスト」を照合し、
 各案件について、この会社がどの程度マッチするかを判定してください。
 
 ## 会社プロフィール
 {company_json}
 
-## 案件リスト
-{opps_json}
-
 ## 出力フォーマット（JSON配列、match_score が高い順にソート）
 [
   {{
@@ -107,16 +135,33 @@ def _match_batch(
 - 40-59:  部分的に関連
 - 0-39:   関連性が低い
 
-全案件を判定し、match_score 高い順に出力してください。"""
-
-    response = call_gemini(prompt, max_tokens=16384)
-    results = parse_json_response(response)
-
-    if not isinstance(results, list):
-        return []
-
-    # opportunity_id に id をマッピング
-    for r in results:
-        r["opportunity_id"] = r.pop("id", None)
+全案件を判定し、match_score 高い順に出力してください。
+
+"""
+    prompt = f"""## 案件リスト
+{opps_json}"""
+
+    # ストリーミングで受け、閉じた要素から順に取り出す。
+    # 出力が途中で切れても、それまでに完結した案件の判定は残る。
+    check = compile_schema(MATCH_ITEM_SCHEMA)
+    results = []
+    try:
+        for r in iter_json_array(stream_gemini(
+            prompt, max_tokens=16384, schema=MATCH_SCHEMA, tag="matcher", prefix=prefix,
+        )):
+            error = check(r)
+            if error:
+                logger.debug("マッチング結果のスキーマ不一致: %s", error)
+                continue
+            # opportunity_id に id をマッピング
+            r["opportunity_id"] = r.pop("id", None)
+            results.append(r)
+            if on_match is not None:
+                on_match(r)
+    except Exception as exc:
+        if not results:
+            raise
+        logger.warning("マッチング応答が途中で終了 (%d/%d件取得): %s",
+                       len(results), len(opportunities), exc)
 
     return results
@@ -0,0 +1,489 @@
+"""公募ナビAI - Gemini API のローカルモックサーバー
+
+テストや大量処理の試走用に、本番 API と同じパスで応答する HTTP サーバー。
+GEMINI_API_BASE=http://127.0.0.1:8765 のように向けて使う。
+
+対応エンドポイント:
+  POST /v1beta/models/{model}:generateContent
+  POST /v1beta/models/{model}:streamGenerateContent?alt=sse  （stream_chunk 文字ずつ SSE で返す）
+  POST /upload/v1beta/files                      （resumable アップロード開始）
+  POST /upload/session/{id}                      （本体アップロード・確定）
+  POST /v1beta/models/{model}:batchGenerateContent
+  GET  /v1beta/batches/{id}                      （batch_polls 回目の確認で完了）
+  GET  /download/v1beta/files/{id}:download
+  POST /v1beta/cachedContents                    （コンテキストキャッシュ作成）
+  DELETE /v1beta/cachedContents/{id}
+
+応答内容は responder（リクエスト本文 → 応答テキスト）で差し替えられる。
+cachedContent を参照するリクエストは、キャッシュの内容を contents の前に足してから渡す。
+生成系のリクエストには送信先の "model"（models/...）を足して渡す。responder が
+MockError を送出すると、そのステータスのエラー応答（429 など。details 付きも可）を返す。
+
+rule_responder は responseSchema とプロンプトから応答を組み立てる（業種分類なら
+案件の番号ごと、マッチングなら案件 ID ごとに1要素。値はプロンプトから決まるので再現可能）。
+canned（プロンプトの部分文字列 → 応答）を渡すとそれを優先する。
+
+Faults で生成系の応答にレイテンシ（分布）・429/503・途中終了（MAX_TOKENS）を混ぜられる。
+乱数は seed で固定されるので、レートリミッター・リトライ・並列度の比較を
+同じ条件で繰り返せる（bench_gemini_mock.py）。
+
+Usage:
+    python mock_gemini_server.py [--port 8765] [--rules] [--latency 0.8,3.0]
+        [--rate-429 0.05] [--rate-503 0.01] [--truncate-rate 0.02] [--seed 0]
+"""
+
+import argparse
+import functools
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+_GENERATE_RE = re.compile(r"^/v1beta/models/([^/:]+):generateContent$")
+_STREAM_RE = re.compile(r"^/v1beta/models/([^/:]+):streamGenerateContent$")
+_BATCH_CREATE_RE = re.compile(r"^/v1beta/models/([^/:]+):batchGenerateContent$")
+_BATCH_GET_RE = re.compile(r"^/v1beta/(batches/[\w-]+)$")
+_DOWNLOAD_RE = re.compile(r"^/download/v1beta/(files/[\w-]+):download$")
+_SESSION_RE = re.compile(r"^/upload/session/(\d+)$")
+_CACHED_RE = re.compile(r"^/v1beta/(cachedContents/[\w-]+)$")
+
+
+_LIST_ITEM_RE = re.compile(r"^(\d+)\. ", re.M)  # 業種分類の「1. タイトル: ...」
+_ID_RE = re.compile(r'"id":\s*"([^"]+)"')  # マッチングの案件 JSON
+
+
+@dataclass
+class Faults:
+    """生成系の応答に混ぜる遅延・障害（割合は 0〜1。判定は seed 固定の乱数）。"""
+
+    latency: Callable[[random.Random], float] | None = None  # 応答（ストリームは最初の断片）までの秒数
+    chunk_delay: float = 0.0  # ストリームの断片間の秒数
+    rate_429: float = 0.0
+    rate_503: float = 0.0
+    truncate_rate: float = 0.0  # 応答を途中で切って finishReason=MAX_TOKENS にする割合
+    retry_after: float = 1.0  # 429 の RetryInfo.retryDelay（秒）
+    seed: int = 0
+
+
+def fixed_latency(seconds: float) -> Callable[[random.Random], float]:
+    return lambda rng: seconds
+
+
+def lognormal_latency(median: float, p95: float) -> Callable[[random.Random], float]:
+    """中央値と p95 を指定した対数正規分布（LLM の応答時間は右に裾が長い）。"""
+    sigma = math.log(max(p95, median) / median) / 1.645
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+class MockError(Exception):
+    """responder から送出すると、status のエラー応答になる（details は error.details）。"""
+
+    def __init__(self, status: int, message: str = "mock error", details: list[dict] | None = None):
+        super().__init__(message)
+        self.status = status
+        self.details = details or []
+
+
+def default_responder(request: dict) -> str:
+    """JSON モードなら空オブジェクト、それ以外は固定文を返す。"""
+    if request.get("generationConfig", {}).get("responseMimeType") == "application/json":
+        return "{}"
+    return "mock response"
+
+
+def rule_responder(request: dict, canned: dict[str, str] | None = None) -> str:
+    """responseSchema に沿った応答をプロンプトから決定的に作る（スキーマが無ければ default_responder）。"""
+    prompt = _prompt_text(request)
+    for needle, response in (canned or {}).items():
+        if needle in prompt:
+            return response
+    schema = request.get("generationConfig", {}).get("responseSchema")
+    if schema is None:
+        return default_responder(request)
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    return json.dumps(_sample(schema, prompt, seed), ensure_ascii=False)
+
+
+def _prompt_text(request: dict) -> str:
+    return "".join(
+        part.get("text", "") for content in request.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+def _sample(schema: dict, prompt: str, seed: int):
+    """スキーマに合う値（enum は seed で選ぶ）。"""
+    kind = schema.get("type", "").upper()
+    if kind == "OBJECT":
+        return {
+            key: _sample(sub, prompt, seed + i)
+            for i, (key, sub) in enumerate(schema.get("properties", {}).items())
+        }
+    if kind == "ARRAY":
+        item = schema.get("items", {})
+        properties = item.get("properties", {})
+        if "index" in properties:
+            keys = [("index", int(n)) for n in _LIST_ITEM_RE.findall(prompt)]
+        elif "id" in properties:
+            keys = [("id", i) for i in dict.fromkeys(_ID_RE.findall(prompt))]
+        else:
+            keys = [None, None]
+        values = []
+        for i, key in enumerate(keys):
+            value = _sample(item, prompt, seed + i * 7)
+            if key:
+                value[key[0]] = key[1]
+            values.append(value)
+        return values
+    if kind == "STRING":
+        enum = schema.get("enum")
+        return enum[seed % len(enum)] if enum else f"モック応答{seed % 1000}"
+    if kind == "INTEGER":
+        return seed % 101
+    if kind == "NUMBER":
+        return (seed % 1000) / 10
+    if kind == "BOOLEAN":
+        return seed % 2 == 0
+    return None
+
+
+def _tokens(contents: list[dict]) -> int:
+    """contents のトークン数（4文字≒1トークンの概算）。"""
+    text = "".join(part.get("text", "") for content in contents for part in content.get("parts", []))
+    return len(text) // 4 + 1 if text else 0
+
+
+def generate_response(
+    text: str,
+    request: dict | None = None,
+    cached_tokens: int = 0,
+    finish_reason: str = "STOP",
+) -> dict:
+    """GenerateContentResponse（request はキャッシュ内容を展開済みのもの）。"""
+    prompt_tokens = _tokens((request or {}).get("contents", []))
+    output_tokens = len(text) // 4 + 1
+    usage = {
+        "promptTokenCount": prompt_tokens,
+        "candidatesTokenCount": output_tokens,
+        "totalTokenCount": prompt_tokens + output_tokens,
+    }
+    if cached_tokens:
+        usage["cachedContentTokenCount"] = cached_tokens
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": finish_reason}],
+        "usageMetadata": usage,
+    }
+
+
+class MockGeminiServer:
+    """バックグラウンドスレッドで動くモックサーバー。"""
+
+    def __init__(
+        self,
+        responder: Callable[[dict], str] = default_responder,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        batch_polls: int = 1,
+        stream_chunk: int = 20,
+        faults: Faults | None = None,
+    ):
+        self.responder = responder
+        self.batch_polls = batch_polls
+        self.stream_chunk = stream_chunk
+        self.faults = faults or Faults()
+        self.stats = {"generate": 0, "429": 0, "503": 0, "truncated": 0}
+        self._random = random.Random(self.faults.seed)
+        self.files: dict[str, bytes] = {}
+        self.jobs: dict[str, dict] = {}
+        self.cached_contents: dict[str, list[dict]] = {}  # cachedContents/... → contents
+        self.requests: list[tuple[str, str]] = []  # (method, path) の受信記録
+        self.api_keys: list[str] = []  # 生成系リクエストの x-goog-api-key（キープールの確認用）
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockGeminiServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _expand(self, request: dict) -> tuple[dict, int]:
+        """cachedContent の内容を contents の前に足す。(展開後のリクエスト, キャッシュ分のトークン数)"""
+        name = request.get("cachedContent")
+        if not name:
+            return request, 0
+        cached = self.cached_contents[name]
+        return dict(request, contents=cached + request.get("contents", [])), _tokens(cached)
+
+    def _draw(self) -> tuple[str | None, float, float]:
+        """1リクエスト分の (障害 "429"/"503"/"truncate"/None, 遅延秒, 切る位置の割合)。"""
+        faults = self.faults
+        with self._lock:
+            self.stats["generate"] += 1
+            r = self._random.random()
+            delay = faults.latency(self._random) if faults.latency else 0.0
+            cut = self._random.uniform(0.3, 0.9)
+            fault = None
+            if r < faults.rate_429:
+                fault = "429"
+            elif r < faults.rate_429 + faults.rate_503:
+                fault = "503"
+            elif r < faults.rate_429 + faults.rate_503 + faults.truncate_rate:
+                fault = "truncate"
+            if fault:
+                self.stats["truncated" if fault == "truncate" else fault] += 1
+        return fault, delay, cut
+
+    # --- ジョブ処理 ---
+
+    def _run_job(self, job: dict):
+        """入力 JSONL の各行に responder を適用して結果ファイルを作る。"""
+        lines = []
+        for raw in self.files[job["input"]].decode("utf-8").splitlines():
+            if not raw.strip():
+                continue
+            item = json.loads(raw)
+            try:
+                result = {
+                    "key": item["key"],
+                    "response": generate_response(self.responder(item["request"]), item["request"]),
+                }
+            except Exception as exc:
+                result = {"key": item["key"], "error": {"code": 500, "message": str(exc)}}
+            lines.append(json.dumps(result, ensure_ascii=False))
+        output = f"files/{next(self._ids)}"
+        self.files[output] = "\n".join(lines).encode("utf-8")
+        job["output"] = output
+
+    def _job_view(self, name: str, job: dict) -> dict:
+        state = "BATCH_STATE_SUCCEEDED" if "output" in job else "BATCH_STATE_RUNNING"
+        view = {"name": name, "metadata": {"state": state}, "done": "output" in job}
+        if "output" in job:
+            view["response"] = {"responsesFile": job["output"]}
+        return view
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, data: dict, headers: dict | None = None):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def do_POST(self):
+                path = self.path.split("?", 1)[0]
+                server.requests.append(("POST", path))
+                body = self._body()
+
+                m = _GENERATE_RE.match(path) or _STREAM_RE.match(path)
+                if m:
+                    request, cached_tokens = server._expand(json.loads(body))
+                    request["model"] = f"models/{m.group(1)}"
+                    server.api_keys.append(self.headers.get("x-goog-api-key", ""))
+                    fault, delay, cut = server._draw()
+                    if fault == "429":
+                        return self._send_json(429, {"error": {
+                            "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "mock quota",
+                            "details": [{
+                                "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                                "retryDelay": f"{server.faults.retry_after}s",
+                            }],
+                        }})
+                    if fault == "503":
+                        return self._send_json(503, {"error": {
+                            "code": 503, "status": "UNAVAILABLE", "message": "mock overloaded",
+                        }})
+                    try:
+                        text = server.responder(request)
+                    except MockError as exc:
+                        return self._send_json(exc.status, {
+                            "error": {"code": exc.status, "message": str(exc), "details": exc.details},
+                        })
+                    finish_reason = "STOP"
+                    if fault == "truncate":
+                        text, finish_reason = text[:int(len(text) * cut)], "MAX_TOKENS"
+                    time.sleep(delay)
+
+                if _GENERATE_RE.match(path):
+                    return self._send_json(
+                        200, generate_response(text, request, cached_tokens, finish_reason),
+                    )
+
+                if _STREAM_RE.match(path):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    size = max(1, server.stream_chunk)
+                    for i in range(0, len(text), size):
+                        if i:
+                            time.sleep(server.faults.chunk_delay)
+                        chunk = generate_response(text[i:i + size], finish_reason=finish_reason)
+                        # 本番と同じく usageMetadata はそこまでの累計
+                        chunk["usageMetadata"] = generate_response(
+                            text[:i + size], request, cached_tokens,
+                        )["usageMetadata"]
+                        self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+                        self.wfile.flush()
+                    return
+
+                if path == "/upload/v1beta/files":
+                    with server._lock:
+                        session = str(next(server._ids))
+                    return self._send_json(
+                        200, {}, {"X-Goog-Upload-URL": f"{server.url}/upload/session/{session}"},
+                    )
+
+                m = _SESSION_RE.match(path)
+                if m:
+                    name = f"files/{next(server._ids)}"
+                    server.files[name] = body
+                    return self._send_json(200, {"file": {"name": name, "state": "ACTIVE"}})
+
+                if path == "/v1beta/cachedContents":
+                    spec = json.loads(body)
+                    name = f"cachedContents/{next(server._ids)}"
+                    server.cached_contents[name] = spec["contents"]
+                    return self._send_json(200, {
+                        "name": name,
+                        "model": spec["model"],
+                        "usageMetadata": {"totalTokenCount": _tokens(spec["contents"])},
+                    })
+
+                if _BATCH_CREATE_RE.match(path):
+                    spec = json.loads(body)["batch"]
+                    name = f"batches/{next(server._ids)}"
+                    server.jobs[name] = {"input": spec["input_config"]["file_name"], "polls": 0}
+                    return self._send_json(200, server._job_view(name, server.jobs[name]))
+
+                self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+            def do_DELETE(self):
+                path = self.path.split("?", 1)[0]
+                server.requests.append(("DELETE", path))
+                m = _CACHED_RE.match(path)
+                if m and server.cached_contents.pop(m.group(1), None) is not None:
+                    return self._send_json(200, {})
+                self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                server.requests.append(("GET", path))
+
+                m = _BATCH_GET_RE.match(path)
+                if m and m.group(1) in server.jobs:
+                    job = server.jobs[m.group(1)]
+                    with server._lock:
+                        job["polls"] += 1
+                        if job["polls"] >= server.batch_polls and "output" not in job:
+                            server._run_job(job)
+                    return self._send_json(200, server._job_view(m.group(1), job))
+
+                m = _DOWNLOAD_RE.match(path)
+                if m and m.group(1) in server.files:
+                    body = server.files[m.group(1)]
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/jsonl")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+        return Handler
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    """Faults の指定を受けるオプション（bench_gemini_mock.py と共用）。"""
+    parser.add_argument("--latency", default="",
+                        help="応答までの秒数。'0.8' で固定、'0.8,3.0' で中央値,p95 の対数正規分布")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="ストリームの断片間の秒数")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-503", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 で指示する待ち秒数")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def faults_from_args(args: argparse.Namespace) -> Faults:
+    latency = None
+    if args.latency:
+        values = [float(v) for v in args.latency.split(",")]
+        latency = fixed_latency(values[0]) if len(values) == 1 else lognormal_latency(*values[:2])
+    return Faults(
+        latency=latency,
+        chunk_delay=args.chunk_delay,
+        rate_429=args.rate_429,
+        rate_503=args.rate_503,
+        truncate_rate=args.truncate_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini API モックサーバー")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-polls", type=int, default=2, help="ジョブ完了までの確認回数")
+    parser.add_argument("--rules", action="store_true", help="responseSchema に沿った応答を返す")
+    parser.add_argument("--canned", help="固定応答の JSON ファイル（{プロンプトの部分文字列: 応答}）")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    responder = default_responder
+    if args.rules or args.canned:
+        canned = {}
+        if args.canned:
+            with open(args.canned, encoding="utf-8") as f:
+                canned = json.load(f)
+        responder = functools.partial(rule_responder, canned=canned)
+
+    server = MockGeminiServer(
+        responder, port=args.port, batch_polls=args.batch_polls, faults=faults_from_args(args),
+    )
+    print(f"Mock Gemini server: {server.url}  (GEMINI_API_BASE={server.url})")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"stats: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
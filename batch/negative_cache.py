@@ -0,0 +1,79 @@
+"""公募ナビAI - 詳細URLの失敗キャッシュ（ネガティブキャッシュ）
+
+詳細ページの取得・抽出に失敗した URL を理由ごとの有効期限付きで記録する。
+- プロセス内: URL → (理由, 期限) の辞書をロックで保護（ワーカースレッド間で共有）
+- 永続化: opportunities.detail_fail_reason / detail_retry_after に書き戻し、
+  get_unenriched_opportunities が期限まで対象から外す（次回以降の実行にも効く）
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+import config
+import db
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND = "not_found"
+HTTP_ERROR = "http_error"
+TIMEOUT = "timeout"
+TOO_SHORT = "too_short"
+EXTRACT_FAILED = "extract_failed"
+
+
+def reason_for_exception(exc: requests.RequestException) -> str:
+    """取得時の例外を失敗理由に分類する。"""
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        if exc.response.status_code in (404, 410):
+            return NOT_FOUND
+        return HTTP_ERROR
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+        return TIMEOUT
+    return HTTP_ERROR
+
+
+class NegativeCache:
+    """有効期限付きの失敗URLキャッシュ（スレッドセーフ）。"""
+
+    def __init__(self, ttl_hours: dict[str, int] | None = None, persist: bool = True):
+        self.ttl_hours = ttl_hours or config.DETAIL_FAILURE_TTL_HOURS
+        self.persist = persist
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[str, float]] = {}
+
+    def get(self, url: str) -> str | None:
+        """有効な失敗記録があれば理由を返す。"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            reason, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[url]
+                return None
+            self.hits += 1
+            return reason
+
+    def add(self, url: str, reason: str, opp_id: str | None = None):
+        """失敗を記録する。opp_id があれば DB にも書き戻す。"""
+        ttl = self.ttl_hours.get(reason, self.ttl_hours[HTTP_ERROR])
+        with self._lock:
+            self._entries[url] = (reason, time.time() + ttl * 3600)
+
+        if not (self.persist and opp_id):
+            return
+        retry_after = datetime.now(timezone.utc) + timedelta(hours=ttl)
+        try:
+            db.mark_detail_failure(opp_id, reason, retry_after.isoformat())
+        except Exception as exc:
+            # 保存できないと次回も再試行の間隔なしで取りにいくので、見える形で残す
+            logger.warning("失敗記録の保存失敗 %s: %s", opp_id, exc)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -4,6 +4,7 @@
 各案件のAI詳細分析を生成 or キャッシュ取得し、メールにインライン表示。
 """
 
+import asyncio
 import json
 import logging
 from datetime import datetime, timezone
@@ -12,7 +13,11 @@ import requests
 
 import config
 import db
-from gemini_client import call_gemini, parse_json_response
+import deferred_queue
+from gemini_async import AsyncGemini
+from gemini_client import QuotaError
+from rate_limiter import PRIORITY_HIGH
+from response_schema import array, obj, string
 
 logger = logging.getLogger(__name__)
 
@@ -52,20 +57,33 @@ def notify_user(user: dict) -> int:
         logger.warning("プロフィール未設定: %s", user_id)
         return 0
 
-    # 各案件のAI詳細分析を生成 or キャッシュ取得
-    analyzed_opps = []
-    for opp in new_opps[:max_in_email]:
+    # 各案件のAI詳細分析をキャッシュ取得し、無いものは同時に生成する
+    targets = new_opps[:max_in_email]
+    analyses: dict[str, dict | None] = {}
+    to_generate = []
+    for opp in targets:
         try:
-            analysis = db.get_cached_analysis(user_id, opp["id"])
-            if not analysis:
-                analysis = _generate_analysis(profile, opp)
-                if analysis:
-                    db.save_detailed_analysis(user_id, opp["id"], analysis)
-            analyzed_opps.append({"opportunity": opp, "analysis": analysis})
+            analyses[opp["id"]] = db.get_cached_analysis(user_id, opp["id"])
         except Exception as exc:
             # 分析失敗は見落とさないよう warning レベルで記録
             logger.warning("分析失敗 %s: %s", opp["id"], exc)
-            analyzed_opps.append({"opportunity": opp, "analysis": None})
+            analyses[opp["id"]] = None
+            continue
+        if not analyses[opp["id"]]:
+            to_generate.append(opp)
+
+    if to_generate:
+        generated = asyncio.run(_generate_analyses(profile, to_generate))
+        for opp, analysis in zip(to_generate, generated):
+            analyses[opp["id"]] = analysis
+            if not analysis:
+                continue
+            try:
+                db.save_detailed_analysis(user_id, opp["id"], analysis)
+            except Exception as exc:
+                logger.warning("分析の保存失敗 %s: %s", opp["id"], exc)
+
+    analyzed_opps = [{"opportunity": opp, "analysis": analyses[opp["id"]]} for opp in targets]
 
     if not analyzed_opps:
         return 0
@@ -91,9 +109,46 @@ def notify_user(user: dict) -> int:
     return len(analyzed_opps) if success else 0
 
 
-def _generate_analysis(profile: dict, opp: dict) -> dict | None:
-    """案件のAI詳細分析をGeminiで生成する。"""
-    prompt = f"""あなたは公募案件と企業のマッチング分析の専門家です。
+# AI詳細分析の応答スキーマ
+ANALYSIS_SCHEMA = obj({
+    "summary": string(),
+    "match_points": array(string()),
+    "concerns": array(string()),
+    "actions": array(string()),
+})
+
+
+async def _generate_analyses(profile: dict, opps: list[dict]) -> list[dict | None]:
+    """複数案件のAI詳細分析を同時に生成する（失敗した案件は None）。
+
+    メール送信を遅らせないよう、p95 を過ぎた呼び出しはヘッジする。
+    Gemini の quota 切れで生成できなかった分は deferred_queue に積み、次回の実行で
+    生成して保存する（今回のメールは分析なしで送る）。
+    """
+    async with AsyncGemini() as client:
+        results = await client.gather(
+            client.generate_json(
+                _analysis_prompt(profile, opp), ANALYSIS_SCHEMA,
+                max_tokens=2048, priority=PRIORITY_HIGH, tag="notify_analysis", hedge=True,
+            )
+            for opp in opps
+        )
+    analyses, deferred = [], []
+    for opp, result in zip(opps, results):
+        if isinstance(result, Exception):
+            logger.warning("Gemini分析失敗 %s: %s", opp["id"], result)
+            if isinstance(result, QuotaError):
+                deferred.append(opp["id"])
+            result = None
+        analyses.append(result)
+    if deferred:
+        deferred_queue.defer(deferred_queue.ANALYSIS, deferred, user_id=profile["user_id"])
+    return analyses
+
+
+def _analysis_prompt(profile: dict, opp: dict) -> str:
+    """案件のAI詳細分析のプロンプト。"""
+    return f"""あなたは公募案件と企業のマッチング分析の専門家です。
 以下の案件情報と企業プロフィールを照らし合わせて、詳細な分析をJSON形式で出力してください。
 
 【案件情報】
@@ -119,15 +174,6 @@ def _generate_analysis(profile: dict, opp: dict) -> dict | None:
   "actions": ["アクション1", "アクション2", "アクション3"]
 }}"""
 
-    try:
-        response = call_gemini(prompt, json_mode=True, max_tokens=2048)
-        result = parse_json_response(response)
-        if isinstance(result, dict):
-            return result
-    except Exception as exc:
-        logger.warning("Gemini分析失敗: %s", exc)
-    return None
-
 
 def _send_notification(
     user: dict,
@@ -0,0 +1,170 @@
+"""公募ナビAI - ステージ分割の並列パイプライン
+
+fetch → extract → write のように性質の違う処理を、ステージごとの
+ワーカープールと上限付きキューでつなぐ。ネットワーク待ちの多い取得は
+並列数を上げ、レート制限のある Gemini は quota に合わせて絞る、といった
+ステージ単位の調整ができる。キューが満杯なら上流が待つ（背圧）。
+
+各ステージの関数は1件を受け取り、次ステージへ渡す値を返す（None なら破棄）。
+batch_size を指定したステージは最大 batch_size 件のリストを受け取り、リストを返す。
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Stage:
+    """パイプラインの1段（ワーカー数・キュー長・統計を持つ）。"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        workers: int = 1,
+        queue_size: int = 100,
+        batch_size: int | None = None,
+        batch_wait: float = 0.5,
+    ):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0  # 受け取った件数
+        self.emitted = 0  # 次ステージへ渡した件数
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def stats(self, elapsed: float) -> dict:
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "emitted": self.emitted,
+                "errors": self.errors,
+                "queued": self.queue.qsize(),
+                "per_min": self.processed / max(elapsed, 1) * 60,
+                "utilization": self.busy_seconds / max(elapsed * self.workers, 1e-9),
+            }
+
+    def _take(self) -> tuple[list, bool]:
+        """キューから最大 batch_size 件を取る。終了マーカーを受けたら done=True。"""
+        first = self.queue.get()
+        if first is _DONE:
+            return [], True
+        items = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(items) < (self.batch_size or 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return items, True
+            items.append(item)
+        return items, False
+
+
+class Pipeline:
+    """Stage を順につないで実行する。"""
+
+    def __init__(self, stages: list[Stage], log_interval: float = 30):
+        self.stages = stages
+        self.log_interval = log_interval
+        self._started = 0.0
+
+    def run(self, items: Iterable):
+        """全件を流し、最終ステージまで処理し終えたら戻る。
+
+        同じ Pipeline で複数回 run してよい（統計は初回 run からの累計）。
+        """
+        if not self._started:
+            self._started = time.time()
+        threads = []
+        for i, stage in enumerate(self.stages):
+            out = self.stages[i + 1].queue if i + 1 < len(self.stages) else None
+            stage_threads = [
+                threading.Thread(
+                    target=self._work, args=(stage, out),
+                    name=f"{stage.name}-{n}", daemon=True,
+                )
+                for n in range(stage.workers)
+            ]
+            for t in stage_threads:
+                t.start()
+            threads.append(stage_threads)
+
+        stop = threading.Event()
+        monitor = threading.Thread(target=self._monitor, args=(stop,), daemon=True)
+        monitor.start()
+
+        try:
+            first = self.stages[0]
+            for item in items:
+                first.queue.put(item)
+            # 上流ステージが終わってから次ステージに終了マーカーを流す
+            for i, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    stage.queue.put(_DONE)
+                for t in threads[i]:
+                    t.join()
+        finally:
+            stop.set()
+            monitor.join()
+
+    def stats(self) -> dict[str, dict]:
+        """ステージごとの件数・スループット・稼働率。"""
+        elapsed = time.time() - self._started
+        return {stage.name: stage.stats(elapsed) for stage in self.stages}
+
+    def log_stats(self):
+        for name, s in self.stats().items():
+            logger.info(
+                "  [%s] 処理=%d, 出力=%d, エラー=%d, 待ち=%d | %.0f件/分, 稼働率 %.0f%%",
+                name, s["processed"], s["emitted"], s["errors"], s["queued"],
+                s["per_min"], s["utilization"] * 100,
+            )
+
+    def _work(self, stage: Stage, out: queue.Queue | None):
+        while True:
+            items, done = stage._take()
+            if items:
+                self._process(stage, items, out)
+            if done:
+                return
+
+    def _process(self, stage: Stage, items: list, out: queue.Queue | None):
+        started = time.monotonic()
+        try:
+            if stage.batch_size is not None:
+                outputs = stage.func(items) or []
+            else:
+                result = stage.func(items[0])
+                outputs = [] if result is None else [result]
+        except Exception as exc:
+            logger.warning("ステージ %s エラー（%d件を破棄）: %s", stage.name, len(items), exc)
+            outputs = []
+            with stage._lock:
+                stage.errors += len(items)
+        with stage._lock:
+            stage.processed += len(items)
+            stage.emitted += len(outputs)
+            stage.busy_seconds += time.monotonic() - started
+        if out is not None:
+            for output in outputs:
+                out.put(output)
+
+    def _monitor(self, stop: threading.Event):
+        while not stop.wait(self.log_interval):
+            self.log_stats()
@@ -0,0 +1,135 @@
+"""公募ナビAI - Gemini の quota サーキットブレーカー
+
+1日の quota を使い切ったあとも、残りの呼び出しはそれぞれ 429 のリトライで
+30+60+120 秒待ってから失敗していた。夜間バッチの残り時間がその待ちに消える。
+
+モデルごとに、空いたキーのない 429 を数えて
+- 日次 quota 切れ（QuotaFailure の quotaId が PerDay）なら1回で
+- それ以外は連続 GEMINI_BREAKER_THRESHOLD 回で
+開く（open）。開いている間、そのモデルへの呼び出しは送信も待機もせず
+CircuitOpenError になる（経路に次のモデルがあればそちらへ切り替わる）。
+GEMINI_BREAKER_COOLDOWN 秒（日次 quota なら GEMINI_BREAKER_DAILY_COOLDOWN 秒）たつと
+1本だけ試しに通し（half-open）、成功すれば閉じ、429 ならまた開く。
+
+実行できなかった処理は呼び出し側で deferred_queue に積み、次回の実行の最初に流す。
+"""
+
+import logging
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaError(RuntimeError):
+    """429（quota・レート制限）で諦めた呼び出し。daily=True は日次 quota 切れ。"""
+
+    def __init__(self, message: str, daily: bool = False):
+        super().__init__(message)
+        self.daily = daily
+
+
+class CircuitOpenError(QuotaError):
+    """ブレーカーが開いているため送らなかった呼び出し。"""
+
+
+class _State:
+    def __init__(self):
+        self.failures = 0
+        self.opened_until = 0.0  # 0 = 閉じている
+        self.probing_since: float | None = None  # half-open の試しの1本を通した時刻
+        self.daily = False
+
+
+class QuotaBreaker:
+    """モデルごとの quota 切れの状態（スレッドセーフ）。"""
+
+    def __init__(
+        self,
+        threshold: int = config.GEMINI_BREAKER_THRESHOLD,
+        cooldown: float = config.GEMINI_BREAKER_COOLDOWN,
+        daily_cooldown: float = config.GEMINI_BREAKER_DAILY_COOLDOWN,
+    ):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.daily_cooldown = daily_cooldown
+        self.stats = {"tripped": 0, "rejected": 0, "recovered": 0}
+        self._states: dict[str, _State] = {}
+        self._lock = threading.Lock()
+
+    def check(self, model: str) -> bool:
+        """model に送ってよければ戻り、開いていれば CircuitOpenError を送出する。
+
+        待ち時間が明けていれば1本だけ通す（試しの1本が戻らないまま cooldown 秒たてば次の1本）。
+
+        Returns:
+            試しの1本として通したなら True
+        """
+        now = time.time()
+        with self._lock:
+            state = self._states.get(model)
+            if state is None or not state.opened_until:
+                return False
+            probing = state.probing_since is not None and now - state.probing_since < self.cooldown
+            if now >= state.opened_until and not probing:
+                state.probing_since = now
+                logger.info("Gemini %s: quota ブレーカーの待ちが明けたため1本だけ試す", model)
+                return True
+            self.stats["rejected"] += 1
+            remaining = max(state.opened_until - now, 0)
+            daily = state.daily
+        raise CircuitOpenError(
+            f"Gemini {model}: quota 切れのため送信しない（ブレーカー作動中・残り{remaining:.0f}秒）",
+            daily=daily,
+        )
+
+    def success(self, model: str):
+        """model の呼び出しが通った（連続回数を戻し、開いていれば閉じる）。"""
+        with self._lock:
+            state = self._states.pop(model, None)
+            recovered = state is not None and bool(state.opened_until)
+            if recovered:
+                self.stats["recovered"] += 1
+        if recovered:
+            logger.info("Gemini %s: quota が戻ったためブレーカーを閉じる", model)
+
+    def failure(self, model: str, daily: bool = False):
+        """model が空いたキーのない 429 を受けた。条件を満たせば開く。"""
+        now = time.time()
+        with self._lock:
+            state = self._states.setdefault(model, _State())
+            state.failures += 1
+            probe_failed = state.probing_since is not None
+            if not (daily or probe_failed or state.failures >= self.threshold):
+                return
+            already_open = now < state.opened_until
+            cooldown = self.daily_cooldown if daily else self.cooldown
+            state.opened_until = max(state.opened_until, now + cooldown)
+            state.daily = state.daily or daily
+            state.probing_since = None
+            state.failures = 0
+            if not already_open:
+                self.stats["tripped"] += 1
+        if not already_open:
+            if daily:
+                reason = "日次 quota 切れ"
+            elif probe_failed:
+                reason = "試しの1本の 429"
+            else:
+                reason = f"429 の{self.threshold}回連続"
+            logger.warning(
+                "Gemini %s: %sのため quota ブレーカーを開く（%.0f秒は送信せずに失敗させる）",
+                model, reason, cooldown,
+            )
+
+    def is_open(self, model: str) -> bool:
+        """model が quota 切れで開いたまま（まだ成功で閉じていない）か。"""
+        with self._lock:
+            state = self._states.get(model)
+            return state is not None and bool(state.opened_until)
+
+    def all_open(self, models: tuple[str, ...]) -> bool:
+        """経路のモデルがすべて開いているか（その処理は今は実行できない）。"""
+        return all(self.is_open(model) for model in models)
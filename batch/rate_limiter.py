@@ -0,0 +1,201 @@
+"""公募ナビAI - Gemini 呼び出しのレート制限（トークンバケット + 優先度）
+
+RPM（リクエスト数/分）と TPM（推定入力トークン数/分）の2つのバケットで
+プロセス全体の呼び出しを絞る。空きがなければ呼び出し側はキューに並んで待ち、
+優先度の高い（数値が小さい）呼び出しから順に通す。
+
+429 を受けたら pause() でリミッター全体を止める。各スレッドが個別に
+バックオフして一斉に再送する（thundering herd）のを防ぐ。
+
+store_path を指定すると、バケットの状態を SQLite に置いて複数プロセスで共有する
+（同時に動く daily_check と backfill_details で quota を分け合う場合など）。
+優先度の順番はプロセス内でのみ保証される。
+
+APIキーを複数使う場合はキーごとに1つ作る（key_pool.py）。headroom() で
+残りの枠を見て、空いているキーに振り分ける。
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from local_store import connect
+
+logger = logging.getLogger(__name__)
+
+# 優先度（小さいほど先に通す）
+PRIORITY_HIGH = 0  # 通知用の分析など、ユーザーに届くもの
+PRIORITY_NORMAL = 1  # マッチング・スクレイピング
+PRIORITY_LOW = 2  # バックフィル・業種分類などの一括処理
+
+
+class _MemoryBuckets:
+    """プロセス内のバケット状態。"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._levels = [float(rpm), float(tpm)]
+        self._updated = time.time()
+        self._paused_until = 0.0
+
+    def take(self, tokens: int) -> float:
+        """1リクエスト + tokens を取る。取れたら 0、足りなければ待つべき秒数を返す。"""
+        now = time.time()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._levels, wait = _refill_and_take(
+            self._levels, now - self._updated, self.rpm, self.tpm, tokens,
+        )
+        self._updated = now
+        return wait
+
+    def level(self) -> float:
+        """取らずに見た残りの割合（0〜1。停止中は 0）。"""
+        now = time.time()
+        if now < self._paused_until:
+            return 0.0
+        return _level(self._levels, now - self._updated, self.rpm, self.tpm)
+
+    def pause(self, until: float):
+        self._paused_until = max(self._paused_until, until)
+
+
+class _SqliteBuckets:
+    """SQLite に置いたバケット状態（複数プロセスで共有）。"""
+
+    def __init__(self, rpm: int, tpm: int, path: str):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._conn = connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS gemini_bucket ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1),"
+            " requests REAL NOT NULL, tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL, paused_until REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO gemini_bucket VALUES (1, ?, ?, ?, 0)",
+            (rpm, tpm, time.time()),
+        )
+
+    def take(self, tokens: int) -> float:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            requests_level, tokens_level, updated, paused_until = self._conn.execute(
+                "SELECT requests, tokens, updated_at, paused_until FROM gemini_bucket WHERE id = 1"
+            ).fetchone()
+            now = time.time()
+            if now < paused_until:
+                self._conn.execute("COMMIT")
+                return paused_until - now
+            levels, wait = _refill_and_take(
+                [requests_level, tokens_level], now - updated, self.rpm, self.tpm, tokens,
+            )
+            self._conn.execute(
+                "UPDATE gemini_bucket SET requests = ?, tokens = ?, updated_at = ? WHERE id = 1",
+                (levels[0], levels[1], now),
+            )
+            self._conn.execute("COMMIT")
+            return wait
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def level(self) -> float:
+        requests_level, tokens_level, updated, paused_until = self._conn.execute(
+            "SELECT requests, tokens, updated_at, paused_until FROM gemini_bucket WHERE id = 1"
+        ).fetchone()
+        now = time.time()
+        if now < paused_until:
+            return 0.0
+        return _level([requests_level, tokens_level], now - updated, self.rpm, self.tpm)
+
+    def pause(self, until: float):
+        self._conn.execute(
+            "UPDATE gemini_bucket SET paused_until = MAX(paused_until, ?) WHERE id = 1", (until,)
+        )
+
+
+def _refill_and_take(
+    levels: list[float], elapsed: float, rpm: int, tpm: int, tokens: int,
+) -> tuple[list[float], float]:
+    """経過時間分を補充してから取る。(新しい残量, 待ち秒数) を返す。"""
+    requests_level = min(rpm, levels[0] + elapsed * rpm / 60)
+    tokens_level = min(tpm, levels[1] + elapsed * tpm / 60)
+    if requests_level >= 1 and tokens_level >= tokens:
+        return [requests_level - 1, tokens_level - tokens], 0.0
+    wait = max(
+        (1 - requests_level) / (rpm / 60),
+        (tokens - tokens_level) / (tpm / 60),
+    )
+    return [requests_level, tokens_level], max(wait, 0.01)
+
+
+def _level(levels: list[float], elapsed: float, rpm: int, tpm: int) -> float:
+    """補充後の残量を RPM・TPM のうち少ない方の割合で返す。"""
+    requests_level = min(rpm, levels[0] + elapsed * rpm / 60)
+    tokens_level = min(tpm, levels[1] + elapsed * tpm / 60)
+    return min(requests_level / rpm, tokens_level / tpm)
+
+
+class RateLimiter:
+    """優先度付きキューで待たせるトークンバケット型リミッター（スレッドセーフ）。"""
+
+    def __init__(self, rpm: int, tpm: int, store_path: str | None = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        if store_path:
+            self._buckets = _SqliteBuckets(rpm, tpm, store_path)
+        else:
+            self._buckets = _MemoryBuckets(rpm, tpm)
+        self._cond = threading.Condition()
+        self._waiters: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self.stats = {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "paused": 0}
+
+    def acquire(self, tokens: int = 0, priority: int = PRIORITY_NORMAL):
+        """枠が空くまで待ってから1リクエスト分を取る。
+
+        先頭（優先度が最も高く、同じ優先度なら先着）の呼び出しだけが
+        バケットから取り、後続はその完了を待つ。
+        """
+        tokens = min(tokens, self.tpm)  # バケット容量を超える要求は満杯で通す
+        started = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    if self._waiters[0] == ticket:
+                        wait = self._buckets.take(tokens)
+                        if wait <= 0:
+                            break
+                        self._cond.wait(timeout=wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+            waited = time.monotonic() - started
+            self.stats["acquired"] += 1
+            if waited >= 0.01:
+                self.stats["waited"] += 1
+                self.stats["wait_seconds"] += waited
+
+    def headroom(self) -> float:
+        """すぐ使える枠の割合（0〜1）。並んでいる呼び出しの分を差し引く。"""
+        with self._cond:
+            return max(0.0, self._buckets.level() - len(self._waiters) / self.rpm)
+
+    def pause(self, seconds: float):
+        """429 を受けたとき、全呼び出しを seconds 秒止める。"""
+        with self._cond:
+            self._buckets.pause(time.time() + seconds)
+            self.stats["paused"] += 1
+            self._cond.notify_all()
+        logger.warning("Gemini rate limit: 全呼び出しを %.0f秒停止", seconds)
@@ -0,0 +1,51 @@
+"""公募ナビAI - Gemini 応答のディスクキャッシュ
+
+同じプロンプト（同じページ本文・同じ分類バッチ・同じ企業分析）は再実行でも
+繰り返し送られるため、応答テキストを内容アドレスで SQLite に保存して再利用する。
+
+- キー: sha256(モデル名 + generationConfig + プロンプト)
+- 有効期限: 既定TTL（0 なら無期限）
+- 容量上限: 圧縮後の合計サイズを超えたら最終アクセスの古い順（LRU）に削除
+"""
+
+import hashlib
+import json
+import time
+
+import config
+from local_store import LruStore
+
+
+def cache_key(model: str, generation_config: dict, prompt: str) -> str:
+    material = json.dumps(
+        {"model": model, "config": generation_config, "prompt": prompt},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """プロンプト → 応答テキストの SQLite キャッシュ（スレッドセーフ）。"""
+
+    def __init__(
+        self,
+        path: str = "gemini_cache.sqlite3",
+        ttl: int = config.GEMINI_CACHE_TTL,
+        max_bytes: int = config.GEMINI_CACHE_MAX_BYTES,
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {"hit": 0, "miss": 0, "evicted": 0}
+        self._store = LruStore(path, "gemini_cache", max_bytes, self.stats)
+
+    def get(self, key: str) -> str | None:
+        """有効な応答があれば返す（期限切れは削除してミス扱い）。"""
+        entry = self._store.get(key)
+        return entry.value.decode("utf-8") if entry is not None else None
+
+    def put(self, key: str, response: str):
+        expires_at = time.time() + self.ttl if self.ttl else 0
+        self._store.put(key, response.encode("utf-8"), expires_at)
+
+    def delete(self, key: str):
+        self._store.delete(key)
@@ -0,0 +1,133 @@
+"""公募ナビAI - Gemini の responseSchema と検証器
+
+各呼び出し箇所は出力形式を responseSchema（OpenAPI のサブセット）で宣言し、
+Gemini 側で形式を拘束させる。受け取った JSON は同じスキーマから作った
+検証器で確認する（修復・正規表現による救出に頼らない）。
+
+検証器はスキーマごとに一度だけ組み立て（クロージャの木）、以後は再利用する。
+"""
+
+import json
+import threading
+from typing import Any, Callable
+
+Validator = Callable[[Any, str], str | None]
+
+
+class SchemaError(ValueError):
+    """応答がスキーマに合わない。"""
+
+
+def string(enum: tuple[str, ...] | None = None, nullable: bool = False) -> dict:
+    schema: dict = {"type": "STRING"}
+    if enum:
+        schema["enum"] = list(enum)
+    if nullable:
+        schema["nullable"] = True
+    return schema
+
+
+def integer(nullable: bool = False) -> dict:
+    return {"type": "INTEGER", "nullable": True} if nullable else {"type": "INTEGER"}
+
+
+def array(items: dict) -> dict:
+    return {"type": "ARRAY", "items": items}
+
+
+def obj(properties: dict[str, dict], required: list[str] | None = None) -> dict:
+    return {
+        "type": "OBJECT",
+        "properties": properties,
+        "required": list(properties) if required is None else required,
+    }
+
+
+_compiled: dict[str, Validator] = {}
+_compiled_lock = threading.Lock()
+
+
+def compile_schema(schema: dict) -> Callable[[Any], str | None]:
+    """スキーマから検証関数を作る。戻り値の関数は不一致の説明（一致なら None）を返す。"""
+    key = json.dumps(schema, sort_keys=True, ensure_ascii=False)
+    with _compiled_lock:
+        validator = _compiled.get(key)
+        if validator is None:
+            validator = _compiled[key] = _compile(schema)
+    return lambda value: validator(value, "$")
+
+
+def validate(value: Any, schema: dict):
+    """スキーマに合わなければ SchemaError を送出する。"""
+    error = compile_schema(schema)(value)
+    if error:
+        raise SchemaError(error)
+
+
+def _compile(schema: dict) -> Validator:
+    kind = schema.get("type", "").upper()
+    nullable = schema.get("nullable", False)
+
+    if kind == "OBJECT":
+        properties = {k: _compile(v) for k, v in schema.get("properties", {}).items()}
+        required = tuple(schema.get("required", ()))
+
+        def check(value, path):
+            if not isinstance(value, dict):
+                return f"{path}: object ではない"
+            for key in required:
+                if key not in value:
+                    return f"{path}.{key}: 必須項目がない"
+            for key, item in value.items():
+                sub = properties.get(key)
+                if sub is not None:
+                    error = sub(item, f"{path}.{key}")
+                    if error:
+                        return error
+            return None
+
+    elif kind == "ARRAY":
+        item_check = _compile(schema.get("items", {}))
+
+        def check(value, path):
+            if not isinstance(value, list):
+                return f"{path}: array ではない"
+            for i, item in enumerate(value):
+                error = item_check(item, f"{path}[{i}]")
+                if error:
+                    return error
+            return None
+
+    elif kind == "STRING":
+        enum = frozenset(schema["enum"]) if schema.get("enum") else None
+
+        def check(value, path):
+            if not isinstance(value, str):
+                return f"{path}: string ではない"
+            if enum is not None and value not in enum:
+                return f"{path}: 許可されていない値 {value!r}"
+            return None
+
+    elif kind == "INTEGER":
+        def check(value, path):
+            if isinstance(value, bool) or not isinstance(value, int):
+                return f"{path}: integer ではない"
+            return None
+
+    elif kind == "NUMBER":
+        def check(value, path):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return f"{path}: number ではない"
+            return None
+
+    elif kind == "BOOLEAN":
+        def check(value, path):
+            return None if isinstance(value, bool) else f"{path}: boolean ではない"
+
+    else:
+        def check(value, path):
+            return None
+
+    if not nullable:
+        return lambda value, path: f"{path}: null は不可" if value is None else check(value, path)
+    return lambda value, path: None if value is None else check(value, path)
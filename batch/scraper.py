@@ -7,20 +7,64 @@ import requests
 from bs4 import BeautifulSoup
 
 import config
+from http_cache import HttpCache
 
 logger = logging.getLogger(__name__)
 
+# ディスクキャッシュ（enable_cache() で有効化したコマンドのみ使用）
+_cache: HttpCache | None = None
 
-def fetch_page(url: str) -> requests.Response:
-    """Web ページを取得する。"""
+
+def enable_cache(
+    path: str = "http_cache.sqlite3",
+    ttl: int = config.HTTP_CACHE_TTL,
+    max_bytes: int = config.HTTP_CACHE_MAX_BYTES,
+) -> HttpCache:
+    """fetch_page のディスクキャッシュを有効化する。"""
+    global _cache
+    _cache = HttpCache(path, ttl=ttl, max_bytes=max_bytes)
+    logger.info("HTTPキャッシュ有効: %s (TTL=%ds, 上限=%dMB)", path, ttl, max_bytes // 1024 // 1024)
+    return _cache
+
+
+def get_cache() -> HttpCache | None:
+    """有効なディスクキャッシュを返す（無効ならNone）。"""
+    return _cache
+
+
+def fetch_page(url: str, use_cache: bool = True) -> requests.Response:
+    """Web ページを取得する。
+
+    キャッシュ有効時は新鮮なエントリをそのまま返し、期限切れなら
+    ETag / Last-Modified で再検証する。一覧ページなど常に最新が必要な
+    呼び出しは use_cache=False を指定する。
+    """
     headers = {"User-Agent": config.USER_AGENT}
+    cache = _cache if use_cache else None
+
+    entry = cache.get(url) if cache else None
+    if entry is not None:
+        if entry.fresh:
+            cache.record("hit")
+            return entry.to_response()
+        headers.update(entry.validators())
+
     resp = requests.get(
         url,
         headers=headers,
         timeout=config.REQUEST_TIMEOUT,
         allow_redirects=True,
     )
+
+    if entry is not None and resp.status_code == 304:
+        cache.record("revalidated")
+        cache.refresh(url, resp)
+        return entry.to_response()
+
     resp.raise_for_status()
+    if cache is not None:
+        cache.record("miss")
+        cache.put(url, resp)
     return resp
 
 
@@ -28,8 +72,9 @@ def extract_text(
     html_content: bytes,
     include_links: bool = False,
     base_url: str = "",
+    max_length: int | None = config.MAX_TEXT_LENGTH,
 ) -> str:
-    """HTML からテキストを抽出する。"""
+    """HTML からテキストを抽出する。max_length を超えた分は切り捨てる（None で無制限）。"""
     soup = BeautifulSoup(html_content, "html.parser")
 
     for tag in soup(["script", "style", "noscript", "iframe"]):
@@ -52,7 +97,7 @@ def extract_text(
             text += "\n\n--- ページ内リンク ---\n"
             text += "\n".join(links[:200])
 
-    if len(text) > config.MAX_TEXT_LENGTH:
-        text = text[: config.MAX_TEXT_LENGTH] + "\n...(以下省略)"
+    if max_length is not None and len(text) > max_length:
+        text = text[:max_length] + "\n...(以下省略)"
 
     return text
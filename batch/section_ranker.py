@@ -0,0 +1,150 @@
+"""公募ナビAI - 詳細ページの関連セクション選択
+
+長いページを先頭から切り詰めると、末尾にある期限・予算・問い合わせ先が
+落ち、ヘッダーやナビゲーションにトークンを使ってしまう。
+ページを見出し単位のセクションに分け、抽出したい項目のキーワードで採点し、
+点数の高いセクションをトークン予算まで集めて元の順に並べ直す。
+"""
+
+import re
+
+from gemini_client import estimate_tokens
+
+# 1セクションの最大文字数（見出しのない長い本文・長い1行はここで区切る）
+_SECTION_MAX_CHARS = 800
+_OMITTED_TAIL = "...(以下省略)"
+_GAP = "\n...\n"  # セクション間の区切り（省略の印を含む最大の場合）
+
+# 見出しらしい行（番号・記号・【】で始まる短い行）
+_HEADING_RE = re.compile(
+    r"^(?:\d{1,2}[.．、)）]|[（(]\d{1,2}[)）]|[０-９]{1,2}[．、]|第[0-9０-９一二三四五六七八九十]+|[■□●○◆◇▼【])"
+)
+
+# 項目ごとの手がかり（抽出対象の項目だけ採点に使う）
+_FIELD_PATTERNS = {
+    "published_date": re.compile(r"公告日|公示日|掲載日|公開日"),
+    "deadline": re.compile(r"期限|締切|締め切り|期日|受付期間|提出期間|申込期間"),
+    "bid_opening_date": re.compile(r"開札|入札日|入札執行|入札の日時"),
+    "contract_period": re.compile(r"履行期間|契約期間|業務期間|委託期間|履行期限"),
+    "briefing_date": re.compile(r"説明会"),
+    "budget": re.compile(r"予算|予定価格|上限額|限度額|金額|[0-9,]+\s*(?:千|万|億)?円"),
+    "requirements": re.compile(r"資格|要件|条件|実績|登録|参加"),
+    "contact_info": re.compile(r"問い?合わ?せ|問合せ|連絡先|担当|TEL|電話|@"),
+    "detailed_summary": re.compile(r"業務内容|概要|目的|仕様|業務名|件名"),
+    "industry_category": re.compile(r"業務内容|概要|仕様|業務名|件名"),
+    "difficulty": re.compile(r"資格|実績|規模|要件"),
+}
+_DATE_RE = re.compile(r"(?:令和|平成|R|H)\s*[0-9０-９元]{1,2}\s*年|20\d{2}\s*[年/.-]")
+# メニュー・フッター等の定型文（減点）
+_BOILERPLATE_RE = re.compile(r"ホーム|トップページ|サイトマップ|プライバシー|著作権|Copyright|ページの先頭|メニュー")
+
+
+def split_sections(text: str) -> list[str]:
+    """テキストを見出し・空行単位のセクションに分ける。"""
+    sections = []
+    current: list[str] = []
+    size = 0
+    for line in _split_long_lines(text.splitlines()):
+        starts_new = not line or _HEADING_RE.match(line) or size + len(line) > _SECTION_MAX_CHARS
+        if starts_new and current:
+            sections.append("\n".join(current))
+            current, size = [], 0
+        if line:
+            current.append(line)
+            size += len(line)
+    if current:
+        sections.append("\n".join(current))
+    return sections
+
+
+def _split_long_lines(lines: list[str]):
+    """1行が _SECTION_MAX_CHARS を超える場合は区切る（改行のない長い本文も複数のセクションに分ける）。"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            yield line
+        for start in range(0, len(line), _SECTION_MAX_CHARS):
+            yield line[start:start + _SECTION_MAX_CHARS]
+
+
+def _cost(section: str) -> int:
+    """選んだときに使うトークン数（前後の区切りを含む）。"""
+    return estimate_tokens(section + _GAP)
+
+
+def _truncate(section: str, max_tokens: int) -> str:
+    """section の _cost が max_tokens 以内に収まるよう末尾で切る。"""
+    if _cost(section) <= max_tokens:
+        return section
+    ascii_chars = len(_GAP)
+    for end, ch in enumerate(section):
+        if ch < "\x80":
+            ascii_chars += 1
+        # estimate_tokens と同じ数え方で、次の1文字を足すと超える位置で切る
+        if (end + 1 - (ascii_chars - len(_GAP))) + ascii_chars // 4 + 1 > max_tokens:
+            return section[:end]
+    return section
+
+
+def score_section(section: str, keys: list[str]) -> float:
+    """抽出対象の項目に関係しそうな度合いを採点する。"""
+    score = 0.0
+    for key in keys:
+        pattern = _FIELD_PATTERNS.get(key)
+        if pattern and pattern.search(section):
+            score += 1.0
+    if _DATE_RE.search(section):
+        score += 0.5
+    score -= 0.5 * len(_BOILERPLATE_RE.findall(section))
+    # 短い断片（リンク1個等）は情報が少ない
+    if len(section) < 20:
+        score -= 0.5
+    return score
+
+
+def select_sections(text: str, max_tokens: int, keys: list[str]) -> str:
+    """関連度の高いセクションを max_tokens まで集めたテキストを返す。
+
+    全体が予算内ならそのまま返す。先頭セクション（件名・概要があることが多い）
+    は常に含める。選んだセクションは元の順に並べ、間を省略した箇所に印を入れる。
+    残りの予算より大きいセクションは（先頭も含めて）予算の分だけ残して切る。
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    sections = split_sections(text)
+    if not sections:
+        return text
+
+    ranked = sorted(
+        range(1, len(sections)),
+        key=lambda i: (score_section(sections[i], keys), -i),
+        reverse=True,
+    )
+    # 末尾の省略の印の分を除いた予算で、区切りの分も含めて数える
+    budget = max_tokens - estimate_tokens(_OMITTED_TAIL)
+    sections[0] = _truncate(sections[0], budget)
+    chosen = {0}
+    used = _cost(sections[0])
+    for i in ranked:
+        if used >= budget or score_section(sections[i], keys) <= 0:
+            break
+        tokens = _cost(sections[i])
+        if used + tokens > budget:
+            sections[i] = _truncate(sections[i], budget - used)
+            if not sections[i]:
+                continue
+            tokens = _cost(sections[i])
+        chosen.add(i)
+        used += tokens
+
+    parts = []
+    previous = -1
+    for i in sorted(chosen):
+        if previous >= 0 and i != previous + 1:
+            parts.append("...")
+        parts.append(sections[i])
+        previous = i
+    if previous != len(sections) - 1:
+        parts.append(_OMITTED_TAIL)
+    return "\n".join(parts)
@@ -0,0 +1,58 @@
+"""公募ナビAI - 同一リクエストの同時実行をまとめる（single-flight）
+
+backfill_details や通知の並列ワーカーでは、重複した案件・同じページから
+同じプロンプトが複数スレッドで同時に作られることがある。応答キャッシュは
+応答が返ってから効くので、送信中の同じリクエストには効かない。
+
+同じキーの呼び出しが実行中なら、後から来たスレッドは送信せずにその完了を待ち、
+同じ結果（失敗なら同じ例外）を受け取る。状態は実行中の間だけメモリに置く。
+"""
+
+import threading
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """キーごとに実行中の呼び出しを1本にまとめる（スレッドセーフ）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+        self.stats = {"executed": 0, "shared": 0}
+
+    def do(self, key: str, func: Callable[[], T]) -> T:
+        """key の呼び出しが実行中ならその結果を待って返し、なければ func を実行する。"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["executed"] += 1
+            else:
+                self.stats["shared"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
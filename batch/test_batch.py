@@ -74,6 +74,1354 @@ def test_scraper():
         report("Scraper: extract_text", False, str(e))
 
 
+def test_http_cache():
+    """HTTPディスクキャッシュのテスト（ネットワーク不要）"""
+    print("\n=== HTTP Cache ===\n")
+
+    import tempfile
+    import requests
+    from http_cache import HttpCache
+
+    def make_resp(url, body, cache_control=None, etag=None):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = body
+        resp.url = url
+        if cache_control:
+            resp.headers["Cache-Control"] = cache_control
+        if etag:
+            resp.headers["ETag"] = etag
+        return resp
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = HttpCache(os.path.join(tmp, "c.sqlite3"), ttl=3600, max_bytes=10_000)
+
+        cache.put("https://a/", make_resp("https://a/", b"<p>A</p>", etag='"v1"'))
+        entry = cache.get("https://a/")
+        report("HttpCache: put/get", entry is not None and entry.body == b"<p>A</p>")
+        report("HttpCache: fresh within TTL", entry is not None and entry.fresh)
+        report("HttpCache: ETag validator",
+               entry is not None and entry.validators().get("If-None-Match") == '"v1"')
+
+        cache.put("https://b/", make_resp("https://b/", b"B", cache_control="no-store"))
+        report("HttpCache: no-store not cached", cache.get("https://b/") is None)
+
+        cache.put("https://c/", make_resp("https://c/", b"C", cache_control="max-age=0"))
+        entry_c = cache.get("https://c/")
+        report("HttpCache: max-age=0 is stale", entry_c is not None and not entry_c.fresh)
+        cache.refresh("https://c/", make_resp("https://c/", b"", cache_control="max-age=60", etag='"v2"'))
+        entry_c = cache.get("https://c/")
+        report("HttpCache: 304 refresh extends expiry and validators",
+               entry_c is not None and entry_c.fresh and entry_c.body == b"C"
+               and entry_c.validators().get("If-None-Match") == '"v2"')
+
+        # 圧縮が効かないランダム本文で上限超過 → 最古アクセスから削除
+        for i in range(5):
+            cache.put(f"https://big/{i}", make_resp(f"https://big/{i}", os.urandom(4000)))
+        report("HttpCache: LRU eviction keeps size bounded",
+               cache._store.total_bytes <= 10_000 and cache.get("https://a/") is None,
+               f"total={cache._store.total_bytes}, evicted={cache.stats['evicted']}")
+
+
+def test_url_prober():
+    """詳細URL死活チェックのテスト（ローカルHTTPサーバー使用）"""
+    print("\n=== URL Prober ===\n")
+
+    import http.server
+    import threading
+    from url_prober import ALIVE, DEAD, ERROR, REDIRECTED, probe_urls
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def _route(self, with_body):
+            if self.path == "/gone":
+                self.send_response(404)
+            elif self.path == "/moved":
+                self.send_response(302)
+                self.send_header("Location", "/")
+            elif self.path == "/nohead" and not with_body:
+                self.send_response(405)
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_HEAD(self):
+            self._route(False)
+
+        def do_GET(self):
+            self._route(True)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        results = probe_urls(
+            [f"{base}/page", f"{base}/gone", f"{base}/moved", f"{base}/nohead",
+             "http://127.0.0.1:9/closed"],
+            concurrency=5, timeout=3,
+        )
+    finally:
+        server.shutdown()
+
+    report("Prober: 200 is alive", results[f"{base}/page"].status == ALIVE)
+    report("Prober: 404 is dead", results[f"{base}/gone"].status == DEAD)
+    report("Prober: redirect to top", results[f"{base}/moved"].status == REDIRECTED)
+    report("Prober: HEAD 405 falls back to GET", results[f"{base}/nohead"].status == ALIVE)
+    report("Prober: connection error is undecided",
+           results["http://127.0.0.1:9/closed"].status == ERROR)
+
+    from url_prober import _is_landing_page
+    report("Prober: cross-domain redirect to top is a landing page",
+           _is_landing_page("https://www.new.example.jp/"))
+    report("Prober: cross-domain redirect to a notice is not",
+           not _is_landing_page("https://www.new.example.jp/notice123.html")
+           and not _is_landing_page("https://www.new.example.jp/index.php?id=42"))
+
+
+def test_negative_cache():
+    """詳細URL失敗キャッシュのテスト（DB書き戻しなし）"""
+    print("\n=== Negative Cache ===\n")
+
+    import requests
+    import negative_cache
+
+    cache = negative_cache.NegativeCache(
+        ttl_hours={"not_found": 1, "http_error": 1, "timeout": 0}, persist=False,
+    )
+    cache.add("https://a/", negative_cache.NOT_FOUND)
+    cache.add("https://b/", negative_cache.TIMEOUT)
+    report("NegativeCache: reason kept", cache.get("https://a/") == negative_cache.NOT_FOUND)
+    report("NegativeCache: expired entry dropped", cache.get("https://b/") is None)
+
+    resp = requests.Response()
+    resp.status_code = 404
+    reason = negative_cache.reason_for_exception(requests.HTTPError(response=resp))
+    report("NegativeCache: 404 classified", reason == negative_cache.NOT_FOUND)
+    report("NegativeCache: timeout classified",
+           negative_cache.reason_for_exception(requests.Timeout()) == negative_cache.TIMEOUT)
+
+    # DB が書き戻しを拒否したら無視せず例外にする（NegativeCache 側で warning に出す）
+    rejected = requests.Response()
+    rejected.status_code = 400
+    original = db.requests.patch
+    db.requests.patch = lambda *args, **kwargs: rejected
+    try:
+        db.mark_detail_failure("opp-x", negative_cache.NOT_FOUND, "2026-01-01T00:00:00+00:00")
+        raised = False
+    except requests.HTTPError:
+        raised = True
+    finally:
+        db.requests.patch = original
+    report("NegativeCache: rejected failure write raises", raised)
+
+
+def test_detail_rules():
+    """詳細ページのルール抽出テスト（Gemini不要）"""
+    print("\n=== Detail Rules ===\n")
+
+    from detail_rules import extract_fields
+
+    text = """令和６年度 庁舎清掃業務委託
+公告日 令和6年4月1日
+参加申込期限：令和６年４月１５日（月）午後５時
+開札日時 2024年4月25日 10時00分
+履行期間 令和6年6月1日から令和7年3月31日まで
+現場説明会 令和6年4月10日(水) 午後2時30分
+予定価格 金 12,345,000 円（税込）
+問い合わせ先
+総務部総務課契約係
+電話：052-961-2111
+E-mail: keiyaku@city.example.lg.jp"""
+    fields = extract_fields(text)
+    report("DetailRules: 和暦・全角の公告日", fields.get("published_date") == "2024-04-01",
+           f"{fields.get('published_date')}")
+    report("DetailRules: 締切", fields.get("deadline") == "2024-04-15", f"{fields.get('deadline')}")
+    report("DetailRules: 開札日", fields.get("bid_opening_date") == "2024-04-25")
+    report("DetailRules: 履行期間", fields.get("contract_period") == "2024-06-01〜2025-03-31",
+           f"{fields.get('contract_period')}")
+    report("DetailRules: 説明会日時", fields.get("briefing_date") == "2024-04-10 14:30",
+           f"{fields.get('briefing_date')}")
+    report("DetailRules: 予定価格", fields.get("budget") == "12,345,000円（税込）",
+           f"{fields.get('budget')}")
+    contact = fields.get("contact_info") or ""
+    report("DetailRules: 問い合わせ先",
+           "052-961-2111" in contact and "keiyaku@" in contact and "契約係" in contact, contact)
+
+    unsure = extract_fields("締切 2024年2月30日。詳細はお問い合わせください。")
+    report("DetailRules: 不確かな値は埋めない", unsure == {}, f"{unsure}")
+
+
+def test_detail_packing():
+    """詳細抽出の複数ページまとめ処理テスト（Gemini呼び出しはスタブ）"""
+    print("\n=== Detail Packing ===\n")
+
+    import detail_scraper
+
+    calls = []
+
+    def fake_gemini(prompt, json_mode=True, max_tokens=8192, **kwargs):
+        calls.append(prompt)
+        if "案件ID" in prompt:
+            # 1件だけ応答から欠落させ、単独抽出へのフォールバックを確認する
+            return json.dumps({"opp-1": {"detailed_summary": "まとめ1", "difficulty": "低"},
+                               "opp-2": {"detailed_summary": "まとめ2", "difficulty": "中"}})
+        return json.dumps({"detailed_summary": "単独", "difficulty": "高"})
+
+    pages = [
+        ({"id": f"opp-{i}", "title": f"案件{i}"}, f"業務内容 {i}。" * 20)
+        for i in range(1, 4)
+    ]
+    import tempfile
+    import time
+    from extraction_memo import ExtractionMemo
+
+    original = detail_scraper.call_gemini, detail_scraper._memo
+    detail_scraper.call_gemini = fake_gemini
+    with tempfile.TemporaryDirectory() as tmp:
+        detail_scraper._memo = ExtractionMemo("test", os.path.join(tmp, "memo.db"))
+        try:
+            results = detail_scraper.extract_details_packed(pages)
+            first_calls = len(calls)
+            # 空白の揺れだけ違う同一ページはメモから返り、Gemini を呼ばない
+            repeated = detail_scraper.extract_details_packed(
+                [(opp, text.replace(" ", " \n ")) for opp, text in pages]
+            )
+            memo_stats = dict(detail_scraper._memo.stats)
+        finally:
+            detail_scraper.call_gemini, detail_scraper._memo = original
+
+        # 期限切れはミス扱い、上限を超えたら最後に使った時刻の古い順に消す
+        expiring = ExtractionMemo("test", os.path.join(tmp, "ttl.db"), ttl=1)
+        expiring.put("本文", {"detailed_summary": "x"})
+        time.sleep(1.1)
+        expired = expiring.get("本文") is None
+        small = ExtractionMemo("test", os.path.join(tmp, "lru.db"), ttl=0, max_bytes=300)
+        for i in range(3):
+            small.put(f"本文{i}", {"detailed_summary": os.urandom(60).hex()})  # 圧縮後 ~130B
+            small.get("本文0")
+        lru_kept = small.get("本文0") is not None and small.get("本文1") is None
+        evicted = small.stats["evicted"]
+
+    report("Packing: 3 pages in 1 packed call + 1 fallback", first_calls == 2, f"calls={first_calls}")
+    report("Packing: packed results keyed by id",
+           results.get("opp-2", {}).get("detailed_summary") == "まとめ2")
+    report("Packing: missing id falls back to single call",
+           results.get("opp-3", {}).get("detailed_summary") == "単独")
+    report("Memo: identical pages reuse stored result",
+           len(calls) == first_calls and repeated == results, f"calls={len(calls)}")
+    report("Memo: hit/miss counted",
+           memo_stats == {"hit": 3, "miss": 3, "evicted": 0}, f"{memo_stats}")
+    report("Memo: expired entry is a miss", expired)
+    report("Memo: LRU eviction keeps recent", lru_kept and evicted >= 1, f"evicted={evicted}")
+
+
+def test_section_ranker():
+    """関連セクション選択のテスト"""
+    print("\n=== Section Ranker ===\n")
+
+    from gemini_client import estimate_tokens
+    from section_ranker import select_sections
+
+    text = "\n".join(
+        ["○○市 業務委託の公告", "業務名: 庁内ネットワーク更新業務"]
+        + [f"■ お知らせ{i}\n" + "ホームページの利用案内です。" * 30 for i in range(20)]
+        + ["1. 提出期限\n令和8年3月10日 17時まで",
+           "2. 予定価格\n12,000,000円（税込）",
+           "3. 問い合わせ先\n総務課 TEL 03-1234-5678"]
+    )
+    selected = select_sections(text, 600, ["deadline", "budget", "contact_info"])
+
+    report("Ranker: fits token budget", estimate_tokens(selected) <= 600,
+           f"tokens={estimate_tokens(selected)}")
+    report("Ranker: keeps trailing deadline/budget/contact",
+           all(s in selected for s in ("令和8年3月10日", "12,000,000円", "03-1234-5678")))
+    report("Ranker: keeps head section", selected.startswith("○○市 業務委託の公告"))
+    report("Ranker: short text unchanged", select_sections("短い本文", 600, ["deadline"]) == "短い本文")
+
+    # 改行のない巨大な先頭行があっても予算を超えない
+    huge = "件名" + "あ" * 5000 + "\n1. 提出期限\n令和8年3月10日"
+    clipped = select_sections(huge, 600, ["deadline"])
+    report("Ranker: oversized head line is truncated to budget",
+           estimate_tokens(clipped) <= 600 and clipped.startswith("件名"),
+           f"tokens={estimate_tokens(clipped)}")
+
+
+def test_pipeline():
+    """ステージ分割パイプラインのテスト"""
+    print("\n=== Pipeline ===\n")
+
+    import threading
+    from pipeline import Pipeline, Stage
+
+    written = []
+    lock = threading.Lock()
+
+    def fetch(x):
+        return None if x % 5 == 0 else x  # 5の倍数は取得失敗扱い
+
+    def extract(items):
+        return [x * 10 for x in items]
+
+    def write(x):
+        with lock:
+            written.append(x)
+
+    pipe = Pipeline([
+        Stage("fetch", fetch, workers=8, queue_size=4),
+        Stage("extract", extract, workers=2, queue_size=4, batch_size=3),
+        Stage("write", write, workers=2),
+    ], log_interval=60)
+    pipe.run(range(100))
+
+    report("Pipeline: all surviving items reach last stage", len(written) == 80,
+           f"written={len(written)}")
+    stats = pipe.stats()
+    report("Pipeline: per-stage counters",
+           stats["fetch"]["processed"] == 100 and stats["fetch"]["emitted"] == 80
+           and stats["write"]["processed"] == 80, f"{stats}")
+
+
+def test_checkpoint():
+    """バックフィルのチェックポイントのテスト"""
+    print("\n=== Checkpoint ===\n")
+
+    import tempfile
+    from checkpoint import Checkpoint
+    from db import _unenriched_filter
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoint.db")
+        cp = Checkpoint(path)
+        cp.record("a", "success")
+        cp.record("b", "fail_fetch")
+        cp.record("b", "success")
+        cp.set_cursor("2026-01-01T00:00:00+00:00", "b")
+        cp.close()
+
+        resumed = Checkpoint(path)
+        report("Checkpoint: attempted ids survive reopen",
+               resumed.attempted_ids() == {"a", "b"}, f"{resumed.attempted_ids()}")
+        report("Checkpoint: latest outcome wins",
+               resumed.outcome_counts() == {"success": 2}, f"{resumed.outcome_counts()}")
+        report("Checkpoint: cursor", resumed.cursor() == ("2026-01-01T00:00:00+00:00", "b"))
+        resumed.reset()
+        report("Checkpoint: reset", not resumed.attempted_ids() and resumed.cursor() is None)
+        resumed.close()
+
+    query = _unenriched_filter(("2026-01-01T00:00:00+00:00", "b"))
+    report("Checkpoint: keyset filter encodes timestamp",
+           'scraped_at.lt."2026-01-01T00%3A00%3A00%2B00%3A00"' in query, query)
+
+
+def test_rate_limiter():
+    """Gemini レートリミッターのテスト"""
+    print("\n=== Rate Limiter ===\n")
+
+    import tempfile
+    import threading
+    import time
+    from rate_limiter import PRIORITY_HIGH, PRIORITY_LOW, RateLimiter
+
+    # 600 RPM = 0.1秒に1件。先に枠を使い切ってから優先度の違う呼び出しを並ばせる
+    limiter = RateLimiter(rpm=600, tpm=10 ** 6)
+    for _ in range(600):
+        limiter.acquire()
+    order = []
+
+    def call(name, priority):
+        limiter.acquire(priority=priority)
+        order.append(name)
+
+    threads = [threading.Thread(target=call, args=(f"low{i}", PRIORITY_LOW)) for i in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    high = threading.Thread(target=call, args=("high", PRIORITY_HIGH))
+    high.start()
+    for t in threads + [high]:
+        t.join()
+    report("RateLimiter: high priority overtakes queued low", order.index("high") <= 1, f"{order}")
+
+    limiter = RateLimiter(rpm=10 ** 6, tpm=10 ** 6)
+    limiter.pause(0.3)
+    started = time.monotonic()
+    limiter.acquire()
+    report("RateLimiter: pause blocks callers", time.monotonic() - started >= 0.25)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "limiter.db")
+        a = RateLimiter(rpm=60, tpm=10 ** 6, store_path=path)
+        b = RateLimiter(rpm=60, tpm=10 ** 6, store_path=path)
+        for _ in range(30):
+            a.acquire()
+            b.acquire()
+        started = time.monotonic()
+        b.acquire()  # 2つで60件使い切ったので1秒待つ
+        report("RateLimiter: shared store splits quota", time.monotonic() - started >= 0.8)
+
+
+def test_key_pool():
+    """APIキープールのテスト（枠による振り分け・429 での除外・キー単位の再送）"""
+    print("\n=== Key Pool ===\n")
+
+    import time
+    import config
+    from key_pool import KeyPool
+    from mock_gemini_server import MockError, MockGeminiServer
+
+    pool = KeyPool(["k1", "k2", "k1"], rpm=600, tpm=10 ** 6, max_429=2, cooldown=60)
+    used = [pool.acquire().api_key for _ in range(10)]
+    report("KeyPool: duplicate keys collapsed", len(pool.keys) == 2)
+    report("KeyPool: calls spread by headroom",
+           used.count("k1") == used.count("k2") == 5, f"{used}")
+
+    first = pool.keys[0]
+    pool.rate_limited(first, 0.1)
+    report("KeyPool: 429 pauses only that key",
+           first.limiter.headroom() == 0 and pool.keys[1].limiter.headroom() > 0
+           and pool.available(exclude=first))
+    pool.rate_limited(first, 0.1)
+    usage = pool.utilization()
+    report("KeyPool: repeated 429 takes key out of rotation",
+           not usage["key1"]["healthy"] and usage["key1"]["disabled"] == 1
+           and all(pool.acquire().api_key == "k2" for _ in range(5)), f"{usage['key1']}")
+    report("KeyPool: no other key once one is out",
+           not pool.available(exclude=pool.keys[1]))
+
+    calls = []
+
+    def responder(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise MockError(429, "quota")
+        return "ok"
+
+    original = (config.GEMINI_ENDPOINT, gemini_client._key_pool)
+    with MockGeminiServer(responder) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        gemini_client._key_pool = KeyPool(["a", "b"], rpm=10 ** 4, tpm=10 ** 7)
+        try:
+            started = time.monotonic()
+            text = gemini_client.call_gemini("x", json_mode=False, cache=False, models=("m",))
+            elapsed = time.monotonic() - started
+            for _ in range(4):
+                gemini_client.call_gemini("y", json_mode=False, cache=False, models=("m",))
+            keys = list(server.api_keys)
+            usage = gemini_client.get_key_pool().utilization()
+        finally:
+            config.GEMINI_ENDPOINT, gemini_client._key_pool = original
+    report("KeyPool: 429 resent on the other key without waiting",
+           text == "ok" and keys[0] != keys[1] and elapsed < 5, f"{keys[:2]} {elapsed:.2f}s")
+    report("KeyPool: paused key skipped afterwards",
+           set(keys[2:]) == {keys[1]}
+           and sum(entry["rate_limited"] for entry in usage.values()) == 1, f"{keys}")
+
+
+def test_response_cache():
+    """Gemini 応答キャッシュのテスト"""
+    print("\n=== Response Cache ===\n")
+
+    import tempfile
+    import time
+    from response_cache import ResponseCache, cache_key
+
+    key = cache_key("gemini-2.5-flash", {"temperature": 0.2}, "プロンプト")
+    report("ResponseCache: key depends on generation config",
+           key != cache_key("gemini-2.5-flash", {"temperature": 0.0}, "プロンプト"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "gemini.db"), ttl=0, max_bytes=10 ** 6)
+        cache.put(key, '{"ok": true}')
+        report("ResponseCache: hit", cache.get(key) == '{"ok": true}')
+        report("ResponseCache: miss", cache.get("other") is None)
+
+        short = ResponseCache(os.path.join(tmp, "ttl.db"), ttl=1, max_bytes=10 ** 6)
+        short.put(key, "x")
+        time.sleep(1.1)
+        report("ResponseCache: expired entry is a miss", short.get(key) is None)
+
+        small = ResponseCache(os.path.join(tmp, "lru.db"), ttl=0, max_bytes=1500)
+        for i in range(3):
+            small.put(f"k{i}", os.urandom(400).hex())  # 圧縮後 ~450B
+        small.get("k0")  # 直近アクセスで残る
+        small.put("k3", os.urandom(400).hex())
+        report("ResponseCache: LRU eviction keeps recent",
+               small.get("k0") is not None and small.get("k1") is None,
+               f"{small.stats}")
+
+        import config
+        import gemini_client
+        from mock_gemini_server import Faults, MockGeminiServer
+
+        original = config.GEMINI_ENDPOINT, config.GEMINI_CACHE_ENABLED, gemini_client._cache
+        with MockGeminiServer(lambda req: "途中で切れる応答", faults=Faults(truncate_rate=1.0)) as server:
+            config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+            config.GEMINI_CACHE_ENABLED = True
+            gemini_client._cache = ResponseCache(os.path.join(tmp, "client.db"), ttl=0, max_bytes=10 ** 6)
+            try:
+                for _ in range(2):
+                    gemini_client.call_gemini("truncated", json_mode=False, models=("m",))
+            finally:
+                config.GEMINI_ENDPOINT, config.GEMINI_CACHE_ENABLED, gemini_client._cache = original
+        report("ResponseCache: MAX_TOKENS responses are not cached",
+               server.stats["generate"] == 2, f"{server.stats}")
+
+
+def test_gemini_batch():
+    """Gemini Batch API モード（モックサーバー）のテスト"""
+    print("\n=== Gemini Batch API (mock) ===\n")
+
+    import config
+    import gemini_batch
+    import industry_classifier
+    from gemini_client import build_request
+    from mock_gemini_server import MockGeminiServer
+
+    def responder(request):
+        prompt = request["contents"][0]["parts"][0]["text"]
+        if "各案件を以下の10カテゴリ" in prompt:
+            return json.dumps([{"index": 1, "category": "IT・DX"}, {"index": 2, "category": "清掃・管理"}])
+        if "案件ID" in prompt:
+            return json.dumps({"d1": {"difficulty": "低"}, "d2": {"difficulty": "中"}})
+        return prompt.upper()
+
+    original = config.GEMINI_API_BASE, config.GEMINI_ENDPOINT, config.GEMINI_BATCH_POLL_INTERVAL
+    with MockGeminiServer(responder, batch_polls=2) as server:
+        config.GEMINI_API_BASE = server.url
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        config.GEMINI_BATCH_POLL_INTERVAL = 0.01
+        try:
+            results = gemini_batch.run_batch(
+                {f"k{i}": build_request(f"prompt {i}", json_mode=False) for i in range(3)}
+            )
+            report("BatchAPI: results keyed by request key",
+                   results == {"k0": "PROMPT 0", "k1": "PROMPT 1", "k2": "PROMPT 2"}, f"{results}")
+            report("BatchAPI: job polled until done",
+                   sum(1 for m, path in server.requests if path.startswith("/v1beta/batches/")) == 2)
+
+            mapping = industry_classifier.classify_with_batch_api(
+                [[{"id": "a", "title": "システム"}, {"id": "b", "title": "清掃"}]]
+            )
+            report("BatchAPI: classifier post-processing reused",
+                   mapping == {"a": "IT・DX", "b": "清掃・管理"}, f"{mapping}")
+
+            import detail_scraper
+            memo_enabled = config.EXTRACTION_MEMO_ENABLED
+            config.EXTRACTION_MEMO_ENABLED = False
+            try:
+                details = detail_scraper.extract_details_batch(
+                    [({"id": f"d{i}", "title": "案件"}, f"業務内容 {i}。" * 20) for i in (1, 2)]
+                )
+            finally:
+                config.EXTRACTION_MEMO_ENABLED = memo_enabled
+            report("BatchAPI: detail extraction via packed job",
+                   {k: v.get("difficulty") for k, v in details.items()} == {"d1": "低", "d2": "中"},
+                   f"{details}")
+        finally:
+            (config.GEMINI_API_BASE, config.GEMINI_ENDPOINT,
+             config.GEMINI_BATCH_POLL_INTERVAL) = original
+
+    # 完了しないジョブ: そのジョブの案件だけ抽出失敗にして、例外は外に出さない
+    import backfill_details
+    from negative_cache import NegativeCache
+
+    original = (config.GEMINI_API_BASE, config.GEMINI_ENDPOINT,
+                config.GEMINI_BATCH_POLL_INTERVAL, config.GEMINI_BATCH_TIMEOUT,
+                config.EXTRACTION_MEMO_ENABLED, backfill_details.failed_urls)
+    failed = NegativeCache(persist=False)
+    with MockGeminiServer(responder, batch_polls=1000) as server:
+        config.GEMINI_API_BASE = server.url
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        config.GEMINI_BATCH_POLL_INTERVAL = 0.01
+        config.GEMINI_BATCH_TIMEOUT = 0.05
+        config.EXTRACTION_MEMO_ENABLED = False
+        backfill_details.failed_urls = failed
+        before = backfill_details._stats["fail_gemini"]
+        try:
+            pages = [({"id": f"e{i}", "title": "案件", "detail_url": f"https://example.com/e{i}"},
+                      f"業務内容 {i}。" * 20) for i in (1, 2)]
+            written = backfill_details.batch_extract(pages)
+        except Exception as exc:
+            written = exc
+        finally:
+            (config.GEMINI_API_BASE, config.GEMINI_ENDPOINT,
+             config.GEMINI_BATCH_POLL_INTERVAL, config.GEMINI_BATCH_TIMEOUT,
+             config.EXTRACTION_MEMO_ENABLED, backfill_details.failed_urls) = original
+    report("BatchAPI: failed job recorded as extract failures",
+           written == [] and backfill_details._stats["fail_gemini"] - before == 2
+           and failed.get("https://example.com/e2") == "extract_failed",
+           f"{written!r}")
+
+
+def test_json_stream():
+    """JSON 配列のインクリメンタルパーサーのテスト"""
+    print("\n=== JSON Stream ===\n")
+
+    from json_stream import JsonArrayStream, iter_json_array
+
+    text = '```json\n[{"id": "a", "note": "括弧 ] や \\" を含む"}, {"id": "b", "tags": [1, 2]}, 3, "x"]'
+    # 1文字ずつ流しても同じ結果になる
+    items = list(iter_json_array(iter(text)))
+    report("JsonStream: elements parsed incrementally",
+           items == [{"id": "a", "note": '括弧 ] や " を含む'}, {"id": "b", "tags": [1, 2]}, 3, "x"],
+           f"{items}")
+
+    stream = JsonArrayStream()
+    first = stream.feed('[{"id": "a", "score": 80}, {"id": "b"')
+    report("JsonStream: element yielded as soon as it closes", first == [{"id": "a", "score": 80}])
+    truncated = list(iter_json_array(['[{"id": "a"}, {"id": "b"}, {"id": "c", "reason": "途中で']))
+    report("JsonStream: truncated output keeps complete elements",
+           [r["id"] for r in truncated] == ["a", "b"])
+
+    import config
+    from gemini_client import stream_gemini
+    from mock_gemini_server import MockGeminiServer
+
+    payload = json.dumps([{"id": f"o{i}", "match_score": 90 - i} for i in range(5)])
+    original = config.GEMINI_ENDPOINT
+    with MockGeminiServer(lambda req: payload, stream_chunk=7) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        try:
+            chunks = list(stream_gemini("prompt"))
+        finally:
+            config.GEMINI_ENDPOINT = original
+    report("JsonStream: SSE chunks reassemble", len(chunks) > 1 and "".join(chunks) == payload,
+           f"chunks={len(chunks)}")
+
+    # マッチングは判定を1件受け取るたびに on_match へ渡す（日本語を含む応答も断片の境目で壊れない）
+    from matcher import match_opportunities
+
+    opps = [{"id": f"o{i}", "title": f"案件{i}"} for i in range(3)]
+    answer = json.dumps([
+        {"id": opp["id"], "match_score": 80 - i, "match_reason": "事業内容と合致", "risk_notes": None,
+         "recommendation": "推奨", "action_items": ["仕様書を確認"]}
+        for i, opp in enumerate(opps)
+    ], ensure_ascii=False)
+    streamed = []
+    with MockGeminiServer(lambda req: answer, stream_chunk=7) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        try:
+            matches = match_opportunities({"company_name": "テスト"}, opps, on_match=streamed.append)
+        finally:
+            config.GEMINI_ENDPOINT = original
+    report("JsonStream: matcher delivers each match via on_match",
+           [m["opportunity_id"] for m in streamed] == ["o0", "o1", "o2"]
+           and streamed[0]["match_reason"] == "事業内容と合致" and len(matches) == 3,
+           f"streamed={len(streamed)}")
+
+
+def test_response_schema():
+    """responseSchema と検証器のテスト"""
+    print("\n=== Response Schema ===\n")
+
+    import config
+    import gemini_client
+    from industry_classifier import CLASSIFY_CHECK_SCHEMA, CLASSIFY_SCHEMA, _to_mapping
+    from matcher import MATCH_ITEM_SCHEMA
+    from mock_gemini_server import MockGeminiServer
+    from response_schema import SchemaError, compile_schema
+
+    check = compile_schema(CLASSIFY_SCHEMA)
+    report("Schema: valid classification accepted",
+           check([{"index": 1, "category": "IT・DX"}]) is None)
+    report("Schema: enum violation rejected",
+           check([{"index": 1, "category": "不明"}]) is not None)
+    report("Schema: missing required field rejected",
+           check([{"category": "その他"}]) is not None)
+    report("Schema: nullable field accepts null",
+           compile_schema(MATCH_ITEM_SCHEMA)({
+               "id": "x", "match_score": 80, "match_reason": "r", "risk_notes": None,
+               "recommendation": "推奨", "action_items": [],
+           }) is None)
+
+    payload = gemini_client.build_request("p", json_mode=False, schema=CLASSIFY_SCHEMA)
+    report("Schema: sent as responseSchema with JSON mime type",
+           payload["generationConfig"].get("responseSchema") == CLASSIFY_SCHEMA
+           and payload["generationConfig"].get("responseMimeType") == "application/json")
+
+    # スキーマ不一致の応答は1回だけ呼び直す
+    answers = ['[{"index": 1, "category": "不明"}]', '[{"index": 1, "category": "その他"}]']
+    seen = []
+
+    def responder(request):
+        seen.append(request["generationConfig"].get("responseSchema"))
+        return answers[min(len(seen), len(answers)) - 1]
+
+    original = config.GEMINI_ENDPOINT
+    with MockGeminiServer(responder) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        try:
+            result = gemini_client.generate_json("p", CLASSIFY_SCHEMA, cache=False)
+            answers[1] = answers[0]
+            try:
+                gemini_client.generate_json("q", CLASSIFY_SCHEMA, cache=False)
+                raised = False
+            except SchemaError:
+                raised = True
+        finally:
+            config.GEMINI_ENDPOINT = original
+    report("Schema: mismatch retried once then validated",
+           result == [{"index": 1, "category": "その他"}] and seen[0] == CLASSIFY_SCHEMA,
+           f"{result}")
+    report("Schema: persistent mismatch raises SchemaError", raised and len(seen) == 4)
+
+    # 分類はカテゴリ外の1件だけを「その他」に寄せ、バッチ全体は捨てない
+    answers[:] = ['[{"index": 1, "category": "IT・DX"}, {"index": 2, "category": "不明"}]']
+    seen.clear()
+    with MockGeminiServer(responder) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        try:
+            results = gemini_client.generate_json(
+                "r", CLASSIFY_SCHEMA, cache=False, check_schema=CLASSIFY_CHECK_SCHEMA,
+            )
+        finally:
+            config.GEMINI_ENDPOINT = original
+    mapping = _to_mapping(results, [{"id": "a"}, {"id": "b"}])
+    report("Schema: invalid category coerced per item",
+           mapping == {"a": "IT・DX", "b": "その他"} and seen == [CLASSIFY_SCHEMA], f"{mapping}")
+
+
+def test_gemini_async():
+    """非同期クライアントのテスト（同時実行数の上限・順序・キャンセル）"""
+    print("\n=== Gemini Async ===\n")
+
+    import asyncio
+    import threading
+    import time
+
+    import config
+    from gemini_async import AsyncGemini
+    from mock_gemini_server import MockGeminiServer
+
+    state = {"active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def responder(request):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.2)
+        with lock:
+            state["active"] -= 1
+        return request["contents"][0]["parts"][0]["text"].upper()
+
+    async def fan_out():
+        async with AsyncGemini(concurrency=3) as client:
+            return await client.gather(
+                client.call(f"p{i}", json_mode=False, cache=False) for i in range(9)
+            )
+
+    async def cancel_early():
+        async with AsyncGemini(concurrency=1) as client:
+            task = asyncio.ensure_future(client.gather(
+                client.call(f"c{i}", json_mode=False, cache=False) for i in range(5)
+            ))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+        return False
+
+    original = config.GEMINI_ENDPOINT
+    with MockGeminiServer(responder) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        try:
+            started = time.monotonic()
+            results = asyncio.run(fan_out())
+            elapsed = time.monotonic() - started
+            sent_before = len(server.requests)
+            cancelled = asyncio.run(cancel_early())
+            time.sleep(0.3)
+            sent_after_cancel = len(server.requests) - sent_before
+        finally:
+            config.GEMINI_ENDPOINT = original
+
+    report("Async: results in input order", results == [f"P{i}" for i in range(9)], f"{results}")
+    report("Async: concurrency capped", state["peak"] <= 3, f"peak={state['peak']}")
+    report("Async: calls overlap", elapsed < 9 * 0.2 * 0.6, f"{elapsed:.2f}s")
+    report("Async: cancellation stops queued calls",
+           cancelled and sent_after_cancel <= 2, f"sent={sent_after_cancel}")
+
+
+def test_usage():
+    """Gemini 使用量集計のテスト（タグ別積算・コスト見積もり・ストリーミング）"""
+    print("\n=== Gemini Usage ===\n")
+
+    import config
+    import gemini_client
+    from mock_gemini_server import MockGeminiServer
+    from usage import UsageTracker, estimate_cost, get_tracker
+
+    cost = estimate_cost("gemini-2.5-flash", 1_000_000, 1_000_000, cached_tokens=500_000)
+    report("Usage: cost uses input/output/cached prices",
+           abs(cost - (0.5 * 0.30 + 0.5 * 0.075 + 2.50)) < 1e-9, f"{cost}")
+    report("Usage: batch discount applied",
+           abs(estimate_cost("gemini-2.5-flash", 1000, 0, batch=True) - 0.00015) < 1e-12)
+
+    tracker = UsageTracker()
+    tracker.record("a", "gemini-2.5-flash", {"promptTokenCount": 100, "candidatesTokenCount": 10},
+                   latency=0.5, retries=1, finish_reason="STOP")
+    tracker.record("a", "gemini-2.5-flash", {"promptTokenCount": 50, "candidatesTokenCount": 5,
+                                             "thoughtsTokenCount": 20},
+                   latency=1.5, finish_reason="MAX_TOKENS")
+    tracker.record("b", "gemini-2.5-flash", cache_hit=True)
+    summary = tracker.summary()
+    report("Usage: per-tag rollup",
+           summary["a"]["prompt_tokens"] == 150 and summary["a"]["thought_tokens"] == 20
+           and summary["a"]["latency_avg_ms"] == 1000 and summary["a"]["retries"] == 1
+           and summary["a"]["finish_reasons"] == {"STOP": 1, "MAX_TOKENS": 1},
+           f"{summary['a']}")
+    report("Usage: total includes cache hits",
+           summary["total"]["calls"] == 3 and summary["total"]["cache_hits"] == 1)
+    json.dumps(tracker.rollup())  # batch_logs にそのまま書けること
+
+    get_tracker().reset()
+    original = config.GEMINI_ENDPOINT
+    with MockGeminiServer(lambda req: '["x", "y"]', stream_chunk=3) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        try:
+            gemini_client.call_gemini("prompt " * 40, cache=False, tag="unit")
+            "".join(gemini_client.stream_gemini("prompt " * 40, tag="unit_stream"))
+        finally:
+            config.GEMINI_ENDPOINT = original
+    summary = get_tracker().summary()
+    report("Usage: call_gemini records usageMetadata by tag",
+           summary.get("unit", {}).get("prompt_tokens", 0) > 0
+           and summary["unit"]["finish_reasons"] == {"STOP": 1}, f"{summary.get('unit')}")
+    report("Usage: stream records cumulative usage once",
+           summary.get("unit_stream", {}).get("calls") == 1
+           and summary["unit_stream"]["output_tokens"] == summary["unit"]["output_tokens"],
+           f"{summary.get('unit_stream')}")
+    get_tracker().reset()
+
+
+def test_context_cache():
+    """コンテキストキャッシュのテスト（前置きの登録・参照・連結送信・削除）"""
+    print("\n=== Context Cache ===\n")
+
+    import threading
+    import time
+
+    import config
+    import gemini_client
+    from context_cache import ContextCache, prefix_key
+    from mock_gemini_server import MockGeminiServer
+
+    seen = []
+
+    def responder(request):
+        seen.append(request)
+        return "ok"
+
+    prefix = "会社プロフィールと判定基準。" * 40
+    original = (config.GEMINI_ENDPOINT, config.GEMINI_API_BASE, gemini_client._context_cache)
+    context_cache = ContextCache(min_tokens=100)
+    with MockGeminiServer(responder) as server:
+        config.GEMINI_API_BASE = server.url
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        gemini_client._context_cache = context_cache
+        try:
+            for batch in ("batch-1", "batch-2"):
+                gemini_client.call_gemini(batch, json_mode=False, cache=False, prefix=prefix)
+            gemini_client.call_gemini("batch-3", json_mode=False, cache=False, prefix="短い指示。")
+            created = sum(1 for method, path in server.requests if path == "/v1beta/cachedContents")
+            context_cache.close()
+            remaining = len(server.cached_contents)
+        finally:
+            config.GEMINI_ENDPOINT, config.GEMINI_API_BASE, gemini_client._context_cache = original
+
+    texts = ["".join(p["text"] for c in r["contents"] for p in c["parts"]) for r in seen]
+    report("ContextCache: prefix registered once per run", created == 1, f"created={created}")
+    report("ContextCache: requests reference cached content",
+           all(s_.get("cachedContent") for s_ in seen[:2])
+           and texts[:2] == [prefix + "batch-1", prefix + "batch-2"])
+    report("ContextCache: short prefix sent inline",
+           "cachedContent" not in seen[2] and texts[2] == "短い指示。batch-3")
+    report("ContextCache: stats and cleanup",
+           context_cache.stats == {"created": 1, "reused": 1, "inline": 1, "failed": 0}
+           and remaining == 0, f"{context_cache.stats}")
+    report("ContextCache: profile or model change gets a new key",
+           len({prefix_key("m1", prefix), prefix_key("m1", prefix + "v2"),
+                prefix_key("m2", prefix)}) == 3)
+
+    # 登録中の prefix があっても、別の prefix の参照・登録は待たされない
+    release = threading.Event()
+
+    class SlowCache(ContextCache):
+        calls = []
+
+        def _create(self, prefix, model):
+            self.calls.append(prefix)
+            if prefix == "slow":
+                release.wait(5)
+            return f"cachedContents/{prefix}"
+
+    slow_cache = SlowCache(min_tokens=0)
+    waiters = [threading.Thread(target=slow_cache.get, args=("slow", 10)) for _ in range(3)]
+    for t in waiters:
+        t.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    other = slow_cache.get("fast", 10)
+    other_wait = time.monotonic() - started
+    release.set()
+    for t in waiters:
+        t.join(5)
+    report("ContextCache: creation does not block other prefixes",
+           other == "cachedContents/fast" and other_wait < 1, f"{other_wait:.2f}s")
+    report("ContextCache: concurrent gets create once per prefix",
+           sorted(SlowCache.calls) == ["fast", "slow"]
+           and slow_cache.stats["created"] == 2 and slow_cache.stats["reused"] == 2,
+           f"{SlowCache.calls} {slow_cache.stats}")
+
+
+def test_model_routing():
+    """モデル経路のテスト（quota 切れ・5xx・スキーマ不一致での切り替えと経路別の集計）"""
+    print("\n=== Model Routing ===\n")
+
+    import config
+    import requests
+    import gemini_client
+    from mock_gemini_server import MockError, MockGeminiServer
+    from usage import get_tracker
+
+    lite, flash = "gemini-2.5-flash-lite", "gemini-2.5-flash"
+    route = (lite, flash)
+
+    def responder(request):
+        model = request["model"].split("/", 1)[1]
+        text = request["contents"][-1]["parts"][0]["text"]
+        if text == "bad-request":
+            raise MockError(400, "invalid argument")
+        if model == lite and text == "quota":
+            raise MockError(429, "resource exhausted")
+        if model == flash and text == "overloaded":
+            raise MockError(503, "overloaded")
+        if model == lite and text == "invalid":
+            return '{"label": 1}'
+        return json.dumps({"label": model})
+
+    schema = {"type": "OBJECT", "properties": {"label": {"type": "STRING"}}, "required": ["label"]}
+    report("Routing: unknown tag uses GEMINI_MODEL",
+           gemini_client.route("no-such-tag") == (config.GEMINI_MODEL,))
+    report("Routing: classification starts on the lite tier",
+           gemini_client.route("classify")[0] == lite)
+
+    get_tracker().reset()
+    original = config.GEMINI_ENDPOINT
+    with MockGeminiServer(responder) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        try:
+            quota = gemini_client.call_gemini("quota", cache=False, tag="r_quota", models=route)
+            invalid = gemini_client.generate_json(
+                "invalid", schema, cache=False, tag="r_invalid", models=route,
+            )
+            streamed = "".join(gemini_client.stream_gemini(
+                "overloaded", tag="r_stream", models=(flash, lite),
+            ))
+            try:
+                gemini_client.call_gemini("bad-request", cache=False, tag="r_bad", models=route)
+                bad = None
+            except requests.HTTPError as e:
+                bad = e.response.status_code
+        finally:
+            config.GEMINI_ENDPOINT = original
+
+    summary = get_tracker().summary()
+    report("Routing: 429 falls back to the next model without waiting",
+           json.loads(quota) == {"label": flash}
+           and summary["r_quota"]["models"][lite]["fallbacks"] == 1
+           and summary["r_quota"]["models"][flash]["calls"] == 1, f"{summary.get('r_quota')}")
+    report("Routing: schema mismatch retried on the next model",
+           invalid == {"label": flash} and summary["r_invalid"]["invalid"] == 1
+           and summary["r_invalid"]["models"][lite]["invalid"] == 1, f"{summary.get('r_invalid')}")
+    report("Routing: stream falls back on 5xx before the first chunk",
+           json.loads(streamed) == {"label": lite}
+           and summary["r_stream"]["models"][flash]["errors"] == 1, streamed)
+    report("Routing: 4xx is not retried on another model",
+           bad == 400 and list(summary["r_bad"]["models"]) == [lite]
+           and summary["r_bad"]["fallbacks"] == 0, f"{bad} {summary.get('r_bad')}")
+    report("Routing: total merges per-model stats",
+           summary["total"]["fallbacks"] == 2
+           and summary["total"]["models"][lite]["latency_avg_ms"] >= 0, f"{summary['total']['models']}")
+    get_tracker().reset()
+
+
+def test_mock_gemini():
+    """モック Gemini のテスト（スキーマに沿った応答・遅延・429/503・途中終了・再現性）"""
+    print("\n=== Mock Gemini ===\n")
+
+    import time
+    import requests
+    from industry_classifier import CLASSIFY_SCHEMA, _build_prompt
+    from matcher import MATCH_SCHEMA
+    from mock_gemini_server import Faults, MockGeminiServer, fixed_latency, rule_responder
+    from response_schema import compile_schema
+
+    opps = [{"id": f"o{i}", "title": f"案件{i}"} for i in range(5)]
+    classify = gemini_client.build_request(_build_prompt(opps), schema=CLASSIFY_SCHEMA)
+    labels = json.loads(rule_responder(classify))
+    report("Mock: classification answered per listed item",
+           compile_schema(CLASSIFY_SCHEMA)(labels) is None
+           and [r["index"] for r in labels] == [1, 2, 3, 4, 5], f"{labels}")
+    report("Mock: rule responses are deterministic",
+           rule_responder(classify) == rule_responder(classify))
+    match = gemini_client.build_request(
+        "## 案件リスト\n" + json.dumps(opps, ensure_ascii=False), schema=MATCH_SCHEMA,
+    )
+    matches = json.loads(rule_responder(match))
+    report("Mock: matcher answered per opportunity id",
+           compile_schema(MATCH_SCHEMA)(matches) is None
+           and [m["id"] for m in matches] == [o["id"] for o in opps])
+    report("Mock: canned response wins",
+           rule_responder(classify, canned={"案件3": "[]"}) == "[]")
+
+    def post(server, body=None):
+        return requests.post(
+            f"{server.url}/v1beta/models/m:generateContent",
+            json=body or gemini_client.build_request("x", json_mode=False), timeout=10,
+        )
+
+    with MockGeminiServer(faults=Faults(rate_429=1.0, retry_after=2.5)) as server:
+        resp = post(server)
+    report("Mock: 429 injected with RetryInfo",
+           resp.status_code == 429 and gemini_client._retry_after(resp) == 2.5)
+    with MockGeminiServer(faults=Faults(rate_503=1.0)) as server:
+        report("Mock: 503 injected", post(server).status_code == 503)
+
+    with MockGeminiServer(rule_responder, faults=Faults(truncate_rate=1.0)) as server:
+        data = post(server, classify).json()
+    text = data["candidates"][0]["content"]["parts"][0]["text"]
+    report("Mock: truncated output ends with MAX_TOKENS",
+           data["candidates"][0]["finishReason"] == "MAX_TOKENS"
+           and len(text) < len(rule_responder(classify)))
+
+    with MockGeminiServer(faults=Faults(latency=fixed_latency(0.2))) as server:
+        started = time.monotonic()
+        post(server)
+        elapsed = time.monotonic() - started
+    report("Mock: latency applied", elapsed >= 0.2, f"{elapsed:.3f}s")
+
+    def statuses(seed):
+        with MockGeminiServer(faults=Faults(rate_429=0.3, rate_503=0.3, seed=seed)) as server:
+            return [post(server).status_code for _ in range(12)]
+    first = statuses(7)
+    report("Mock: same seed reproduces the fault sequence",
+           first == statuses(7) and len(set(first)) > 1, f"{first}")
+
+
+def test_single_flight():
+    """同一リクエストの同時実行をまとめるテスト（結果・例外の共有、別プロンプトは別送信）"""
+    print("\n=== Single Flight ===\n")
+
+    import threading
+    import time
+    import config
+    from concurrent.futures import ThreadPoolExecutor
+    from mock_gemini_server import Faults, MockGeminiServer, fixed_latency
+    from single_flight import SingleFlight
+
+    flights = SingleFlight()
+    gate = threading.Event()
+    runs = []
+
+    def slow():
+        runs.append(1)
+        gate.wait(2)
+        raise RuntimeError("boom")
+
+    def call():
+        try:
+            flights.do("k", slow)
+        except RuntimeError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(call) for _ in range(4)]
+        time.sleep(0.1)
+        gate.set()
+        errors = [f.result() for f in futures]
+    report("SingleFlight: error shared with every waiter",
+           errors == ["boom"] * 4 and len(runs) == 1, f"{errors} runs={len(runs)}")
+    report("SingleFlight: finished key runs again", flights.do("k", lambda: 1) == 1
+           and flights.stats == {"executed": 2, "shared": 3}, f"{flights.stats}")
+
+    original = (config.GEMINI_ENDPOINT, gemini_client._single_flight)
+    with MockGeminiServer(lambda req: "ok", faults=Faults(latency=fixed_latency(0.3))) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        gemini_client._single_flight = SingleFlight()
+        try:
+            prompts = ["same"] * 6 + ["other"]
+            with ThreadPoolExecutor(len(prompts)) as pool:
+                texts = list(pool.map(
+                    lambda p: gemini_client.call_gemini(p, json_mode=False, cache=False, models=("m",)),
+                    prompts,
+                ))
+            sent = server.stats["generate"]
+            stats = gemini_client.get_single_flight().stats
+        finally:
+            config.GEMINI_ENDPOINT, gemini_client._single_flight = original
+    report("SingleFlight: concurrent identical prompts sent once",
+           texts == ["ok"] * 7 and sent == 2, f"sent={sent} {stats}")
+
+
+def test_hedging():
+    """ヘッジのテスト（p95 超過で追加送信・先着の採用・送信本数の上限）"""
+    print("\n=== Hedging ===\n")
+
+    import time
+    import config
+    from hedging import Hedger
+    from mock_gemini_server import Faults, MockGeminiServer
+
+    hedger = Hedger(min_samples=10)
+    for i in range(100):
+        hedger.observe("t", i / 100)
+    report("Hedging: delay is observed p95", abs(hedger.delay("t") - 0.95) < 1e-9,
+           f"{hedger.delay('t')}")
+    report("Hedging: initial delay until enough samples",
+           hedger.delay("new") == hedger.initial_delay)
+
+    hedger = Hedger(max_rate=0.0, min_samples=1000, initial_delay=0.05)
+    delays = iter([0.5, 0.01, 0.3, 0.01])
+
+    def call():
+        time.sleep(next(delays))
+        return "ok"
+
+    started = time.monotonic()
+    hedger.run("t", call)
+    first = time.monotonic() - started
+    started = time.monotonic()
+    hedger.run("t", call)
+    second = time.monotonic() - started
+    report("Hedging: slow call answered by the hedge",
+           first < 0.3 and hedger.stats["hedge_won"] == 1, f"{first:.2f}s")
+    report("Hedging: hedge budget caps duplicates",
+           second >= 0.25 and hedger.stats["hedged"] == 1 and hedger.stats["over_budget"] == 1,
+           f"{hedger.stats}")
+
+    latencies = iter([1.0, 0.01])
+    faults = Faults(latency=lambda rng: next(latencies, 0.01))
+    original = (config.GEMINI_ENDPOINT, gemini_client._hedger)
+    with MockGeminiServer(lambda req: '{"summary": "ok"}', faults=faults) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        gemini_client._hedger = Hedger(min_samples=1000, initial_delay=0.2)
+        try:
+            started = time.monotonic()
+            value = gemini_client.generate_json(
+                "analysis", {"type": "OBJECT", "properties": {"summary": {"type": "STRING"}}},
+                cache=False, models=("m",), hedge=True,
+            )
+            elapsed = time.monotonic() - started
+            stats = dict(gemini_client.get_hedger().stats)
+        finally:
+            config.GEMINI_ENDPOINT, gemini_client._hedger = original
+    report("Hedging: generate_json hedges past the threshold",
+           value == {"summary": "ok"} and elapsed < 0.8 and stats["hedge_won"] == 1,
+           f"{elapsed:.2f}s {stats}")
+
+
+def test_quota_breaker():
+    """quota ブレーカーのテスト（日次 quota・連続 429 での遮断・half-open・後回しキュー）"""
+    print("\n=== Quota Breaker ===\n")
+
+    import time
+    import config
+    import requests
+    import deferred_queue
+    import industry_classifier
+    from key_pool import KeyPool
+    from mock_gemini_server import MockError, MockGeminiServer
+    from quota_breaker import CircuitOpenError, QuotaBreaker, QuotaError
+
+    breaker = QuotaBreaker(threshold=2, cooldown=0.2)
+    breaker.failure("m")
+    report("Breaker: stays closed below the threshold", not breaker.is_open("m"))
+    breaker.failure("m")
+    try:
+        breaker.check("m")
+        rejected = False
+    except CircuitOpenError:
+        rejected = True
+    report("Breaker: opens after consecutive quota failures", breaker.is_open("m") and rejected)
+    time.sleep(0.25)
+    probe = breaker.check("m")
+    try:
+        breaker.check("m")
+        second = "passed"
+    except CircuitOpenError:
+        second = "rejected"
+    breaker.success("m")
+    report("Breaker: half-open lets exactly one probe through",
+           probe is True and second == "rejected" and not breaker.is_open("m"), second)
+    breaker.failure("d", daily=True)
+    report("Breaker: daily quota opens at once",
+           breaker.all_open(("d",)) and not breaker.all_open(("d", "m")), f"{breaker.stats}")
+
+    daily = [{
+        "@type": "type.googleapis.com/google.rpc.QuotaFailure",
+        "violations": [{"quotaId": "GenerateRequestsPerDayPerProjectPerModel-FreeTier"}],
+    }]
+    minute = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "0.05s"}]
+    healthy = {"m-rate": False}
+    probe_429 = iter([True])
+
+    def responder(request):
+        model = request["model"].split("/", 1)[1]
+        if model == "m-daily":
+            raise MockError(429, "quota exceeded", daily)
+        if model == "m-rate" and not healthy["m-rate"]:
+            raise MockError(429, "rate limited", minute)
+        if model == "m-503":
+            raise MockError(503, "overloaded")
+        if model == "m-probe" and next(probe_429, False):
+            raise MockError(429, "rate limited", minute)
+        return "ok"
+
+    original = (config.GEMINI_ENDPOINT, gemini_client._key_pool, gemini_client._quota_breaker)
+    with MockGeminiServer(responder) as server:
+        config.GEMINI_ENDPOINT = f"{server.url}/v1beta/models"
+        gemini_client._key_pool = KeyPool(["k"], rpm=10 ** 4, tpm=10 ** 7)
+        gemini_client._quota_breaker = QuotaBreaker(threshold=2, cooldown=0.2)
+        try:
+            started = time.monotonic()
+            try:
+                gemini_client.call_gemini("x", cache=False, models=("m-daily",))
+                error = None
+            except QuotaError as e:
+                error = e
+            elapsed = time.monotonic() - started
+            report("Breaker: daily quota fails fast without backoff",
+                   error is not None and error.daily and elapsed < 1.0, f"{elapsed:.2f}s {error}")
+            key_stats = gemini_client.get_key_pool().utilization()["key1"]
+            report("Breaker: daily quota does not count against the key",
+                   key_stats["rate_limited"] == 0, f"{key_stats}")
+
+            sent = len(server.requests)
+            try:
+                gemini_client.call_gemini("y", cache=False, models=("m-daily",))
+                error = None
+            except CircuitOpenError as e:
+                error = e
+            fallback = gemini_client.call_gemini("z", cache=False, models=("m-daily", "m-ok"))
+            report("Breaker: open model is skipped without sending",
+                   error is not None and fallback == "ok" and len(server.requests) == sent + 1,
+                   f"{server.requests[sent:]}")
+
+            started = time.monotonic()
+            try:
+                gemini_client.call_gemini("x", cache=False, models=("m-rate",))
+                error = None
+            except QuotaError as e:
+                error = e
+            elapsed = time.monotonic() - started
+            report("Breaker: sustained 429 trips before the retries run out",
+                   isinstance(error, CircuitOpenError) and elapsed < 1.0
+                   and gemini_client.quota_blocked("no-such-tag") is False, f"{elapsed:.2f}s {error!r}")
+
+            healthy["m-rate"] = True
+            time.sleep(0.25)
+            recovered = gemini_client.call_gemini("x", cache=False, models=("m-rate",))
+            stats = dict(gemini_client.get_quota_breaker().stats)
+            report("Breaker: probe after cooldown closes the breaker",
+                   recovered == "ok" and not gemini_client.get_quota_breaker().is_open("m-rate")
+                   and stats["recovered"] == 1 and stats["tripped"] == 2, f"{stats}")
+
+            breaker = gemini_client.get_quota_breaker()
+            breaker.failure("m-503")
+            breaker.failure("m-503")
+            time.sleep(0.25)
+            try:
+                gemini_client.call_gemini("x", cache=False, models=("m-503",))
+                status = None
+            except requests.HTTPError as e:
+                status = e.response.status_code
+            report("Breaker: 5xx on the probe keeps the breaker open",
+                   status == 503 and breaker.is_open("m-503"), f"{status}")
+
+            gemini_client._key_pool = KeyPool(["k1", "k2"], rpm=10 ** 4, tpm=10 ** 7)
+            breaker.failure("m-probe")
+            breaker.failure("m-probe")
+            time.sleep(0.25)
+            try:
+                probed = gemini_client.call_gemini("x", cache=False, models=("m-probe",))
+            except QuotaError as e:
+                probed = e
+            report("Breaker: probe retries on another key after a 429",
+                   probed == "ok" and not breaker.is_open("m-probe"), f"{probed!r}")
+        finally:
+            config.GEMINI_ENDPOINT, gemini_client._key_pool, gemini_client._quota_breaker = original
+
+    saved = (
+        db.defer_gemini_work, db.get_deferred_work, db.delete_deferred_work,
+        gemini_client._quota_breaker, dict(deferred_queue._HANDLERS),
+    )
+    deferred, deleted, drained = [], [], []
+    db.defer_gemini_work = lambda kind, ids, user_id=None, reason="": deferred.append((kind, ids))
+    db.get_deferred_work = lambda kind, limit=500: [
+        {"key": f"{kind}:o1", "opportunity_id": "o1", "user_id": None},
+    ]
+    db.delete_deferred_work = lambda keys, before: deleted.append(keys)
+    deferred_queue._HANDLERS[deferred_queue.CLASSIFY] = drained.append
+    gemini_client._quota_breaker = QuotaBreaker()
+    try:
+        for model in gemini_client.route("classify"):
+            gemini_client.get_quota_breaker().failure(model, daily=True)
+        mapping = industry_classifier.classify_batch([
+            {"id": "o1", "title": "庁舎清掃", "summary": "", "category": "役務"},
+            {"id": "o2", "title": "道路補修", "summary": "", "category": "工事"},
+        ])
+        report("Deferred: classification blocked by quota is queued",
+               mapping == {} and deferred == [("classify", ["o1", "o2"])], f"{deferred}")
+
+        skipped = deferred_queue.drain((deferred_queue.CLASSIFY,))
+        gemini_client._quota_breaker = QuotaBreaker()
+        done = deferred_queue.drain((deferred_queue.CLASSIFY,))
+        report("Deferred: drain waits for quota, then runs and clears the queue",
+               skipped == {} and done == {"classify": 1} and len(drained) == 1
+               and deleted == [["classify:o1"]], f"{skipped} {done} {deleted}")
+    finally:
+        (db.defer_gemini_work, db.get_deferred_work, db.delete_deferred_work,
+         gemini_client._quota_breaker, handlers) = saved
+        deferred_queue._HANDLERS.update(handlers)
+
+
+def test_json_repair():
+    """途切れた JSON の修復テスト（1パス修復・要素の救出）"""
+    print("\n=== JSON Repair ===\n")
+
+    from gemini_client import parse_json_response
+
+    cases = [
+        ("unterminated string closed", '[{"id": "a", "note": "途中', [{"id": "a", "note": "途中"}]),
+        ("trailing comma removed", '{"a": [1, 2, ], "b": 3,}', {"a": [1, 2], "b": 3}),
+        ("brackets closed in stack order", '{"a": [{"b": 1', {"a": [{"b": 1}]}),
+        ("brackets inside strings ignored", '{"a": "x]}{", "b": [1', {"a": "x]}{", "b": [1]}),
+        ("dangling key dropped", '{"a": 1, "b":', {"a": 1}),
+        ("truncated element salvaged", '[{"id": "a"}, {"id": "b", "ok": tr', [{"id": "a"}]),
+        ("surrounding prose ignored", '結果: {"a": [1, {"b": 2}]} 以上', {"a": [1, {"b": 2}]}),
+    ]
+    for name, text, expected in cases:
+        try:
+            parsed = parse_json_response(text)
+        except ValueError as e:
+            parsed = e
+        report(f"Repair: {name}", parsed == expected, f"{parsed!r}")
+
+    try:
+        parse_json_response("JSON ではない応答")
+        raised = False
+    except ValueError:
+        raised = True
+    report("Repair: non-JSON still raises", raised)
+
+
 def test_gemini():
     """Gemini Client モジュールのテスト"""
     print("\n=== Gemini Client ===\n")
@@ -209,6 +1557,33 @@ def test_gov_scraper_extraction():
         report("GovScraper: scrape_source", False, str(e)[:200])
 
 
+def test_source_breaker():
+    """ソースのサーキットブレーカー判定テスト（ネットワーク不要）"""
+    print("\n=== Source Circuit Breaker ===\n")
+
+    from datetime import datetime, timedelta, timezone
+    from gov_scraper import is_circuit_open, next_probe_at
+
+    now = datetime.now(timezone.utc)
+    threshold = config.SOURCE_BREAKER_THRESHOLD
+
+    healthy = {"id": "ok", "consecutive_failures": 0, "last_checked_at": now.isoformat()}
+    report("Breaker: healthy source runs", next_probe_at(healthy) is None)
+
+    tripped = {"id": "dead", "consecutive_failures": threshold,
+               "last_checked_at": now.isoformat()}
+    report("Breaker: tripped source skipped",
+           is_circuit_open(tripped) and next_probe_at(tripped) is not None)
+
+    old = {"id": "dead", "consecutive_failures": threshold,
+           "last_checked_at": (now - timedelta(days=3)).isoformat()}
+    report("Breaker: re-probe after backoff", next_probe_at(old) is None)
+
+    worse = {**tripped, "consecutive_failures": threshold + 2}
+    report("Breaker: backoff grows with failures",
+           next_probe_at(worse) > next_probe_at(tripped))
+
+
 def test_matcher():
     """Matcher モジュールのテスト（ダミーデータ使用）"""
     print("\n=== Matcher ===\n")
@@ -307,9 +1682,33 @@ def main():
 
     test_config()
     test_scraper()
+    test_http_cache()
+    test_url_prober()
+    test_negative_cache()
+    test_detail_rules()
+    test_detail_packing()
+    test_section_ranker()
+    test_pipeline()
+    test_checkpoint()
+    test_rate_limiter()
+    test_key_pool()
+    test_response_cache()
+    test_gemini_batch()
+    test_json_stream()
+    test_response_schema()
+    test_json_repair()
+    test_gemini_async()
+    test_usage()
+    test_context_cache()
+    test_model_routing()
+    test_mock_gemini()
+    test_single_flight()
+    test_hedging()
+    test_quota_breaker()
     test_gemini()
     test_db()
     test_gov_scraper_extraction()
+    test_source_breaker()
     test_matcher()
     test_notifier()
 
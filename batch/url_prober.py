@@ -0,0 +1,118 @@
+"""公募ナビAI - 詳細URLの死活チェック
+
+本取得（GET + テキスト抽出 + Gemini）の前に、HEAD（不可なら先頭1KBの
+Range GET）を高並列で投げて URL を分類する。
+
+- alive:      取得を続ける価値がある（2xx、別の個別ページへのリダイレクト、一時エラー等）
+- dead:       404 / 410 でページが消えている
+- redirected: サイトトップ等の汎用ページへ飛ばされる（実質的に削除済み）
+- error:      タイムアウト・接続失敗（一時的な可能性があるので判定保留）
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+
+logger = logging.getLogger(__name__)
+
+ALIVE = "alive"
+DEAD = "dead"
+REDIRECTED = "redirected"
+ERROR = "error"
+
+# HEAD を受け付けないサーバーが返すステータス（Range GET で再確認する）
+_HEAD_UNSUPPORTED = (400, 403, 405, 501)
+_GONE_STATUSES = (404, 410)
+# リダイレクト先がこれらのパスなら「トップへ飛ばされた」とみなす
+_LANDING_PATHS = ("", "/", "/index.html", "/index.htm", "/index.php", "/top.html")
+
+
+@dataclass
+class ProbeResult:
+    url: str
+    status: str
+    http_status: int | None = None
+    final_url: str | None = None
+
+
+def probe_urls(
+    urls: list[str],
+    concurrency: int = 100,
+    timeout: float = 10,
+) -> dict[str, ProbeResult]:
+    """URL リストを並列で死活チェックする。
+
+    Returns:
+        {url: ProbeResult}
+    """
+    unique = list(dict.fromkeys(u for u in urls if u))
+    if not unique:
+        return {}
+    return asyncio.run(_probe_all(unique, concurrency, timeout))
+
+
+async def _probe_all(urls: list[str], concurrency: int, timeout: float) -> dict[str, ProbeResult]:
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(concurrency)
+
+    session = requests.Session()
+    session.headers["User-Agent"] = config.USER_AGENT
+    adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    async def run(executor, url: str) -> ProbeResult:
+        async with sem:
+            return await loop.run_in_executor(executor, _probe_one, session, url, timeout)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = await asyncio.gather(*(run(executor, u) for u in urls))
+    finally:
+        session.close()
+    return {r.url: r for r in results}
+
+
+def _probe_one(session: requests.Session, url: str, timeout: float) -> ProbeResult:
+    """1件の URL を HEAD → 必要なら Range GET で確認する。"""
+    try:
+        resp = session.head(url, timeout=timeout, allow_redirects=True)
+        if resp.status_code in _HEAD_UNSUPPORTED:
+            resp = session.get(
+                url,
+                headers={"Range": "bytes=0-1023"},
+                timeout=timeout,
+                allow_redirects=True,
+                stream=True,
+            )
+            resp.close()
+    except requests.RequestException as exc:
+        logger.debug("死活チェック失敗 %s: %s", url, exc)
+        return ProbeResult(url, ERROR)
+
+    return ProbeResult(url, _classify(url, resp), resp.status_code, resp.url)
+
+
+def _classify(url: str, resp: requests.Response) -> str:
+    if resp.status_code in _GONE_STATUSES:
+        return DEAD
+    if resp.history and _is_landing_page(resp.url):
+        return REDIRECTED
+    return ALIVE
+
+
+def _is_landing_page(final: str) -> bool:
+    """リダイレクト先がサイトトップ等の汎用ページか判定する。
+
+    ドメインが変わっても判定は同じ（移転先の /notice123.html や ?id= のページは
+    案件ページの可能性があるので、トップ・index 以外は汎用ページとみなさない）。
+    """
+    dst = urlparse(final)
+    return dst.path.lower() in _LANDING_PATHS and not dst.query
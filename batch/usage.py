@@ -0,0 +1,220 @@
+"""公募ナビAI - Gemini 呼び出しのトークン・コスト・レイテンシ集計
+
+call_gemini / stream_gemini / Batch API の各応答から usageMetadata
+（入力・出力・思考・キャッシュ済みトークン）、レイテンシ、429 リトライ回数、
+finishReason を呼び出し箇所のタグ（detail_pack, matcher など）ごとに積算する。
+タグの中はさらにモデル別に分け、経路（config.GEMINI_ROUTES）の各モデルの
+失敗・スキーマ不一致・切り替え回数とレイテンシを見られるようにする。
+
+コストは config.GEMINI_PRICING のモデル別単価で見積もる（Batch API は割引後）。
+実行の最後に summary() を batch_logs.gemini_usage に書き込み、
+どの処理が費用を使っているか・プロンプト変更でトークンが増えていないかを追う。
+"""
+
+import logging
+import threading
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_cost(
+    model: str,
+    prompt_tokens: int,
+    output_tokens: int,
+    cached_tokens: int = 0,
+    batch: bool = False,
+) -> float:
+    """USD の概算。output_tokens は思考トークンを含める（出力と同じ単価）。"""
+    price = config.GEMINI_PRICING.get(model)
+    if price is None:
+        return 0.0
+    input_price, output_price, cached_price = price
+    cost = (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + output_tokens * output_price
+    ) / 1_000_000
+    return cost * config.GEMINI_BATCH_DISCOUNT if batch else cost
+
+
+def _empty() -> dict:
+    return {
+        "calls": 0,
+        "cache_hits": 0,
+        "errors": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "output_tokens": 0,
+        "thought_tokens": 0,
+        "cached_tokens": 0,
+        "latency_total": 0.0,
+        "latency_max": 0.0,
+        "finish_reasons": {},
+        "cost_usd": 0.0,
+        "invalid": 0,
+        "fallbacks": 0,
+        "models": {},
+    }
+
+
+def _empty_model() -> dict:
+    return {
+        "calls": 0,
+        "cache_hits": 0,
+        "errors": 0,
+        "invalid": 0,
+        "fallbacks": 0,
+        "latency_total": 0.0,
+        "cost_usd": 0.0,
+    }
+
+
+class UsageTracker:
+    """呼び出し箇所ごとの使用量の積算（スレッドセーフ）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tags: dict[str, dict] = {}
+
+    def record(
+        self,
+        tag: str,
+        model: str,
+        usage: dict | None = None,
+        latency: float = 0.0,
+        retries: int = 0,
+        finish_reason: str | None = None,
+        batch: bool = False,
+        cache_hit: bool = False,
+        error: bool = False,
+    ):
+        """1呼び出し分を記録する（usage は応答の usageMetadata そのまま）。"""
+        usage = usage or {}
+        prompt = usage.get("promptTokenCount", 0)
+        output = usage.get("candidatesTokenCount", 0)
+        thoughts = usage.get("thoughtsTokenCount", 0)
+        cached = usage.get("cachedContentTokenCount", 0)
+        cost = estimate_cost(model, prompt, output + thoughts, cached, batch)
+
+        with self._lock:
+            entry = self._tags.setdefault(tag, _empty())
+            entry["calls"] += 1
+            entry["cache_hits"] += int(cache_hit)
+            entry["errors"] += int(error)
+            entry["retries"] += retries
+            entry["prompt_tokens"] += prompt
+            entry["output_tokens"] += output
+            entry["thought_tokens"] += thoughts
+            entry["cached_tokens"] += cached
+            entry["latency_total"] += latency
+            entry["latency_max"] = max(entry["latency_max"], latency)
+            if finish_reason:
+                reasons = entry["finish_reasons"]
+                reasons[finish_reason] = reasons.get(finish_reason, 0) + 1
+            entry["cost_usd"] += cost
+            stats = entry["models"].setdefault(model, _empty_model())
+            stats["calls"] += 1
+            stats["cache_hits"] += int(cache_hit)
+            stats["errors"] += int(error)
+            stats["latency_total"] += latency
+            stats["cost_usd"] += cost
+
+    def record_invalid(self, tag: str, model: str):
+        """model の応答がスキーマ不一致だった（呼び出し自体は record 済み）。"""
+        self._count(tag, model, "invalid")
+
+    def record_fallback(self, tag: str, model: str):
+        """model を諦めて経路の次のモデルへ切り替えた。"""
+        self._count(tag, model, "fallbacks")
+
+    def _count(self, tag: str, model: str, key: str):
+        with self._lock:
+            entry = self._tags.setdefault(tag, _empty())
+            entry[key] += 1
+            entry["models"].setdefault(model, _empty_model())[key] += 1
+
+    def summary(self) -> dict:
+        """{タグ: 集計} と全体の "total"（JSON にそのまま書ける形）。"""
+        with self._lock:
+            tags = {
+                tag: dict(
+                    entry,
+                    finish_reasons=dict(entry["finish_reasons"]),
+                    models={model: dict(stats) for model, stats in entry["models"].items()},
+                )
+                for tag, entry in self._tags.items()
+            }
+
+        total = _empty()
+        for entry in tags.values():
+            for key, value in entry.items():
+                if key == "finish_reasons":
+                    for reason, count in value.items():
+                        total[key][reason] = total[key].get(reason, 0) + count
+                elif key == "models":
+                    for model, stats in value.items():
+                        merged = total[key].setdefault(model, _empty_model())
+                        for name, count in stats.items():
+                            merged[name] += count
+                elif key == "latency_max":
+                    total[key] = max(total[key], value)
+                else:
+                    total[key] += value
+
+        result = {}
+        for tag, entry in [*sorted(tags.items()), ("total", total)]:
+            sent = entry["calls"] - entry["cache_hits"]
+            entry["latency_avg_ms"] = round(entry.pop("latency_total") / sent * 1000) if sent else 0
+            entry["latency_max_ms"] = round(entry.pop("latency_max") * 1000)
+            entry["cost_usd"] = round(entry["cost_usd"], 4)
+            for stats in entry["models"].values():
+                sent = stats["calls"] - stats["cache_hits"]
+                latency = stats.pop("latency_total")
+                stats["latency_avg_ms"] = round(latency / sent * 1000) if sent else 0
+                stats["cost_usd"] = round(stats["cost_usd"], 4)
+            result[tag] = entry
+        return result
+
+    def total_cost(self) -> float:
+        with self._lock:
+            return sum(entry["cost_usd"] for entry in self._tags.values())
+
+    def rollup(self) -> dict:
+        """batch_logs に書く列（db.update_batch_log(log_id, **rollup())）。"""
+        return {"gemini_usage": self.summary(), "gemini_cost_usd": round(self.total_cost(), 4)}
+
+    def log_summary(self):
+        for tag, entry in self.summary().items():
+            if not entry["calls"]:
+                continue
+            logger.info(
+                "  Gemini 使用量 [%s]: 呼び出し=%d (キャッシュ=%d, 失敗=%d, 429再試行=%d), "
+                "入力=%d (キャッシュ済み=%d), 出力=%d (思考=%d), 平均%dms/最大%dms, $%.4f %s",
+                tag, entry["calls"], entry["cache_hits"], entry["errors"], entry["retries"],
+                entry["prompt_tokens"], entry["cached_tokens"],
+                entry["output_tokens"], entry["thought_tokens"],
+                entry["latency_avg_ms"], entry["latency_max_ms"], entry["cost_usd"],
+                entry["finish_reasons"] or "",
+            )
+            if tag == "total":
+                continue
+            for model, stats in entry["models"].items():
+                logger.info(
+                    "    %s: 呼び出し=%d, 失敗=%d, スキーマ不一致=%d, 切り替え=%d, 平均%dms, $%.4f",
+                    model, stats["calls"], stats["errors"], stats["invalid"],
+                    stats["fallbacks"], stats["latency_avg_ms"], stats["cost_usd"],
+                )
+
+    def reset(self):
+        with self._lock:
+            self._tags.clear()
+
+
+_tracker = UsageTracker()
+
+
+def get_tracker() -> UsageTracker:
+    """プロセス共通の集計。"""
+    return _tracker
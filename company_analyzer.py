@@ -6,6 +6,27 @@ from scraper import extract_text, fetch_page
 
 logger = logging.getLogger(__name__)
 
+_STRING_LIST = {"type": "ARRAY", "items": {"type": "STRING"}}
+
+# 会社プロフィールの応答スキーマ（Gemini の responseSchema）
+COMPANY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "company_name": {"type": "STRING"},
+        "location": {"type": "STRING", "nullable": True},
+        "business_areas": _STRING_LIST,
+        "services": _STRING_LIST,
+        "strengths": _STRING_LIST,
+        "target_industries": _STRING_LIST,
+        "qualifications": _STRING_LIST,
+        "matching_keywords": _STRING_LIST,
+    },
+    "required": [
+        "company_name", "location", "business_areas", "services",
+        "strengths", "target_industries", "qualifications", "matching_keywords",
+    ],
+}
+
 
 def analyze_company(url: str) -> dict:
     """会社のウェブサイトを取得し、Gemini で事業内容を分析する。
@@ -47,5 +68,5 @@ matching_keywordsには、この会社が受注できそうな行政案件を見
 {text}"""
 
     logger.info("Gemini APIで会社情報を分析中...")
-    response = call_gemini(prompt)
+    response = call_gemini(prompt, response_schema=COMPANY_SCHEMA)
     return parse_json_response(response)
@@ -9,13 +9,19 @@ import config
 logger = logging.getLogger(__name__)
 
 
-def call_gemini(prompt: str, json_mode: bool = True, max_tokens: int = 8192) -> str:
+def call_gemini(
+    prompt: str,
+    json_mode: bool = True,
+    max_tokens: int = 8192,
+    response_schema: dict | None = None,
+) -> str:
     """Gemini API を呼び出してテキスト応答を返す。
 
     Args:
         prompt: 送信するプロンプト文字列。
         json_mode: True の場合、JSON 形式での応答を強制する。
         max_tokens: 最大出力トークン数。
+        response_schema: 応答の JSON スキーマ（responseSchema）。指定時は JSON モードになる。
 
     Returns:
         Gemini からの応答テキスト。
@@ -29,8 +35,10 @@ def call_gemini(prompt: str, json_mode: bool = True, max_tokens: int = 8192) ->
         "temperature": 0.2,
         "maxOutputTokens": max_tokens,
     }
-    if json_mode:
+    if json_mode or response_schema is not None:
         gen_config["responseMimeType"] = "application/json"
+    if response_schema is not None:
+        gen_config["responseSchema"] = response_schema
 
     payload = {
         "contents": [{"parts": [{"text": prompt}]}],
@@ -0,0 +1,11 @@
+-- 005: 詳細URLの死活状態
+-- backfill の事前死活チェックで消えていたURLを記録し、以降の詳細取得対象から外す
+
+-- dead = 404/410、redirected = サイトトップ等へ転送（NULL = 未判定 or 生存）
+ALTER TABLE opportunities ADD COLUMN IF NOT EXISTS detail_status TEXT;
+ALTER TABLE opportunities ADD COLUMN IF NOT EXISTS detail_checked_at TIMESTAMPTZ;
+
+-- 詳細未取得インデックスを死活判定済み(dead/redirected)を除く形に作り直す
+DROP INDEX IF EXISTS idx_opp_detail_fetched;
+CREATE INDEX IF NOT EXISTS idx_opp_detail_fetched ON opportunities (detail_fetched_at NULLS FIRST)
+  WHERE detail_url IS NOT NULL AND detail_status IS NULL;
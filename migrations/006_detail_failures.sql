@@ -0,0 +1,6 @@
+-- 006: 詳細取得失敗の記録（ネガティブキャッシュ）
+-- 失敗理由ごとの再試行時刻まで get_unenriched_opportunities の対象から外す
+
+-- not_found / http_error / timeout / too_short / extract_failed
+ALTER TABLE opportunities ADD COLUMN IF NOT EXISTS detail_fail_reason TEXT;
+ALTER TABLE opportunities ADD COLUMN IF NOT EXISTS detail_retry_after TIMESTAMPTZ;
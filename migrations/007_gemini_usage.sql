@@ -0,0 +1,11 @@
+-- 007: Gemini 使用量の実行単位の集計
+-- daily_check / backfill_details / industry_classifier の各実行で
+-- 呼び出し箇所（タグ）ごとのトークン数・レイテンシ・リトライ・finishReason・推定コストを残す
+
+-- daily_check / backfill / industry_classifier（NULL = 007 以前の daily_check）
+ALTER TABLE batch_logs ADD COLUMN IF NOT EXISTS job TEXT;
+-- {タグ: {calls, prompt_tokens, output_tokens, cached_tokens, cost_usd, ...}, "total": {...}}
+ALTER TABLE batch_logs ADD COLUMN IF NOT EXISTS gemini_usage JSONB;
+ALTER TABLE batch_logs ADD COLUMN IF NOT EXISTS gemini_cost_usd NUMERIC(10, 4);
+
+CREATE INDEX IF NOT EXISTS idx_batch_logs_job_started ON batch_logs (job, started_at DESC);
@@ -0,0 +1,18 @@
+-- 008: Gemini の quota 切れで後回しにした処理のキュー
+-- quota ブレーカーが開いて実行できなかった処理を積み、次回の実行の最初に流す（batch/deferred_queue.py）
+
+CREATE TABLE IF NOT EXISTS gemini_deferred (
+  -- 種類:案件ID[:ユーザーID]（同じ処理は1行にまとめる）
+  key TEXT PRIMARY KEY,
+  -- detail（詳細抽出） / classify（業種分類） / analysis（通知の AI 詳細分析）
+  kind TEXT NOT NULL CHECK (kind IN ('detail', 'classify', 'analysis')),
+  opportunity_id UUID NOT NULL REFERENCES opportunities(id) ON DELETE CASCADE,
+  user_id UUID REFERENCES koubo_users(id) ON DELETE CASCADE,  -- analysis のみ
+  reason TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- gemini_deferred は RLS なし（Service Key でのみアクセス）
+
+CREATE INDEX IF NOT EXISTS idx_gemini_deferred_kind_created ON gemini_deferred (kind, created_at);
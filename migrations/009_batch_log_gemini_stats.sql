@@ -0,0 +1,7 @@
+-- 009: daily_check の実行時の Gemini 統計
+-- 応答キャッシュ・コンテキストキャッシュ・同時リクエストの共有・ヘッジ・quota ブレーカー・
+-- quota 切れで後回しにした処理（積んだ件数 / 前回分を流した件数）を残す
+
+-- {cache: {...}, context_cache: {...}, single_flight: {...}, hedge: {...}, breaker: {...},
+--  deferred: {種類: 件数}, deferred_drained: {種類: 件数}}
+ALTER TABLE batch_logs ADD COLUMN IF NOT EXISTS gemini_stats JSONB;